@@ -1,43 +1,59 @@
-from fastapi import APIRouter, HTTPException, status
-import jwt
-
-from app.application.auth import create_access_token, create_refresh_token, verify_password, get_password_hash
-from app.schemas.auth import Token, TokenData, LoginRequest
+import math
 from datetime import timedelta
+
+import jwt
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+
+from app.api.rate_limit import client_ip
+from app.application.auth import (
+    create_access_token,
+    create_refresh_token,
+    create_user,
+    get_user_by_email,
+    get_user_by_username,
+    hash_password_in_pool,
+    password_needs_rehash,
+    update_password,
+    verify_password_in_pool,
+)
 from app.config import settings
-from app.domain.auth import DatabaseService
-from app.schemas.auth import TokenRefreshRequest
+from app.domain.db import get_db, run_in_session
+from app.domain.rate_limit import login_username_rule, rate_limiter
+from app.metrics import rate_limit_rejections
+from app.schemas.auth import LoginRequest, Token, TokenData, TokenRefreshRequest
 from app.schemas.user import UserCreate
 
 router = APIRouter(prefix="/api/v1")
 
 # Register a new user
 @router.post("/signup", response_model=Token)
-async def register(user_data: UserCreate):
-    if DatabaseService().get_user_by_username(user_data.username) is not None:
+async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+    if await run_in_session(db, get_user_by_username, user_data.username) is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered",
         )
-    if DatabaseService().get_user_by_email(user_data.email) is not None:
+    if await run_in_session(db, get_user_by_email, user_data.email) is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
 
-    hashed_password = get_password_hash(user_data.password)
-    DatabaseService().create_user(user_data.username, user_data.email, hashed_password)
+    hashed_password = await hash_password_in_pool(user_data.password)
+    user = await run_in_session(db, create_user, user_data.username, user_data.email,
+                                hashed_password)
 
     # Generate both access and refresh tokens
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user_data.username, "email": user_data.email},
+        data={"sub": user.username, "email": user.email, "uid": user.id},
         expires_delta=access_token_expires
     )
 
     refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     refresh_token = create_refresh_token(
-        data={"sub": user_data.username, "email": user_data.email},
+        data={"sub": user.username, "email": user.email, "uid": user.id},
         expires_delta=refresh_token_expires
     )
 
@@ -45,26 +61,47 @@ async def register(user_data: UserCreate):
 
 # Login a user and generate both access and refresh tokens
 @router.post("/login", response_model=Token)
-async def login(login_request: LoginRequest):
-    user = DatabaseService().get_user_by_username(login_request.username)
-
-    if user is None or not verify_password(login_request.password, user.hashed_password):
+async def login(login_request: LoginRequest, request: Request,
+                db: Session = Depends(get_db)):
+    # Per-account budget for this client, checked before the user lookup and bcrypt (the
+    # per-IP one ran in middleware)
+    if login_username_rule is not None:
+        client_key = f"{login_request.username}|ip:{client_ip(request.scope)}"
+        retry_after = await rate_limiter.hit(login_username_rule, client_key)
+        if retry_after > 0:
+            rate_limit_rejections.labels(login_username_rule.name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    user = await run_in_session(db, get_user_by_username, login_request.username)
+
+    if user is None or not await verify_password_in_pool(login_request.password,
+                                                         user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Opt-in upgrade of hashes made with an outdated scheme or cost, while the
+    # password is known
+    if password_needs_rehash(user.hashed_password):
+        new_hashed_password = await hash_password_in_pool(login_request.password)
+        await run_in_session(db, update_password, user.username, new_hashed_password)
+
     # Generate both access and refresh tokens
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username, "email": user.email},
+        data={"sub": user.username, "email": user.email, "uid": user.id},
         expires_delta=access_token_expires
     )
 
     refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     refresh_token = create_refresh_token(
-        data={"sub": user.username, "email": user.email},
+        data={"sub": user.username, "email": user.email, "uid": user.id},
         expires_delta=refresh_token_expires
     )
 
@@ -73,7 +110,7 @@ async def login(login_request: LoginRequest):
 
 # Update the refresh token route
 @router.post("/refresh-token", response_model=Token)
-async def refresh_token(request: TokenRefreshRequest):
+async def refresh_token(request: TokenRefreshRequest, db: Session = Depends(get_db)):
     refresh_token = request.refresh_token
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,14 +128,15 @@ async def refresh_token(request: TokenRefreshRequest):
     except jwt.PyJWTError:
         raise credentials_exception
 
-    user = DatabaseService().get_user_by_username(token_data.username)
+    user = await run_in_session(db, get_user_by_username, token_data.username,
+                                payload.get("uid"))
     if user is None or user.email != token_data.email:
         raise credentials_exception
 
     # Generate a new access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username, "email": user.email},
+        data={"sub": user.username, "email": user.email, "uid": user.id},
         expires_delta=access_token_expires
     )
 
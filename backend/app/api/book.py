@@ -1,26 +1,219 @@
+from typing import Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.api.caching import (
+    book_etag,
+    make_etag,
+    match,
+    none_match,
+    not_modified,
+    set_cache_headers,
+)
+from app.api.serialization import book_dicts
 from app.application.auth import get_current_user
-from app.application.book import add_book, get_books, get_book_by_id, search_books, get_library_summary, \
-    update_book_by_id, delete_book_by_id
-from app.schemas.book import BookResponse, BookCreate, BookUpdate, LibrarySummary, PaginatedBooksResponse
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from typing import List
+from app.application.book import (
+    add_book,
+    delete_book_by_id,
+    delete_books_by_ids,
+    export_books,
+    find_duplicate_books,
+    get_book_by_id,
+    get_books,
+    get_books_by_ids,
+    get_library_summary,
+    get_library_version,
+    import_books,
+    new_import_report,
+    restore_book_by_id,
+    search_books,
+    update_book_by_id,
+    update_books_by_ids,
+)
+from app.application.bulk import RecordTooLarge
+from app.application.jobs import notify_job_workers
+from app.application.maintenance import tombstone_cutoff
+from app.domain.book import decode_cursor, decode_search_cursor
+from app.domain.db import get_db, run_in_session, use_replica
+from app.schemas.book import (
+    BatchGetResponse,
+    BatchIds,
+    BatchResponse,
+    BatchUpdate,
+    BookCreate,
+    BookResponse,
+    BookUpdate,
+    BulkImportReport,
+    DuplicatesResponse,
+    LibrarySummary,
+    PaginatedBooksResponse,
+    SearchBooksResponse,
+)
+
 router = APIRouter(prefix="/api/v1")
 
+# Ids listed in X-Possible-Duplicates (DUPLICATE_WARN_ON_INSERT) at most
+POSSIBLE_DUPLICATES_HEADER_MAX = 20
+
 @router.post("/books", response_model=BookResponse)
-async def create_book(book: BookCreate, user_id: int = Depends(get_current_user)):
-    result = add_book(user_id, **book.dict())
+async def create_book(book: BookCreate, user_id: int = Depends(get_current_user),
+                      response: Response = None,
+                      db: Session = Depends(get_db)):
+    result = await run_in_session(db, add_book, user_id, **book.dict())
     if not result["success"]:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result["message"])
+    if result["data"].cover_id:
+        notify_job_workers()
+    if result["possible_duplicates"]:
+        response.headers["X-Possible-Duplicates"] = ", ".join(
+            result["possible_duplicates"][:POSSIBLE_DUPLICATES_HEADER_MAX])
     return result["data"]
 
 
+# A bulk import that stopped early keeps the chunks committed before the error; the
+# error response carries their report next to the detail, so the client can resume
+# from the row in its last entry instead of importing everything again
+def _import_stopped(report: dict, status_code: int, detail: str):
+    notify_job_workers()
+    return ORJSONResponse({"detail": detail, **report}, status_code=status_code)
+
+
+# Streamed CSV (with a header row) or NDJSON body; rows are validated and
+# inserted in chunks
+@router.post("/books/bulk", response_model=BulkImportReport)
+async def bulk_import_books(request: Request, user_id: int = Depends(get_current_user),
+                            format: Optional[str] = Query(None,
+                                                          pattern="^(csv|ndjson)$")):
+    file_format = format
+    if file_format is None:
+        content_type = request.headers.get("content-type", "")
+        file_format = "csv" if "csv" in content_type else "ndjson"
+
+    report = new_import_report()
+    try:
+        await import_books(user_id, request.stream(), file_format, report)
+        # Imported rows with inline covers queued thumbnail jobs
+        notify_job_workers()
+        return report
+    except UnicodeDecodeError:
+        return _import_stopped(report, status.HTTP_400_BAD_REQUEST,
+                               "Request body must be UTF-8")
+    except RecordTooLarge as e:
+        return _import_stopped(report, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, str(e))
+    except Exception:
+        return _import_stopped(report, status.HTTP_500_INTERNAL_SERVER_ERROR,
+                               "Server error")
+
+
+# Batch endpoints: one set-based statement per request, with a result for
+# every requested id
+@router.post("/books/batch-get", response_model=BatchGetResponse)
+async def batch_get_books(batch: BatchIds, user_id: int = Depends(get_current_user),
+                          db: Session = Depends(get_db)):
+    try:
+        result = await run_in_session(db, get_books_by_ids, user_id, batch.ids)
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=result["message"])
+        return ORJSONResponse({"books": book_dicts(result["data"]),
+                               "not_found": result["not_found"]})
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+@router.patch("/books/batch", response_model=BatchResponse)
+async def batch_update_books(batch: BatchUpdate,
+                             user_id: int = Depends(get_current_user),
+                             db: Session = Depends(get_db)):
+    try:
+        result = await run_in_session(db, update_books_by_ids, user_id, batch.ids,
+                                      **batch.changes.dict(exclude_unset=True))
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=result["message"])
+        if batch.changes.cover_image:
+            notify_job_workers()
+        return {"results": result["results"]}
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+@router.post("/books/batch-delete", response_model=BatchResponse)
+async def batch_delete_books(batch: BatchIds, user_id: int = Depends(get_current_user),
+                             db: Session = Depends(get_db)):
+    try:
+        result = await run_in_session(db, delete_books_by_ids, user_id, batch.ids)
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=result["message"])
+        return {"results": result["results"]}
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+# ETag for a per-user library view, or None when the version is unavailable
+# (served uncached)
+async def _library_etag(db: Session, user_id: int, *view):
+    version = await run_in_session(db, get_library_version, user_id)
+    if not version["success"]:
+        return None
+    return make_etag(user_id, version["data"], *view)
+
+
 @router.get("/books", response_model=PaginatedBooksResponse)
 async def list_books(user_id: int = Depends(get_current_user),
                      page: int = Query(1, ge=1),
-                     limit: int = Query(10, le=100)):
+                     limit: int = Query(10, ge=1, le=100),
+                     cursor: Optional[str] = Query(None),
+                     include_total: Optional[bool] = Query(None),
+                     if_none_match: Optional[str] = Header(None),
+                     db: Session = Depends(get_db)):
+    # A cursor (next_cursor from a previous page) switches to keyset pagination, which
+    # skips the exact count unless it is explicitly requested
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if include_total is None:
+        include_total = after is None
+
     try:
+        # Read from a replica when there is one: the version and the page come
+        # from the same one
+        use_replica(db, user_id)
+        # The ETag covers the user's library version and the page requested. The version
+        # is read first, so a write racing with this request can only make the ETag
+        # older, never newer.
+        etag = await _library_etag(db, user_id, "books", page, limit, cursor,
+                                   include_total)
+        if etag and none_match(if_none_match, etag):
+            return not_modified(etag)
+
         # Fetch paginated books using the book service
-        result = get_books(user_id, page, limit)
+        result = await run_in_session(db, get_books, user_id, page, limit, after,
+                                      include_total)
 
         if not result["success"]:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["message"])
@@ -29,61 +222,213 @@ async def list_books(user_id: int = Depends(get_current_user),
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No books found")
 
         # Optionally include pagination information in the response
-        return {
-            "books": result["data"],
+        response = ORJSONResponse({
+            "books": book_dicts(result["data"]),
             "pagination": result.get("pagination", {})
-        }
+        })
+        if etag:
+            set_cache_headers(response, etag)
+        return response
 
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server error")
 
 
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+# Registered before /books/{book_id} so that "export" is not captured as a book id
+@router.get("/books/export")
+async def export_library(user_id: int = Depends(get_current_user),
+                         format: str = Query("ndjson", pattern="^(csv|ndjson)$")):
+    return StreamingResponse(
+        export_books(user_id, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="books.{format}"'},
+    )
+
+
+# Registered before /books/{book_id} so that "duplicates" is not captured as a
+# book id. Groups of books that look like the same book (see
+# app/domain/duplicates.py), largest first.
+@router.get("/books/duplicates", response_model=DuplicatesResponse)
+async def list_duplicates(user_id: int = Depends(get_current_user),
+                          limit: int = Query(50, ge=1, le=500),
+                          if_none_match: Optional[str] = Header(None),
+                          db: Session = Depends(get_db)):
+    try:
+        use_replica(db, user_id)
+        etag = await _library_etag(db, user_id, "duplicates", limit)
+        if etag and none_match(if_none_match, etag):
+            return not_modified(etag)
+
+        result = await run_in_session(db, find_duplicate_books, user_id, limit)
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=result["message"])
+        response = ORJSONResponse({
+            "groups": [{"similarity": group["similarity"],
+                        "books": book_dicts(group["books"])}
+                       for group in result["data"]],
+            "total_groups": result["total_groups"]
+        })
+        if etag:
+            set_cache_headers(response, etag)
+        return response
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+# Registered before /books/{book_id} so that "search" is not captured as a book id
+@router.get("/books/search", response_model=SearchBooksResponse)
+async def search_books_query(search_query: str,
+                             user_id: int = Depends(get_current_user),
+                             db: Session = Depends(get_db),
+                             limit: int = Query(20, ge=1, le=100),
+                             cursor: Optional[str] = Query(None)):
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_search_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        use_replica(db, user_id)
+        result = await run_in_session(db, search_books, user_id, search_query, limit,
+                                      after)
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=result["message"])
+        return ORJSONResponse({"books": book_dicts(result["data"]),
+                               "next_cursor": result["next_cursor"]})
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
 @router.get("/books/{book_id}", response_model=BookResponse)
-async def read_book(book_id: str, user_id: int = Depends(get_current_user)):
+async def read_book(book_id: str, user_id: int = Depends(get_current_user),
+                    if_none_match: Optional[str] = Header(None),
+                    response: Response = None,
+                    db: Session = Depends(get_db)):
     try:
-        result = get_book_by_id(book_id, user_id)
+        use_replica(db, user_id)
+        result = await run_in_session(db, get_book_by_id, book_id, user_id)
         if not result["success"]:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["message"])
+        etag = book_etag(result["data"])
+        if none_match(if_none_match, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
         return result["data"]
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server error")
 
+# If-Match makes the update conditional on the ETag from a previous read (412
+# when it is stale)
 @router.put("/books/{book_id}", response_model=BookResponse)
-async def update_book(book_id: str, book_update: BookUpdate, user_id: int = Depends(get_current_user)):
+async def update_book(book_id: str, book_update: BookUpdate,
+                      user_id: int = Depends(get_current_user),
+                      if_match: Optional[str] = Header(None),
+                      response: Response = None,
+                      db: Session = Depends(get_db)):
     try:
-        result = update_book_by_id(book_id, user_id, **book_update.dict(exclude_unset=True))
+        expected_updated_at = None
+        if if_match is not None:
+            current = await run_in_session(db, get_book_by_id, book_id, user_id)
+            if not current["success"]:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail=current["message"])
+            if not match(if_match, book_etag(current["data"])):
+                raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                    detail="Book was modified by another request")
+            expected_updated_at = current["data"].updated_at
+
+        result = await run_in_session(db, update_book_by_id, book_id, user_id,
+                                      **book_update.dict(exclude_unset=True),
+                                      expected_updated_at=expected_updated_at)
+        if result.get("conflict"):
+            raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                detail=result["message"])
         if not result["success"]:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result["message"])
+        if book_update.cover_image and result["data"].cover_id:
+            notify_job_workers()
+        set_cache_headers(response, book_etag(result["data"]))
         return result["data"]
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server error")
 
 @router.delete("/books/{book_id}", response_model=dict)
-async def delete_book(book_id: str, user_id: int = Depends(get_current_user)):
+async def delete_book(book_id: str, user_id: int = Depends(get_current_user),
+                      db: Session = Depends(get_db)):
     try:
-        result = delete_book_by_id(book_id, user_id)
+        result = await run_in_session(db, delete_book_by_id, book_id, user_id)
         if not result["success"]:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["message"])
         return {"detail": "Book deleted successfully"}
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server error")
 
-@router.get("/books/search", response_model=List[BookResponse])
-async def search_books_query(search_query: str, user_id: int = Depends(get_current_user)):
+# Undo a soft delete within the retention window (TOMBSTONE_RETENTION_DAYS)
+@router.post("/books/{book_id}/restore", response_model=BookResponse)
+async def restore_book(book_id: str, user_id: int = Depends(get_current_user),
+                       response: Response = None,
+                       db: Session = Depends(get_db)):
     try:
-        result = search_books(user_id, search_query)
+        result = await run_in_session(db, restore_book_by_id, book_id, user_id,
+                                      tombstone_cutoff())
         if not result["success"]:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["message"])
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=result["message"])
+        set_cache_headers(response, book_etag(result["data"]))
         return result["data"]
+    except HTTPException:
+        raise
     except Exception:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server error")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
 
 @router.get("/library-summary", response_model=LibrarySummary)
-async def library_summary(user_id: int = Depends(get_current_user)):
+async def library_summary(user_id: int = Depends(get_current_user),
+                          if_none_match: Optional[str] = Header(None),
+                          db: Session = Depends(get_db)):
     try:
-        result = get_library_summary(user_id)
+        use_replica(db, user_id)
+        etag = await _library_etag(db, user_id, "library-summary")
+        if etag and none_match(if_none_match, etag):
+            return not_modified(etag)
+
+        result = await run_in_session(db, get_library_summary, user_id)
         if not result["success"]:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=result["message"])
-        return result
+        response = ORJSONResponse({
+            "total_books": result["total_books"],
+            "recent_additions": book_dicts(result["recent_additions"]),
+            "top_authors": result["top_authors"],
+            "by_decade": result["by_decade"]
+        })
+        if etag:
+            set_cache_headers(response, etag)
+        return response
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server error")
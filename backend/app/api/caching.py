@@ -0,0 +1,48 @@
+import hashlib
+
+from fastapi import Response, status
+
+# Authenticated, per-user representations: clients and proxies may store them but must
+# revalidate with If-None-Match before every reuse
+CACHE_CONTROL = "private, no-cache"
+# Content-addressed resources (cover images): the bytes behind a URL never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def book_etag(book) -> str:
+    return make_etag("book", book.id,
+                     book.updated_at.isoformat() if book.updated_at else "")
+
+
+def _parse_etags(header: str) -> list:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+# If-None-Match uses weak comparison (RFC 9110 13.1.2): a W/ prefix on
+# either side is ignored
+def none_match(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.removeprefix("W/") for tag in _parse_etags(if_none_match)}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+# If-Match uses strong comparison (RFC 9110 13.1.1): weak tags never match
+def match(if_match: str, etag: str) -> bool:
+    tags = _parse_etags(if_match)
+    return "*" in tags or etag in tags
+
+
+def set_cache_headers(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag: str, cache_control: str = CACHE_CONTROL) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, "Cache-Control": cache_control})
@@ -0,0 +1,185 @@
+import os
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.api.caching import (
+    IMMUTABLE_CACHE_CONTROL,
+    book_etag,
+    none_match,
+    not_modified,
+    set_cache_headers,
+)
+from app.application.auth import get_current_user
+from app.application.book import set_book_cover
+from app.application.covers import ensure_thumbnail, store_cover
+from app.application.jobs import notify_job_workers
+from app.config import settings
+from app.domain.covers import ORIGINAL, THUMBNAIL_SIZES, cover_store, is_cover_id
+from app.domain.db import get_db, run_in_session
+from app.schemas.book import BookResponse
+
+router = APIRouter(prefix="/api/v1")
+
+COVER_SIZE_PATTERN = f"^({'|'.join((ORIGINAL, *THUMBNAIL_SIZES))})$"
+# Single byte range: "bytes=0-499", "bytes=500-" or the suffix form "bytes=-500"
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+async def _read_upload(request: Request, limit: int) -> bytes:
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Cover image is larger than {limit} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Cover image is larger than {limit} bytes")
+    return bytes(body)
+
+
+# The raw image is the request body (Content-Type: image/jpeg, image/png,
+# image/webp or image/gif)
+@router.put("/books/{book_id}/cover", response_model=BookResponse)
+async def upload_cover(book_id: str, request: Request,
+                       user_id: int = Depends(get_current_user),
+                       response: Response = None,
+                       db: Session = Depends(get_db)):
+    try:
+        if not request.headers.get("content-type", "").startswith("image/"):
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                detail="Upload the cover as an image/* request body")
+        data = await _read_upload(request, settings.COVER_MAX_BYTES)
+        try:
+            cover_id = await store_cover(data)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        result = await run_in_session(db, set_book_cover, book_id, user_id, cover_id)
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=result["message"])
+        notify_job_workers()
+        set_cache_headers(response, book_etag(result["data"]))
+        return result["data"]
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+@router.delete("/books/{book_id}/cover", response_model=BookResponse)
+async def remove_cover(book_id: str, user_id: int = Depends(get_current_user),
+                       response: Response = None,
+                       db: Session = Depends(get_db)):
+    try:
+        result = await run_in_session(db, set_book_cover, book_id, user_id, None)
+        if not result["success"]:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=result["message"])
+        set_cache_headers(response, book_etag(result["data"]))
+        return result["data"]
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+def _byte_range(header: str, file_size: int):
+    # (start, end) inclusive for a satisfiable single range; None to send the whole file
+    # (no, malformed or multi-part ranges, which RFC 9110 allows a server to ignore)
+    found = BYTE_RANGE.match(header.strip()) if header else None
+    if not found or found.groups() == ("", ""):
+        return None
+    first, last = found.groups()
+    if not first:
+        # Suffix range: the last N bytes ("bytes=-0" is unsatisfiable)
+        length = int(last)
+        start, end = max(0, file_size - length) if length else file_size, file_size - 1
+    else:
+        start, end = int(first), file_size - 1
+        if last:
+            end = min(int(last), end)
+        if last and int(last) < start:
+            return None
+    if start >= file_size:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{file_size}"})
+    return start, end
+
+
+def _read_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _describe(cover_id: str, size: str):
+    path = cover_store.path(cover_id, size)
+    return path, os.stat(path), cover_store.media_type(cover_id, size)
+
+
+# Public on purpose so <img> tags can load covers without an Authorization header:
+# a cover id is the sha256 of the image, so a URL can only be formed by someone
+# who has the image already or was given the id. Responses never change and are
+# cached for a year.
+@router.api_route("/covers/{cover_id}", methods=["GET", "HEAD"])
+async def read_cover(cover_id: str, request: Request,
+                     size: str = Query(ORIGINAL, pattern=COVER_SIZE_PATTERN)):
+    try:
+        if not is_cover_id(cover_id) or \
+                not await run_in_threadpool(cover_store.exists, cover_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail="Cover not found")
+        etag = f'"{cover_id}-{size}"'
+        if none_match(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, IMMUTABLE_CACHE_CONTROL)
+
+        if size != ORIGINAL:
+            await ensure_thumbnail(cover_id, size)
+        path, stat_result, media_type = await run_in_threadpool(
+            _describe, cover_id, size)
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                   "Accept-Ranges": "bytes", "X-Content-Type-Options": "nosniff"}
+
+        if settings.COVER_ACCEL_REDIRECT_PREFIX:
+            # nginx serves the file itself (sendfile, ranges) from its internal location
+            location = os.path.relpath(path, cover_store.root).replace(os.sep, "/")
+            prefix = settings.COVER_ACCEL_REDIRECT_PREFIX.rstrip("/")
+            headers["X-Accel-Redirect"] = f"{prefix}/{location}"
+            return Response(headers=headers, media_type=media_type)
+
+        # If-Range: only honour the range when the client's copy is still
+        # this representation
+        if_range = request.headers.get("if-range")
+        byte_range = _byte_range(request.headers.get("range"), stat_result.st_size) \
+            if not if_range or if_range == etag else None
+        if byte_range is None:
+            return FileResponse(path, media_type=media_type, headers=headers,
+                                stat_result=stat_result)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(_read_file_range(path, start, end),
+                                 status_code=status.HTTP_206_PARTIAL_CONTENT,
+                                 media_type=media_type, headers=headers)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
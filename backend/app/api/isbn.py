@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+from app.application.auth import get_current_user
+from app.domain.isbn import isbn_metadata, normalize_isbn
+from app.schemas.book import IsbnMetadataResponse
+
+router = APIRouter(prefix="/api/v1")
+
+
+# Catalog entry for an ISBN-10 or ISBN-13, for forms that pre-fill a new book
+@router.get("/isbn/{isbn}", response_model=IsbnMetadataResponse)
+async def lookup_isbn(isbn: str, user_id: int = Depends(get_current_user)):
+    normalized = normalize_isbn(isbn)
+    if normalized is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Invalid ISBN")
+    try:
+        metadata = await run_in_threadpool(isbn_metadata.lookup, normalized)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+    if metadata is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="ISBN not found in the catalog")
+    return {"isbn": normalized, **metadata}
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+
+from app.application.auth import get_current_user
+from app.application.jobs import get_user_jobs
+from app.schemas.job import JobListResponse, JobResponse
+
+router = APIRouter(prefix="/api/v1")
+
+
+# The caller's background jobs (thumbnails for their covers and the like), newest
+# first; other users' jobs are never listed. Queue-wide counts are on /metrics.
+@router.get("/jobs", response_model=JobListResponse)
+async def list_jobs(limit: int = Query(20, ge=1, le=100),
+                    user_id: int = Depends(get_current_user)):
+    try:
+        return {"jobs": await run_in_threadpool(get_user_jobs, user_id, limit)}
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
+
+
+# Someone else's job is reported as missing, like their books
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, user_id: int = Depends(get_current_user)):
+    try:
+        jobs = await run_in_threadpool(get_user_jobs, user_id, 1, job_id)
+        if not jobs:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail="Job not found")
+        return jobs[0]
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Server error")
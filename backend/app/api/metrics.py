@@ -0,0 +1,220 @@
+import logging
+import os
+import time
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.concurrency import run_in_threadpool
+
+from app.application.auth import password_pool_stats
+from app.application.covers import thumbnail_stats
+from app.application.jobs import job_stats, queue_status
+from app.application.maintenance import maintenance_stats
+from app.application.replicas import replica_status
+from app.domain.db import pool_metrics
+from app.domain.isbn import isbn_metadata
+from app.domain.rate_limit import rate_limiter
+from app.domain.token_cache import token_cache
+from app.metrics import (
+    http_request_db_queries,
+    http_request_db_seconds,
+    http_request_seconds,
+    http_requests,
+    http_requests_in_flight,
+    request_db_usage,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Label for requests that matched no route, so scanners can't mint a series per path
+UNMATCHED_ROUTE = "unmatched"
+
+# HealthCollector families read from the database, the same whichever worker answers
+SHARED_FAMILIES = {"jobs_queued"}
+
+
+# Pure ASGI middleware (BaseHTTPMiddleware would buffer streamed exports): times
+# each request until its last body chunk is sent and labels it with the route
+# template FastAPI matched
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                response_status["code"] = message["status"]
+            await send(message)
+
+        usage = {"queries": 0, "seconds": 0.0}
+        token = request_db_usage.set(usage)
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            request_db_usage.reset(token)
+            # The router stores the matched APIRoute in the (shared) scope
+            route = scope.get("route")
+            route = getattr(route, "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            http_requests.labels(method, route, str(response_status["code"])).inc()
+            http_request_seconds.labels(method, route).observe(elapsed)
+            http_request_db_queries.labels(method, route).observe(usage["queries"])
+            http_request_db_seconds.labels(method, route).observe(usage["seconds"])
+
+
+# Exposes the counters already kept for /health (pools, replicas, password, thumbnail
+# and job workers, ISBN lookups, maintenance) as Prometheus samples, read at scrape
+# time, plus the job outbox counts of every shard. With label_pid (multiprocess mode)
+# the process counters get a pid label, so one worker's numbers are not read as the
+# total over all of them.
+class HealthCollector:
+    def __init__(self, label_pid: bool = False):
+        self.label_pid = label_pid
+
+    # Nothing to declare up front: registering would otherwise collect, querying the job
+    # outboxes before their tables exist
+    def describe(self):
+        return []
+
+    def collect(self):
+        pid = str(os.getpid())
+        for family in self._collect():
+            if self.label_pid and family.name not in SHARED_FAMILIES:
+                family.samples = [sample._replace(labels={**sample.labels, "pid": pid})
+                                  for sample in family.samples]
+            yield family
+
+    def _collect(self):
+        pools = pool_metrics()
+        for key, kind in (("size", "gauge"), ("checked_in", "gauge"),
+                          ("checked_out", "gauge"), ("overflow", "gauge"),
+                          ("connections_opened", "counter"), ("checkouts", "counter")):
+            family = _family(kind, f"db_pool_{key}",
+                             f"Connection pool {key.replace('_', ' ')}", ["engine"])
+            for name, values in pools.items():
+                family.add_metric([name], values[key])
+            yield family
+
+        replicas = replica_status()
+        healthy = GaugeMetricFamily("db_replica_healthy",
+                                    "Read replica in the rotation (1) or not (0)",
+                                    labels=["url"])
+        reads = CounterMetricFamily("db_replica_reads",
+                                    "Request sessions that read from the replica",
+                                    labels=["url"])
+        for replica in replicas:
+            healthy.add_metric([replica["url"]], int(replica["healthy"]))
+            reads.add_metric([replica["url"]], replica["reads"])
+        yield healthy
+        yield reads
+
+        for key, kind in (("queued", "gauge"), ("in_flight", "gauge"),
+                          ("completed", "counter"), ("rejected", "counter")):
+            family = _family(kind, f"password_pool_{key}",
+                             f"Password hashing jobs {key.replace('_', ' ')}")
+            family.add_metric([], password_pool_stats[key])
+            yield family
+
+        for key, kind in (("in_flight", "gauge"), ("generated", "counter"),
+                          ("failed", "counter")):
+            family = _family(kind, f"thumbnails_{key}",
+                             f"Cover thumbnail jobs {key.replace('_', ' ')}")
+            family.add_metric([], thumbnail_stats[key])
+            yield family
+
+        for key, kind in (("workers", "gauge"), ("in_flight", "gauge"),
+                          ("completed", "counter"), ("retried", "counter"),
+                          ("failed", "counter")):
+            family = _family(kind, f"jobs_{key}",
+                             f"Background jobs {key.replace('_', ' ')}")
+            family.add_metric([], job_stats[key])
+            yield family
+        family = GaugeMetricFamily("jobs_queued", "Background jobs in the outboxes",
+                                   labels=["status", "kind"])
+        try:
+            for entry in queue_status():
+                family.add_metric([entry["status"], entry["kind"]], entry["count"])
+        except Exception as e:
+            # A database that is down shouldn't take the process metrics with it
+            logger.error("Job queue counts unavailable: %s", e)
+        yield family
+
+        for key, kind in (("runs", "counter"), ("failures", "counter"),
+                          ("rows_purged", "counter"),
+                          ("covers_removed", "counter"), ("jobs_purged", "counter"),
+                          ("vacuums", "counter"), ("bytes_reclaimed", "counter"),
+                          ("last_run_seconds", "gauge"), ("database_bytes", "gauge"),
+                          ("free_bytes", "gauge")):
+            if maintenance_stats[key] is None:
+                continue
+            family = _family(kind, f"maintenance_{key}",
+                             f"Storage maintenance {key.replace('_', ' ')}")
+            family.add_metric([], maintenance_stats[key])
+            yield family
+
+        for key in ("lookups", "cache_hits", "found", "not_found", "errors"):
+            family = _family("counter", f"isbn_metadata_{key}",
+                             f"ISBN metadata {key.replace('_', ' ')}")
+            family.add_metric([], isbn_metadata.stats[key])
+            yield family
+        family = GaugeMetricFamily("isbn_metadata_cache_entries",
+                                   "ISBN lookups cached, found or not")
+        family.add_metric([], len(isbn_metadata.cache))
+        yield family
+
+        family = GaugeMetricFamily("token_cache_entries",
+                                   "Decoded access tokens cached")
+        family.add_metric([], len(token_cache))
+        yield family
+
+        family = GaugeMetricFamily("rate_limit_buckets",
+                                   "Token buckets held in process by the rate limiter")
+        family.add_metric([], len(rate_limiter.store))
+        yield family
+
+
+def _family(kind: str, name: str, documentation: str, labels: list = None):
+    metric_type = CounterMetricFamily if kind == "counter" else GaugeMetricFamily
+    return metric_type(name, documentation, labels=labels or [])
+
+
+REGISTRY.register(HealthCollector())
+
+
+# Prometheus text exposition of the default registry, or in multiprocess mode
+# (PROMETHEUS_MULTIPROC_DIR set, as gunicorn.conf.py does) of a registry built per
+# scrape that merges the metric files of every worker
+def render_metrics() -> bytes:
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(HealthCollector(label_pid=True))
+    return generate_latest(registry)
+
+
+# In the threadpool, as collecting the job counts queries every shard and
+# multiprocess mode reads the workers' files
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    body = await run_in_threadpool(render_metrics)
+    return Response(body, media_type=CONTENT_TYPE_LATEST)
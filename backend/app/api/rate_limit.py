@@ -0,0 +1,90 @@
+import logging
+import math
+
+import jwt
+import orjson
+
+from app.config import settings
+from app.domain.rate_limit import rate_limiter
+from app.logging_config import SAMPLED
+from app.metrics import rate_limit_rejections
+
+logger = logging.getLogger(__name__)
+
+BEARER_PREFIX = b"bearer "
+
+
+def client_ip(scope) -> str:
+    # With FORWARDED_PROXY_HOPS trusted proxies in front, the client is the address the
+    # outermost of them saw; anything further left in X-Forwarded-For is client-supplied
+    if settings.FORWARDED_PROXY_HOPS > 0:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",")
+                        if hop.strip()]
+                if hops:
+                    return hops[-min(settings.FORWARDED_PROXY_HOPS, len(hops))]
+                break
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def token_user(scope):
+    # Username of a correctly signed, unexpired access token (no database
+    # lookup); None otherwise
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            if not value[:len(BEARER_PREFIX)].lower() == BEARER_PREFIX:
+                return None
+            try:
+                token = value[len(BEARER_PREFIX):].decode("latin-1").strip()
+                payload = jwt.decode(token, settings.SECRET_KEY,
+                                     algorithms=[settings.ALGORITHM])
+            except jwt.PyJWTError:
+                return None
+            return payload.get("sub")
+    return None
+
+
+async def too_many_requests(send, rule_name: str, retry_after: float):
+    rate_limit_rejections.labels(rule_name).inc()
+    body = orjson.dumps({"detail": "Too many requests, try again later"})
+    await send({"type": "http.response.start", "status": 429, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+# Token-bucket limits from RATE_LIMIT_RULES, checked before routing: a rejected request
+# never reaches the body parser, the database or the password pool. Pure ASGI like the
+# other middlewares; added inside CORS so browsers can read the 429 and its Retry-After.
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        hits = []
+        for rule in rate_limiter.matching_rules(scope["method"], scope["path"]):
+            if rule.key == "user":
+                username = token_user(scope)
+                client_key = (f"user:{username}" if username
+                              else f"ip:{client_ip(scope)}")
+            else:
+                client_key = f"ip:{client_ip(scope)}"
+            hits.append((rule, client_key))
+        # All the buckets at once: a request rejected by one rule spends no token
+        # from the others
+        rule, retry_after = await rate_limiter.hit_all(hits)
+        if rule is not None:
+            logger.info("Rate limited %s %s for %s by rule %s", scope["method"],
+                        scope["path"], dict(hits)[rule], rule.name, extra=SAMPLED)
+            await too_many_requests(send, rule.name, retry_after)
+            return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,53 @@
+import math
+import re
+
+from app.config import settings
+from app.domain.db import has_replicas
+from app.domain.replicas import (
+    last_write_token,
+    read_last_write_token,
+    request_last_write,
+)
+
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = b"x-last-write"
+LAST_WRITE_IN_COOKIE = re.compile(rb"(?:^|;)\s*last_write=([^;]*)")
+
+
+# Read-your-writes for every worker: a response to a request that wrote carries the
+# signed time of the write, as a cookie and an X-Last-Write header (for clients that
+# keep no cookies). Whichever worker serves the user's next requests reads from the
+# primary while it is recent. Only with replicas configured.
+class LastWriteMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not has_replicas():
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        token = headers.get(LAST_WRITE_HEADER)
+        if token is None:
+            match = LAST_WRITE_IN_COOKIE.search(headers.get(b"cookie", b""))
+            token = match.group(1) if match else None
+        last_write = {"seen": None, "written": None}
+        if token:
+            last_write["seen"] = read_last_write_token(token.decode("latin-1"))
+
+        async def send_with_last_write(message):
+            if message["type"] == "http.response.start" and last_write["written"]:
+                value = last_write_token(*last_write["written"]).encode()
+                max_age = math.ceil(settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+                message["headers"] = [
+                    *message.get("headers", []), (LAST_WRITE_HEADER, value),
+                    (b"set-cookie", b"%s=%s; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax"
+                     % (LAST_WRITE_COOKIE.encode(), value, max_age))]
+            await send(message)
+
+        context_token = request_last_write.set(last_write)
+        try:
+            await self.app(scope, receive, send_with_last_write)
+        finally:
+            request_last_write.reset(context_token)
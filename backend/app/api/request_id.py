@@ -0,0 +1,37 @@
+import re
+import uuid
+
+from app.logging_config import request_id
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Ids accepted from a proxy/client; anything else is replaced with a fresh one
+VALID_REQUEST_ID = re.compile(rb"^[A-Za-z0-9._:-]{1,128}$")
+
+
+# Tags every log record written while serving a request with its id (taken from
+# X-Request-ID when a proxy already assigned one) and echoes the id in the
+# response headers
+class RequestIdMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = dict(scope["headers"]).get(REQUEST_ID_HEADER, b"")
+        if not VALID_REQUEST_ID.match(value):
+            value = uuid.uuid4().hex.encode()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []),
+                                      (REQUEST_ID_HEADER, value)]
+            await send(message)
+
+        token = request_id.set(value.decode())
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,11 @@
+from app.domain.book import BOOK_FIELDS
+
+# Fast path for list responses: services return book rows (BOOK_COLUMNS, possibly
+# followed by extra columns), which are zipped into plain dicts and encoded by
+# ORJSONResponse in one pass instead of validating every row into BookResponse. Routes
+# keep their response_model for the OpenAPI schema; returning a Response directly skips
+# FastAPI's response_model serialization.
+
+
+def book_dicts(rows) -> list:
+    return [dict(zip(BOOK_FIELDS, row)) for row in rows]
@@ -1,22 +1,71 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-import jwt
-
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from typing import Optional
+from sqlalchemy.orm import Session
+
 from app.config import settings
 from app.domain.auth import DatabaseService
+from app.domain.db import get_db, run_in_session
+from app.domain.token_cache import token_cache
+from app.metrics import password_hash_seconds, password_queue_seconds
 from app.schemas.auth import TokenData
 
-# Password Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password Hashing: new hashes use the configured scheme/cost, anything
+# else needs_update()
+pwd_context = CryptContext(
+    schemes=list(dict.fromkeys([settings.PASSWORD_HASH_SCHEME, "bcrypt"])),
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# Hashing is CPU-bound (~250 ms per bcrypt call), so it runs on a bounded worker
+# pool instead of the event loop. At most PASSWORD_HASH_WORKERS jobs run at once;
+# the rest wait. The pool and its semaphore are created on first use and dropped
+# again on shutdown.
+password_pool = {"executor": None, "slots": None}
+password_pool_stats = {"queued": 0, "in_flight": 0, "completed": 0, "rejected": 0,
+                       "seconds_total": 0.0}
 
 # OAuth2 Bearer for access token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-# Instantiate the database service
-auth_db_service = DatabaseService()
+# User lookups and creation for the auth routes; each call uses (and closes) one session
+def get_user_by_username(username: str, user_id=None, db: Session = None):
+    db_service = DatabaseService(db)
+    try:
+        return db_service.get_user_by_username(username, user_id)
+    finally:
+        db_service.close()
+
+def get_user_by_email(email: str, db: Session = None):
+    db_service = DatabaseService(db)
+    try:
+        return db_service.get_user_by_email(email)
+    finally:
+        db_service.close()
+
+def create_user(username: str, email: str, hashed_password: str, db: Session = None):
+    db_service = DatabaseService(db)
+    try:
+        return db_service.create_user(username, email, hashed_password)
+    finally:
+        db_service.close()
+
+def update_password(username: str, hashed_password: str, db: Session = None):
+    db_service = DatabaseService(db)
+    try:
+        return db_service.update_password(username, hashed_password)
+    finally:
+        db_service.close()
 
 # Utility function to hash passwords
 def get_password_hash(password: str):
@@ -26,6 +75,65 @@ def get_password_hash(password: str):
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
+def _get_password_pool():
+    if password_pool["executor"] is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            password_pool["executor"] = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            password_pool["executor"] = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix="password-hash")
+        password_pool["slots"] = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+    return password_pool["executor"], password_pool["slots"]
+
+# Run a hashing job on the worker pool; counters are only touched from the event loop
+async def run_password_job(fn, *args):
+    max_queue = settings.PASSWORD_HASH_MAX_QUEUE
+    if max_queue and password_pool_stats["queued"] >= max_queue:
+        password_pool_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent authentication requests",
+            headers={"Retry-After": "1"},
+        )
+
+    executor, slots = _get_password_pool()
+    password_pool_stats["queued"] += 1
+    queued_at = time.perf_counter()
+    try:
+        await slots.acquire()
+    finally:
+        password_pool_stats["queued"] -= 1
+        password_queue_seconds.observe(time.perf_counter() - queued_at)
+
+    password_pool_stats["in_flight"] += 1
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        password_pool_stats["in_flight"] -= 1
+        password_pool_stats["completed"] += 1
+        password_pool_stats["seconds_total"] += elapsed
+        password_hash_seconds.labels(fn.__name__).observe(elapsed)
+        slots.release()
+
+async def hash_password_in_pool(password: str):
+    return await run_password_job(get_password_hash, password)
+
+async def verify_password_in_pool(plain_password: str, hashed_password: str):
+    return await run_password_job(verify_password, plain_password, hashed_password)
+
+def password_needs_rehash(hashed_password: str):
+    return (settings.PASSWORD_REHASH_ON_LOGIN
+            and pwd_context.needs_update(hashed_password))
+
+def shutdown_password_pool():
+    if password_pool["executor"] is not None:
+        password_pool["executor"].shutdown(wait=False, cancel_futures=True)
+    password_pool["executor"] = password_pool["slots"] = None
+
 # Create access JWT token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -43,7 +151,8 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # Get the current user based on token
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -59,7 +168,18 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     except jwt.PyJWTError:
         raise credentials_exception
 
-    user = auth_db_service.get_user_by_username(token_data.username)
+    # The signature and exp were verified above; what remains is mapping
+    # the token to a user
+    if settings.AUTH_TRUST_TOKEN_USER_ID and payload.get("uid") is not None:
+        return payload["uid"]
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    # Tokens carry the user id, so the account is looked up on its own shard only
+    user = await run_in_session(db, get_user_by_username, token_data.username,
+                                payload.get("uid"))
     if user is None or user.email != token_data.email:
         raise credentials_exception
+    token_cache.put(token, user.id, user.username, payload.get("exp"))
     return user.id
\ No newline at end of file
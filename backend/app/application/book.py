@@ -1,16 +1,30 @@
 import logging
+from datetime import datetime
+from typing import AsyncIterator
 
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.application.bulk import FORMATTERS, PARSERS
 from app.domain.book import BookService
+from app.logging_config import SAMPLED
+from app.schemas.book import BookCreate
 
 logger = logging.getLogger(__name__)
 
-# Initialize the BookService
-def get_book_service() -> BookService:
-    return BookService()
+# Rows validated and inserted per transaction during bulk import
+BULK_IMPORT_CHUNK_SIZE = 1000
+# Detailed per-row errors kept in the import report; further failures are only counted
+BULK_IMPORT_MAX_ERRORS = 1000
+
+# Initialize the BookService, on the shard holding the user's books
+def get_book_service(db: Session = None, user_id=None) -> BookService:
+    return BookService(db, user_id)
 
 def add_book(user_id: int, title: str, author: str, publication_date: str = None, isbn: str = None,
-             cover_image: str = None):
-    book_service = get_book_service()
+             cover_image: str = None, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
         new_book = book_service.add_book(user_id, title, author, publication_date, isbn, cover_image)
 
@@ -18,114 +32,351 @@ def add_book(user_id: int, title: str, author: str, publication_date: str = None
             logger.error(new_book["message"])
             return new_book
 
-        logger.info(f"Book added successfully: {new_book[1].title} by {new_book[1].author}")
+        logger.info("Book added successfully: %s by %s", new_book["data"].title,
+                    new_book["data"].author)
+        if new_book["possible_duplicates"]:
+            logger.info("Book %s for user %s looks like %d existing book(s)",
+                        new_book["data"].id, user_id,
+                        len(new_book["possible_duplicates"]))
         return new_book
     except Exception as e:
-        logger.error(f"Failed to add book: {e}")
+        logger.error("Failed to add book: %s", e)
         raise
     finally:
-        book_service.db.close()
+        book_service.close()
+
+
+def _record_import_error(report: dict, row_number: int, message: str):
+    report["failed"] += 1
+    if len(report["errors"]) < BULK_IMPORT_MAX_ERRORS:
+        report["errors"].append({"row": row_number, "message": message})
+
 
+def _import_chunk(book_service: BookService, user_id: int, chunk: list, report: dict):
+    result = book_service.add_books(user_id, chunk)
+    if not result["success"]:
+        raise RuntimeError(result["message"])
+    report["imported"] += result["inserted"]
+    for error in result["errors"]:
+        _record_import_error(report, error["row"], error["message"])
 
-def get_books(user_id: int, page: int = 1, limit: int = 10):
-    book_service = get_book_service()
+
+def new_import_report() -> dict:
+    return {"imported": 0, "failed": 0, "errors": []}
+
+
+async def import_books(user_id: int, chunks: AsyncIterator[bytes], file_format: str,
+                       report: dict):
+    # Fills in the caller's report as it goes. Chunks commit one by one, so an import
+    # that stops early keeps the chunks before the error: the report then still counts
+    # them, and its last entry is the first row that was not imported.
+    book_service = get_book_service(user_id=user_id)
+    chunk = []
+    last_row = 0
+    try:
+        async for row_number, record in PARSERS[file_format](chunks):
+            last_row = row_number
+            if isinstance(record, ValueError):
+                _record_import_error(report, row_number, str(record))
+                continue
+            try:
+                chunk.append((row_number, BookCreate(**record)))
+            except ValidationError as e:
+                message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                                    for err in e.errors())
+                _record_import_error(report, row_number, message)
+                continue
+            if len(chunk) >= BULK_IMPORT_CHUNK_SIZE:
+                # Each chunk is inserted and committed in the threadpool before the
+                # next rows are parsed
+                await run_in_threadpool(_import_chunk, book_service, user_id, chunk,
+                                        report)
+                chunk = []
+        if chunk:
+            await run_in_threadpool(_import_chunk, book_service, user_id, chunk, report)
+            chunk = []
+
+        report["errors"].sort(key=lambda error: error["row"])
+        logger.info("Bulk import for user %s: %d imported, %d failed", user_id,
+                    report["imported"], report["failed"])
+        return report
+    except Exception as e:
+        # Nothing from the unsaved chunk (or the row that failed to parse) on is in
+        stopped_at = chunk[0][0] if chunk else last_row + 1
+        report["errors"].sort(key=lambda error: error["row"])
+        report["errors"].append({"row": stopped_at,
+                                 "message": "Import stopped: this row and the ones "
+                                            "after it were not imported"})
+        logger.error("Bulk import failed for user %s at row %d after %d books: %s",
+                     user_id, stopped_at, report["imported"], e)
+        raise
+    finally:
+        book_service.close()
+
+
+def export_books(user_id: int, file_format: str):
+    # Generator consumed by a StreamingResponse; the session lives until the
+    # last row is sent
+    book_service = get_book_service(user_id=user_id)
+    try:
+        rows = book_service.iter_books_for_export(user_id)
+        for chunk in FORMATTERS[file_format](rows):
+            yield chunk
+        logger.info("Exported library for user %s as %s", user_id, file_format)
+    except Exception as e:
+        logger.error("Failed to export library for user %s: %s", user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+
+def get_books(user_id: int, page: int = 1, limit: int = 10, after: tuple = None,
+              include_total: bool = True, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
         # Retrieve paginated books from the book service
-        response = book_service.get_books(user_id, page, limit)
+        response = book_service.get_books(user_id, page, limit, after, include_total)
 
         # Log the details including pagination info
         if response["success"]:
-            logger.info(
-                f"Retrieved page {page} of books for user {user_id}, total books: {response['pagination']['total']}")
+            logger.info("Retrieved %d books for user %s, page: %s, total books: %s",
+                        len(response["data"]), user_id, response["pagination"]["page"],
+                        response["pagination"]["total"], extra=SAMPLED)
         else:
-            logger.warning(f"Failed to retrieve books for user {user_id}: {response.get('message', 'Unknown error')}")
+            logger.warning("Failed to retrieve books for user %s: %s", user_id,
+                           response.get("message", "Unknown error"))
 
         return response
 
     except Exception as e:
-        logger.error(f"Exception occurred while retrieving books for user {user_id}: {e}")
+        logger.error("Exception occurred while retrieving books for user %s: %s",
+                     user_id, e)
         raise
 
     finally:
-        book_service.db.close()
+        book_service.close()
 
 
-def get_book_by_id(book_id: str, user_id: int):
-    book_service = get_book_service()
+def get_book_by_id(book_id: str, user_id: int, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
         book = book_service.get_book_by_id(book_id, user_id)
-        if book:
-            logger.info(f"Retrieved book: {book.title} by {book.author} for user {user_id}")
+        if book["success"]:
+            logger.info("Retrieved book: %s by %s for user %s", book["data"].title,
+                        book["data"].author, user_id, extra=SAMPLED)
         else:
-            logger.warning(f"Book with ID {book_id} not found for user {user_id}")
+            logger.warning("Book with ID %s not found for user %s", book_id, user_id)
         return book
     except Exception as e:
-        logger.error(f"Failed to retrieve book with ID {book_id} for user {user_id}: {e}")
+        logger.error("Failed to retrieve book with ID %s for user %s: %s", book_id,
+                     user_id, e)
         raise
     finally:
-        book_service.db.close()
+        book_service.close()
 
 
 def update_book_by_id(book_id: str, user_id: int, title: str = None, author: str = None,
-                      publication_date: str = None, isbn: str = None, cover_image: str = None):
-    book_service = get_book_service()
+                      publication_date: str = None, isbn: str = None,
+                      cover_image: str = None,
+                      expected_updated_at: datetime = None, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
         # Attempt to update the book
-        updated_book = book_service.update_book(book_id, user_id, title, author, publication_date, isbn, cover_image)
+        updated_book = book_service.update_book(book_id, user_id, title, author,
+                                                publication_date, isbn, cover_image,
+                                                expected_updated_at)
 
         # Log based on success or failure
         if updated_book["success"]:
-            logger.info(f"Successfully updated book ID {book_id}: '{title}' by {author} for user {user_id}")
+            logger.info("Successfully updated book ID %s: '%s' by %s for user %s",
+                        book_id, title, author, user_id)
         else:
-            logger.warning(
-                f"Failed to update book ID {book_id}: {updated_book.get('message')} for user {user_id}")
+            logger.warning("Failed to update book ID %s: %s for user %s", book_id,
+                           updated_book.get("message"), user_id)
         return updated_book
 
     except Exception as e:
         # Log any exception that occurs
-        logger.error(f"Exception occurred while updating book ID {book_id} for user {user_id}: {e}")
+        logger.error("Exception occurred while updating book ID %s for user %s: %s",
+                     book_id, user_id, e)
         return {"success": False, "message": "An error occurred while updating the book."}
 
     finally:
         # Close the database session/connection if applicable
-        book_service.db.close()
+        book_service.close()
 
 
-def delete_book_by_id(book_id: str, user_id: int):
-    book_service = get_book_service()
+def delete_book_by_id(book_id: str, user_id: int, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
         result = book_service.delete_book(book_id, user_id)
-        if result:
-            logger.info(f"Book with ID {book_id} soft-deleted for user {user_id}")
+        if result["success"]:
+            logger.info("Book with ID %s soft-deleted for user %s", book_id, user_id)
+        else:
+            logger.warning("Book with ID %s not found or already deleted for user %s",
+                           book_id, user_id)
+        return result
+    except Exception as e:
+        logger.error("Failed to delete book with ID %s for user %s: %s", book_id,
+                     user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+def set_book_cover(book_id: str, user_id: int, cover_id: str = None,
+                   db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.set_cover(book_id, user_id, cover_id)
+        if result["success"]:
+            logger.info("Cover of book ID %s %s for user %s", book_id,
+                        "set to " + cover_id if cover_id else "removed", user_id)
         else:
-            logger.warning(f"Book with ID {book_id} not found or already deleted for user {user_id}")
+            logger.warning("Failed to set cover of book ID %s for user %s: %s", book_id,
+                           user_id, result["message"])
         return result
     except Exception as e:
-        logger.error(f"Failed to delete book with ID {book_id} for user {user_id}: {e}")
+        logger.error("Failed to set cover of book ID %s for user %s: %s", book_id,
+                     user_id, e)
         raise
     finally:
-        book_service.db.close()
+        book_service.close()
 
-def search_books(user_id: int, search_query: str):
-    book_service = get_book_service()
+def get_books_by_ids(user_id: int, book_ids: list, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
-        books = book_service.search_books(user_id, search_query)
-        logger.info(f"Found {len(books)} books for user {user_id} with search query '{search_query}'")
-        return books
+        result = book_service.get_books_by_ids(user_id, book_ids)
+        if result["success"]:
+            logger.info("Batch get for user %s: %d found, %d not found", user_id,
+                        len(result["data"]), len(result["not_found"]))
+        else:
+            logger.warning("Batch get failed for user %s: %s", user_id,
+                           result["message"])
+        return result
+    except Exception as e:
+        logger.error("Batch get failed for user %s: %s", user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+
+def update_books_by_ids(user_id: int, book_ids: list, title: str = None,
+                        author: str = None, publication_date: str = None,
+                        cover_image: str = None, db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.update_books(user_id, book_ids, title, author,
+                                           publication_date, cover_image)
+        if result["success"]:
+            updated = sum(1 for item in result["results"] if item["success"])
+            logger.info("Batch update for user %s: %d of %d books updated", user_id,
+                        updated, len(book_ids))
+        else:
+            logger.warning("Batch update failed for user %s: %s", user_id,
+                           result["message"])
+        return result
+    except Exception as e:
+        logger.error("Batch update failed for user %s: %s", user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+
+def delete_books_by_ids(user_id: int, book_ids: list, db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.delete_books(user_id, book_ids)
+        if result["success"]:
+            deleted = sum(1 for item in result["results"] if item["success"])
+            logger.info("Batch delete for user %s: %d of %d books soft-deleted",
+                        user_id, deleted, len(book_ids))
+        else:
+            logger.warning("Batch delete failed for user %s: %s", user_id,
+                           result["message"])
+        return result
+    except Exception as e:
+        logger.error("Batch delete failed for user %s: %s", user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+def restore_book_by_id(book_id: str, user_id: int, deleted_after: datetime,
+                       db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.restore_book(book_id, user_id, deleted_after)
+        if result["success"]:
+            logger.info("Book with ID %s restored for user %s", book_id, user_id)
+        else:
+            logger.warning("Failed to restore book with ID %s for user %s: %s", book_id,
+                           user_id, result["message"])
+        return result
+    except Exception as e:
+        logger.error("Failed to restore book with ID %s for user %s: %s", book_id,
+                     user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+def search_books(user_id: int, search_query: str, limit: int = 20, after: tuple = None,
+                 db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.search_books(user_id, search_query, limit, after)
+        if result["success"]:
+            logger.info("Found %d books for user %s with search query '%s'",
+                        len(result["data"]), user_id, search_query, extra=SAMPLED)
+        else:
+            logger.warning("Failed to search books for user %s: %s", user_id,
+                           result.get("message", "Unknown error"))
+        return result
+    except Exception as e:
+        logger.error("Failed to search books for user %s with query '%s': %s", user_id,
+                     search_query, e)
+        raise
+    finally:
+        book_service.close()
+
+def find_duplicate_books(user_id: int, limit: int = 50, db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.find_duplicates(user_id, limit)
+        if result["success"]:
+            logger.info("Duplicate report for user %s: %d groups", user_id,
+                        result["total_groups"])
+        else:
+            logger.warning("Failed to find duplicates for user %s: %s", user_id,
+                           result["message"])
+        return result
+    except Exception as e:
+        logger.error("Failed to find duplicates for user %s: %s", user_id, e)
+        raise
+    finally:
+        book_service.close()
+
+def get_library_version(user_id: int, db: Session = None):
+    book_service = get_book_service(db, user_id)
+    try:
+        result = book_service.get_library_version(user_id)
+        if not result["success"]:
+            logger.warning("Failed to read library version for user %s: %s", user_id,
+                           result["message"])
+        return result
     except Exception as e:
-        logger.error(f"Failed to search books for user {user_id} with query '{search_query}': {e}")
+        logger.error("Failed to read library version for user %s: %s", user_id, e)
         raise
     finally:
-        book_service.db.close()
+        book_service.close()
 
-def get_library_summary(user_id: int):
-    book_service = get_book_service()
+def get_library_summary(user_id: int, db: Session = None):
+    book_service = get_book_service(db, user_id)
     try:
         summary = book_service.get_library_summary(user_id)
-        logger.info(f"Library summary for user {user_id}: {summary['total_books']} total books")
+        logger.info("Library summary for user %s: %d total books", user_id,
+                    summary["total_books"], extra=SAMPLED)
         return summary
     except Exception as e:
-        logger.error(f"Failed to get library summary for user {user_id}: {e}")
+        logger.error("Failed to get library summary for user %s: %s", user_id, e)
         raise
     finally:
-        book_service.db.close()
+        book_service.close()
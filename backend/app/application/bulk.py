@@ -0,0 +1,152 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, Iterator
+
+from app.config import settings
+
+# Streaming parsers for bulk book payloads. Both yield (row_number, record) pairs as
+# soon as a complete record has arrived, where record is a dict of fields or a
+# ValueError describing why the row could not be parsed. Memory stays bounded by
+# BULK_IMPORT_MAX_RECORD_CHARS: a line or record growing past it (a body without
+# newlines, an unbalanced CSV quote swallowing the rest of the upload) aborts the import
+# with RecordTooLarge.
+
+
+class RecordTooLarge(ValueError):
+    pass
+
+
+def _check_size(text: str, row_number: int):
+    if len(text) > settings.BULK_IMPORT_MAX_RECORD_CHARS:
+        raise RecordTooLarge(f"Row {row_number} is longer than "
+                             f"{settings.BULK_IMPORT_MAX_RECORD_CHARS} characters")
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    line_number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_number += 1
+            _check_size(line, line_number)
+            yield line + "\n"
+        _check_size(pending, line_number + 1)
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]):
+    row_number = 0
+    async for line in _iter_lines(chunks):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield row_number, ValueError("Each line must be a JSON object")
+            continue
+        yield row_number, record
+
+
+async def parse_csv(chunks: AsyncIterator[bytes]):
+    header = None
+    row_number = 0
+    record_text = ""
+    async for line in _iter_lines(chunks):
+        # Quoted fields may span lines; a record is complete once its
+        # quotes are balanced
+        record_text += line
+        if record_text.count('"') % 2:
+            _check_size(record_text, row_number + 1)
+            continue
+        text, record_text = record_text, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, ValueError(f"Expected {len(header)} columns, got "
+                                         f"{len(values)}")
+            continue
+        # Empty CSV cells mean "not provided" for the optional fields
+        yield row_number, {name: value for name, value in zip(header, values)
+                           if value != ""}
+    if record_text.strip():
+        yield row_number + 1, ValueError("Unterminated quoted field")
+
+
+PARSERS = {
+    "csv": parse_csv,
+    "ndjson": parse_ndjson,
+}
+
+
+# Export columns, in the order BookService.iter_books_for_export selects them
+EXPORT_COLUMNS = ("id", "title", "author", "publication_date", "isbn", "cover_image",
+                  "created_at", "updated_at")
+EXPORT_BATCH_SIZE = 1000
+
+
+_TEMPORAL_COLUMNS = tuple(EXPORT_COLUMNS.index(name)
+                          for name in ("publication_date", "created_at", "updated_at"))
+
+
+def _export_row(row: tuple) -> list:
+    values = list(row)
+    for index in _TEMPORAL_COLUMNS:
+        if values[index] is not None:
+            values[index] = values[index].isoformat()
+    return values
+
+
+def _batched(rows: Iterable[tuple]) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def format_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    for batch in _batched(rows):
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, _export_row(row))),
+                       ensure_ascii=False) + "\n"
+            for row in batch
+        )
+
+
+def format_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batched(rows):
+        # csv writes None as an empty cell
+        writer.writerows(_export_row(row) for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+FORMATTERS = {
+    "csv": format_csv,
+    "ndjson": format_ndjson,
+}
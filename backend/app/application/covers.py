@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.application.jobs import job_handler
+from app.config import settings
+from app.domain.covers import THUMBNAIL_JOB, THUMBNAIL_SIZES, cover_store
+
+logger = logging.getLogger(__name__)
+
+# Cover validation and thumbnail resizing are CPU-bound, so they run on a small worker
+# pool (Pillow releases the GIL while decoding, resampling and encoding). Thumbnails are
+# generated by a background job after an upload, or on the first request for a size that
+# does not exist yet; concurrent requests for the same thumbnail wait on a single job.
+cover_pool = {"executor": None}
+thumbnail_jobs = {}
+thumbnail_stats = {"in_flight": 0, "generated": 0, "failed": 0}
+
+
+def _get_cover_pool() -> ThreadPoolExecutor:
+    if cover_pool["executor"] is None:
+        cover_pool["executor"] = ThreadPoolExecutor(
+            max_workers=settings.COVER_THUMBNAIL_WORKERS, thread_name_prefix="cover")
+    return cover_pool["executor"]
+
+
+# Validate and store uploaded bytes; returns the cover id (raises
+# ValueError for non-images)
+async def store_cover(data: bytes) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_cover_pool(), cover_store.save, data)
+
+
+async def _generate_thumbnail(cover_id: str, size: str) -> str:
+    thumbnail_stats["in_flight"] += 1
+    try:
+        path = await asyncio.get_running_loop().run_in_executor(
+            _get_cover_pool(), cover_store.make_thumbnail, cover_id, size)
+        thumbnail_stats["generated"] += 1
+        return path
+    except Exception:
+        thumbnail_stats["failed"] += 1
+        raise
+    finally:
+        thumbnail_stats["in_flight"] -= 1
+
+
+def _thumbnail_job(cover_id: str, size: str) -> asyncio.Task:
+    key = (cover_id, size)
+    job = thumbnail_jobs.get(key)
+    if job is None:
+        job = asyncio.ensure_future(_generate_thumbnail(cover_id, size))
+        thumbnail_jobs[key] = job
+        job.add_done_callback(lambda _: thumbnail_jobs.pop(key, None))
+    return job
+
+
+# Path of a thumbnail, generating it first if needed
+async def ensure_thumbnail(cover_id: str, size: str) -> str:
+    if cover_store.exists(cover_id, size):
+        return cover_store.path(cover_id, size)
+    # shield: a client disconnecting must not cancel a job other requests
+    # may be waiting on
+    return await asyncio.shield(_thumbnail_job(cover_id, size))
+
+
+# Job handler: every thumbnail size of each new cover (covers deleted since are skipped)
+@job_handler(THUMBNAIL_JOB)
+def generate_thumbnails(payloads: list):
+    for cover_id in {payload["cover_id"] for payload in payloads}:
+        if not cover_store.exists(cover_id):
+            continue
+        for size in THUMBNAIL_SIZES:
+            if not cover_store.exists(cover_id, size):
+                cover_store.make_thumbnail(cover_id, size)
+
+
+def shutdown_cover_pool():
+    if cover_pool["executor"] is not None:
+        cover_pool["executor"].shutdown(wait=False, cancel_futures=True)
+    cover_pool["executor"] = None
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.domain.db import shard_engines, shard_for_user
+from app.domain.jobs import claim_jobs, complete_jobs, fail_jobs, job_counts, user_jobs
+
+logger = logging.getLogger(__name__)
+
+# kind -> handler(payloads). Handlers are plain functions run in the threadpool,
+# given the payloads of every job of their kind claimed in one batch, and must be
+# safe to run twice.
+job_handlers = {}
+
+# Counters for /health and /metrics; only updated on the event loop. Failure details
+# stay in the log and the job rows: their text can name another user's books.
+job_stats = {"workers": 0, "in_flight": 0, "completed": 0, "retried": 0, "failed": 0}
+
+# The worker tasks, and the event that wakes them when a write enqueued something
+job_workers = {"tasks": [], "wake": None}
+
+
+def job_handler(kind: str):
+    def register(handler):
+        job_handlers[kind] = handler
+        return handler
+    return register
+
+
+# Called after a write that enqueued jobs has committed, so they run now instead of
+# at the next poll
+def notify_job_workers():
+    if job_workers["wake"] is not None:
+        job_workers["wake"].set()
+
+
+async def _run_jobs(shard_engine, kind: str, jobs: list):
+    # jobs: (id, payload, attempts), claimed from shard_engine. A failing batch is
+    # retried one job at a time, so one bad payload only holds back (and
+    # eventually fails) itself.
+    handler = job_handlers.get(kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {kind!r}")
+        job_stats["in_flight"] += len(jobs)
+        try:
+            await run_in_threadpool(handler, [payload for _, payload, _ in jobs])
+        finally:
+            job_stats["in_flight"] -= len(jobs)
+    except Exception as e:
+        if len(jobs) > 1:
+            for job in jobs:
+                await _run_jobs(shard_engine, kind, [job])
+            return
+        job_id, _, attempts = jobs[0]
+        given_up = await run_in_threadpool(fail_jobs, shard_engine,
+                                           [(job_id, attempts)],
+                                           f"{type(e).__name__}: {e}")
+        job_stats["failed" if given_up else "retried"] += 1
+        logger.error("Job %s (%s, attempt %d) failed%s: %s", job_id, kind, attempts,
+                     "; giving up" if given_up else "", e)
+        return
+    await run_in_threadpool(complete_jobs, shard_engine,
+                            [job_id for job_id, _, _ in jobs])
+    job_stats["completed"] += len(jobs)
+
+
+async def job_worker():
+    wake = job_workers["wake"]
+    while True:
+        try:
+            # Cleared before claiming: a notification arriving during the
+            # claim is not lost
+            wake.clear()
+            # Each shard has its own outbox, written in the same
+            # transactions as its books
+            claimed = False
+            for shard_engine in shard_engines:
+                jobs = await run_in_threadpool(claim_jobs, shard_engine,
+                                               settings.JOB_BATCH_SIZE)
+                claimed = claimed or bool(jobs)
+                by_kind = defaultdict(list)
+                for job_id, kind, payload, attempts in jobs:
+                    by_kind[kind].append((job_id, payload, attempts))
+                for kind, batch in by_kind.items():
+                    await _run_jobs(shard_engine, kind, batch)
+            if not claimed:
+                try:
+                    await asyncio.wait_for(wake.wait(),
+                                           settings.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Database unavailable and the like: jobs claimed so far are retried when
+            # their lease ends
+            logger.error("Job worker error: %s", e)
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL_SECONDS)
+
+
+# Jobs per status and kind summed over the shards, for /metrics
+def queue_status() -> list:
+    counts = {}
+    for shard_engine in shard_engines:
+        for entry in job_counts(shard_engine):
+            key = (entry["status"], entry["kind"])
+            counts[key] = counts.get(key, 0) + entry["count"]
+    return [{"status": status, "kind": kind, "count": count}
+            for (status, kind), count in counts.items()]
+
+
+# The caller's jobs, from the outbox of their shard (where their writes queue them)
+def get_user_jobs(user_id: int, limit: int = 20, job_id: int = None) -> list:
+    return user_jobs(shard_engines[shard_for_user(user_id)], user_id, limit, job_id)
+
+
+# JOB_WORKERS workers, each running one batch at a time. Jobs left over from a
+# previous run are picked up by the first claims (ones that were running once their
+# lease runs out).
+def start_job_workers():
+    if settings.JOB_WORKERS <= 0 or job_workers["tasks"]:
+        return
+    loop = asyncio.get_running_loop()
+    job_workers["wake"] = asyncio.Event()
+    job_workers["tasks"] = [loop.create_task(job_worker())
+                            for _ in range(settings.JOB_WORKERS)]
+    job_stats["workers"] = settings.JOB_WORKERS
+
+
+async def stop_job_workers():
+    tasks, job_workers["tasks"] = job_workers["tasks"], []
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    job_workers["wake"] = None
+    job_stats["workers"] = 0
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, every process runs its own maintenance cycles
+    fcntl = None
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.domain.book import BookService
+from app.domain.covers import cover_store
+from app.domain.db import shard_engines
+from app.domain.jobs import purge_finished_jobs
+from app.domain.maintenance import analyze, storage_stats, vacuum
+
+logger = logging.getLogger(__name__)
+
+# Counters for /health; only updated by the maintenance cycle
+maintenance_stats = {
+    "runs": 0,
+    "skipped": 0,
+    "failures": 0,
+    "rows_purged": 0,
+    "covers_removed": 0,
+    "jobs_purged": 0,
+    "vacuums": 0,
+    "bytes_reclaimed": 0,
+    "last_run_at": None,
+    "last_run_seconds": 0.0,
+    "database_bytes": None,
+    "free_bytes": None,
+}
+
+# The background asyncio task running maintenance_loop, if started
+maintenance_task = {"task": None}
+
+
+def tombstone_cutoff() -> datetime:
+    return datetime.now() - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+
+
+def purge_deleted_books(deleted_before: datetime, batch_size: int) -> int:
+    # Each batch is its own short transaction so regular writes
+    # interleave with the purge
+    purged = 0
+    for shard in range(len(shard_engines)):
+        while True:
+            book_service = BookService(shard=shard)
+            try:
+                result = book_service.purge_deleted_books(deleted_before, batch_size)
+            finally:
+                book_service.close()
+            if not result["success"]:
+                raise RuntimeError(result["message"])
+            purged += result["purged"]
+            if result["purged"] < batch_size:
+                break
+    return purged
+
+
+def purge_unreferenced_covers(older_than: float, batch_size: int) -> int:
+    # Stored covers no book points at any more (replaced, removed, or their books
+    # purged). Only files older than the grace period are candidates, so a cover
+    # uploaded moments ago is never deleted before its book row commits.
+    removed = 0
+    candidates = cover_store.iter_cover_ids(older_than)
+    while True:
+        batch = list(islice(candidates, batch_size))
+        if not batch:
+            return removed
+        # The blob store is shared: a cover is only unreferenced when no shard uses it
+        referenced = set()
+        for shard in range(len(shard_engines)):
+            book_service = BookService(shard=shard)
+            try:
+                result = book_service.referenced_cover_ids(batch)
+            finally:
+                book_service.close()
+            if not result["success"]:
+                raise RuntimeError(result["message"])
+            referenced |= result["data"]
+        removed += sum(cover_store.remove(cover_id, older_than) for cover_id in batch
+                       if cover_id not in referenced)
+
+
+def compact_shard(shard_engine) -> dict:
+    # ANALYZE, then VACUUM once enough of the file is free; returns the storage stats
+    # after
+    analyze(shard_engine)
+    storage = storage_stats(shard_engine)
+    if storage and storage["database_bytes"] and \
+            storage["free_bytes"] / storage["database_bytes"] >= \
+            settings.SQLITE_VACUUM_MIN_FREE_RATIO:
+        vacuum(shard_engine)
+        after = storage_stats(shard_engine)
+        reclaimed = storage["database_bytes"] - after["database_bytes"]
+        maintenance_stats["vacuums"] += 1
+        maintenance_stats["bytes_reclaimed"] += reclaimed
+        logger.info("VACUUM reclaimed %d bytes", reclaimed)
+        storage = after
+    return storage
+
+
+@contextmanager
+def maintenance_lock(min_interval: float):
+    # With several worker processes (gunicorn.conf.py) each runs the maintenance loop;
+    # the lock file lets one of them run a cycle at a time and records when the last one
+    # finished, so the others skip theirs. Yields whether this process should run.
+    if fcntl is None or not settings.MAINTENANCE_LOCK_FILE:
+        yield True
+        return
+    with open(settings.MAINTENANCE_LOCK_FILE, "a+") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            lock_file.seek(0)
+            last_run = float(lock_file.read() or 0)
+            if time.time() - last_run < min_interval:
+                yield False
+                return
+            yield True
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(str(time.time()))
+            lock_file.flush()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_maintenance(min_interval: float = 0):
+    with maintenance_lock(min_interval) as should_run:
+        if not should_run:
+            maintenance_stats["skipped"] += 1
+            return
+        _run_maintenance()
+
+
+def _run_maintenance():
+    started = time.perf_counter()
+    try:
+        purged = purge_deleted_books(tombstone_cutoff(), settings.PURGE_BATCH_SIZE)
+        grace_seconds = settings.COVER_ORPHAN_GRACE_HOURS * 3600
+        covers_removed = purge_unreferenced_covers(time.time() - grace_seconds,
+                                                   settings.PURGE_BATCH_SIZE)
+        maintenance_stats["covers_removed"] += covers_removed
+        jobs_purged = 0
+        database_bytes = free_bytes = None
+        for shard_engine in shard_engines:
+            jobs_purged += purge_finished_jobs(
+                shard_engine,
+                datetime.now() - timedelta(hours=settings.JOB_RETENTION_HOURS),
+                settings.PURGE_BATCH_SIZE)
+            storage = compact_shard(shard_engine)
+            if storage:
+                database_bytes = (database_bytes or 0) + storage["database_bytes"]
+                free_bytes = (free_bytes or 0) + storage["free_bytes"]
+        maintenance_stats["jobs_purged"] += jobs_purged
+
+        maintenance_stats["rows_purged"] += purged
+        # Summed over the shards
+        maintenance_stats["database_bytes"] = database_bytes
+        maintenance_stats["free_bytes"] = free_bytes
+        logger.info("Maintenance: purged %d soft-deleted books older than %d days, "
+                    "%d unreferenced covers and %d finished jobs", purged,
+                    settings.TOMBSTONE_RETENTION_DAYS, covers_removed, jobs_purged)
+    except Exception as e:
+        maintenance_stats["failures"] += 1
+        logger.error("Maintenance run failed: %s", e)
+    finally:
+        maintenance_stats["runs"] += 1
+        maintenance_stats["last_run_at"] = datetime.now().isoformat()
+        maintenance_stats["last_run_seconds"] = time.perf_counter() - started
+
+
+async def maintenance_loop():
+    # First run shortly after startup, so short-lived processes still purge
+    delay = min(settings.MAINTENANCE_INTERVAL_SECONDS, 60)
+    while True:
+        await asyncio.sleep(delay)
+        # Skipped when another process ran a cycle in the last half interval
+        await run_in_threadpool(run_maintenance,
+                                settings.MAINTENANCE_INTERVAL_SECONDS / 2)
+        delay = settings.MAINTENANCE_INTERVAL_SECONDS
+
+
+def start_maintenance():
+    if settings.MAINTENANCE_INTERVAL_SECONDS > 0 and maintenance_task["task"] is None:
+        loop = asyncio.get_running_loop()
+        maintenance_task["task"] = loop.create_task(maintenance_loop())
+
+
+async def stop_maintenance():
+    task, maintenance_task["task"] = maintenance_task["task"], None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+# Run one maintenance cycle by hand (from backend/):
+#     python -m app.application.maintenance
+if __name__ == "__main__":
+    import app.main  # noqa: F401  (models, logging and init_db come with the app)
+    from app.domain.db import init_db
+
+    init_db()
+    run_maintenance()
+    print(maintenance_stats)
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.domain.db import replica_engines, replica_sets
+from app.domain.replicas import check_replica
+
+logger = logging.getLogger(__name__)
+
+# The background asyncio task running replica_health_loop, if started
+replica_task = {"task": None}
+
+
+def check_replicas():
+    # The sync engines stand for the async ones too: both connect to the same databases
+    for replica_set, engines in zip(replica_sets, replica_engines):
+        for index, replica_engine in enumerate(engines):
+            healthy, lag = check_replica(replica_engine)
+            replica_set.mark(index, healthy, lag)
+
+
+def replica_status() -> list:
+    return [replica for replica_set in replica_sets for replica in replica_set.status()]
+
+
+async def replica_health_loop():
+    while True:
+        try:
+            await run_in_threadpool(check_replicas)
+        except Exception as e:
+            logger.error("Replica health check failed: %s", e)
+        await asyncio.sleep(settings.REPLICA_HEALTH_CHECK_SECONDS)
+
+
+def start_replica_checks():
+    if any(engines for engines in replica_engines) and replica_task["task"] is None:
+        loop = asyncio.get_running_loop()
+        replica_task["task"] = loop.create_task(replica_health_loop())
+
+
+async def stop_replica_checks():
+    task, replica_task["task"] = replica_task["task"], None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -18,8 +18,184 @@ class Settings:
     # Algorithm for JWT
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
 
-    # Database URL
+    # Database URL (sqlite:///path or postgresql://...; Postgres needs psycopg2, plus
+    # asyncpg for async mode)
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+    # Shard databases, comma-separated in shard order ("" keeps everything in
+    # DATABASE_URL): each user and their books live in the one their id hashes to.
+    # Changing the list needs python -m app.domain.sharding rebalance first. ISBNs
+    # are then unique per shard, not across every user: users on different shards may
+    # hold the same one.
+    DATABASE_SHARD_URLS: str = os.getenv("DATABASE_SHARD_URLS", "")
+    # Read replicas per shard, "url,url;url,url" in shard order ("" reads everything
+    # from the primaries): library, book, search and summary GETs read from one of
+    # them, round-robin
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    # How often replicas are health-checked, and the most a Postgres standby may lag
+    # behind
+    REPLICA_HEALTH_CHECK_SECONDS: float = float(
+        os.getenv("REPLICA_HEALTH_CHECK_SECONDS", 10))
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 30))
+    # After a user's write commits, their reads in this process stay on the primary
+    # this long
+    REPLICA_READ_YOUR_WRITES_SECONDS: float = float(
+        os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", 10))
+
+    # SQLite connection profile: "tuned" (WAL, synchronous=NORMAL, mmap, larger page
+    # cache) or "default"
+    SQLITE_PROFILE: str = os.getenv("SQLITE_PROFILE", "tuned")
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", 268435456))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", 65536))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+    # Connection pool (per engine)
+    DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", 5))
+    DATABASE_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+    DATABASE_POOL_TIMEOUT: int = int(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+    DATABASE_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))
+    DATABASE_POOL_PRE_PING: bool = os.getenv("DATABASE_POOL_PRE_PING",
+                                             "true").lower() in ("1", "true", "yes")
+
+    # Use the async engine (aiosqlite, or asyncpg for Postgres) for API database calls
+    DATABASE_ASYNC: bool = os.getenv("DATABASE_ASYNC", "false").lower() in (
+        "1", "true", "yes")
+
+    # Password hashing: scheme for new hashes ("bcrypt", or "argon2" with
+    # argon2-cffi installed)
+    PASSWORD_HASH_SCHEME: str = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    # Worker pool for hashing/verification ("thread" or "process") and its
+    # concurrency limit
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS",
+                                               os.cpu_count() or 1))
+    # Jobs allowed to wait for a worker before requests are rejected with
+    # 503 (0 = unbounded)
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 0))
+    # Re-hash passwords stored with an outdated scheme or cost on successful login
+    PASSWORD_REHASH_ON_LOGIN: bool = os.getenv("PASSWORD_REHASH_ON_LOGIN",
+                                               "false").lower() in ("1", "true", "yes")
+
+    # Soft-deleted books can be restored for this many days, then the
+    # maintenance job purges them
+    TOMBSTONE_RETENTION_DAYS: int = int(os.getenv("TOMBSTONE_RETENTION_DAYS", 30))
+    # Background maintenance (tombstone purge, SQLite ANALYZE/VACUUM);
+    # interval 0 disables it
+    MAINTENANCE_INTERVAL_SECONDS: int = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS",
+                                                      3600))
+    # Tombstones hard-deleted per transaction, so the purge never holds the
+    # write lock for long
+    PURGE_BATCH_SIZE: int = int(os.getenv("PURGE_BATCH_SIZE", 500))
+    # VACUUM the SQLite file once at least this fraction of its pages are free
+    SQLITE_VACUUM_MIN_FREE_RATIO: float = float(
+        os.getenv("SQLITE_VACUUM_MIN_FREE_RATIO", 0.2))
+    # Lock file shared by the worker processes of one deployment, so only one of them
+    # runs each maintenance cycle ("" lets every process run its own)
+    MAINTENANCE_LOCK_FILE: str = os.getenv("MAINTENANCE_LOCK_FILE",
+                                           "./maintenance.lock")
+
+    # Verified access tokens cached per process by get_current_user (size 0
+    # disables the cache)
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+    TOKEN_CACHE_TTL_SECONDS: int = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+    # Trust the user id embedded in access tokens instead of looking the user up at all
+    AUTH_TRUST_TOKEN_USER_ID: bool = os.getenv("AUTH_TRUST_TOKEN_USER_ID",
+                                               "false").lower() in ("1", "true", "yes")
+
+    # Cover images: content-addressed blob store directory, upload size limit and
+    # thumbnail workers
+    COVER_STORAGE_DIR: str = os.getenv("COVER_STORAGE_DIR", "./covers")
+    COVER_MAX_BYTES: int = int(os.getenv("COVER_MAX_BYTES", 5 * 1024 * 1024))
+    COVER_THUMBNAIL_WORKERS: int = int(os.getenv("COVER_THUMBNAIL_WORKERS",
+                                                 os.cpu_count() or 1))
+    # nginx "internal" location aliased to COVER_STORAGE_DIR (e.g. /_covers/): when set,
+    # cover files are handed to nginx with X-Accel-Redirect and sent with sendfile
+    # instead of by the app
+    COVER_ACCEL_REDIRECT_PREFIX: str = os.getenv("COVER_ACCEL_REDIRECT_PREFIX", "")
+    # Stored covers no book references are deleted by maintenance once they are this old
+    COVER_ORPHAN_GRACE_HOURS: int = int(os.getenv("COVER_ORPHAN_GRACE_HOURS", 24))
+
+    # Longest line or record accepted by the bulk import (characters); larger ones abort
+    # the upload with 413. The default leaves room for an inline cover of
+    # COVER_MAX_BYTES.
+    BULK_IMPORT_MAX_RECORD_CHARS: int = int(
+        os.getenv("BULK_IMPORT_MAX_RECORD_CHARS", 8 * 1024 * 1024))
+
+    # Token-bucket rate limits checked before any auth, password or database work
+    # ("" disables), as "<name>: <METHOD|*> <path globs> <rate> by <ip|user>; ..." where
+    # <path globs> is comma-separated ("!" excludes) and <rate> is
+    # "<count>/<second|minute|hour|day> [burst <n>]". "by user" keys on the access
+    # token's user (the client IP when there is no valid token). Every matching rule
+    # applies; the auth routes have their own and are left out of the catch-all.
+    RATE_LIMIT_RULES: str = os.getenv(
+        "RATE_LIMIT_RULES",
+        "login: POST /api/v1/login 20/minute burst 10 by ip; "
+        "signup: POST /api/v1/signup 5/hour burst 5 by ip; "
+        "refresh: POST /api/v1/refresh-token 30/minute by ip; "
+        "api: * /api/v1/*,!/api/v1/login,!/api/v1/signup,!/api/v1/refresh-token "
+        "1200/minute burst 200 by user")
+    # Login attempts per username from one client address ("" disables). Keyed by both,
+    # so failed logins sent from elsewhere can't lock the account's owner out.
+    RATE_LIMIT_LOGIN_PER_USERNAME: str = os.getenv("RATE_LIMIT_LOGIN_PER_USERNAME",
+                                                   "10/minute burst 5")
+    # "memory" (per process) or "redis" (shared by all workers; needs the redis package)
+    RATE_LIMIT_STORE: str = os.getenv("RATE_LIMIT_STORE", "memory")
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+    # Reverse proxies in front of the app that append to X-Forwarded-For (0: use
+    # the peer address)
+    FORWARDED_PROXY_HOPS: int = int(os.getenv("FORWARDED_PROXY_HOPS", 0))
+
+    # ISBN metadata used to fill in missing title/author/publication date: "catalog"
+    # (the local file built with python -m app.domain.isbn_catalog) or "none"
+    ISBN_METADATA_PROVIDER: str = os.getenv("ISBN_METADATA_PROVIDER", "catalog")
+    ISBN_CATALOG_PATH: str = os.getenv("ISBN_CATALOG_PATH", "./isbn_catalog.db")
+    # Lookups cached per process; ISBNs the provider doesn't know are
+    # retried after the TTL
+    ISBN_CACHE_SIZE: int = int(os.getenv("ISBN_CACHE_SIZE", 100000))
+    ISBN_NEGATIVE_CACHE_TTL_SECONDS: int = int(
+        os.getenv("ISBN_NEGATIVE_CACHE_TTL_SECONDS", 3600))
+
+    # Duplicate detection: two books of a user are duplicates when their normalized
+    # titles have at least this trigram similarity (0-1) and their authors share a name.
+    # With warn-on-insert, POST /books lists likely duplicates of the new book in the
+    # X-Possible-Duplicates header.
+    DUPLICATE_SIMILARITY_THRESHOLD: float = float(
+        os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", 0.6))
+    DUPLICATE_WARN_ON_INSERT: bool = os.getenv("DUPLICATE_WARN_ON_INSERT",
+                                               "false").lower() in ("1", "true", "yes")
+    # Keep the trigger-maintained bucket index (SQLite): every book write also writes
+    # its bucket keys. Without it the report and insert check bucket the whole library
+    # in memory per request.
+    DUPLICATE_INDEX: bool = os.getenv("DUPLICATE_INDEX",
+                                      "true").lower() in ("1", "true", "yes")
+
+    # Background jobs (follow-up work recorded in the background_jobs outbox): worker
+    # tasks per process (0 leaves jobs queued), jobs claimed per batch, and how often
+    # idle workers poll
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", 2))
+    JOB_BATCH_SIZE: int = int(os.getenv("JOB_BATCH_SIZE", 50))
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 5))
+    # A claimed job is retried by another worker if not finished within the lease
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", 300))
+    # Failed jobs retry after base * 2^(attempt - 1) seconds (capped) until
+    # JOB_MAX_ATTEMPTS
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+    JOB_RETRY_BASE_SECONDS: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", 2))
+    JOB_RETRY_MAX_SECONDS: float = float(os.getenv("JOB_RETRY_MAX_SECONDS", 600))
+    # Done and failed jobs are kept this long, then purged by maintenance
+    JOB_RETENTION_HOURS: int = int(os.getenv("JOB_RETENTION_HOURS", 24))
+
+    # Logging: root level, per-logger overrides
+    # ("app.domain.auth=WARNING,sqlalchemy.engine=INFO"), "json" or "text" output, and
+    # whether records are written by a background thread
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_QUEUE: bool = os.getenv("LOG_QUEUE", "true").lower() in ("1", "true", "yes")
+    # Fraction of high-frequency INFO/DEBUG messages (marked SAMPLED) that are
+    # written (0 drops them)
+    LOG_SAMPLE_RATE: float = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
 
 
 settings = Settings()
@@ -2,81 +2,116 @@ import logging
 from datetime import datetime
 
 from sqlalchemy.orm import Session
-from app.domain.db import SessionLocal
 
+from app.domain.db import (
+    SHARD_URLS,
+    SessionLocal,
+    shard_for_user,
+    use_shard,
+    user_lookup_shards,
+)
+from app.domain.sharding import new_user_id
+from app.domain.token_cache import token_cache
+from app.logging_config import SAMPLED
 from app.models.user import User
 
 logger = logging.getLogger(__name__)
 
 class DatabaseService:
-    def __init__(self):
-        self.db: Session = SessionLocal()
+    def __init__(self, db: Session = None):
+        # Services either share a request-scoped session or own one they must close
+        self.owns_session = db is None
+        self.db: Session = db if db is not None else SessionLocal()
+
+    def close(self):
+        if self.owns_session:
+            self.db.close()
+
+    def _find_user(self, condition, user_id=None, username: str = None):
+        # Accounts live on the shard of their id; lookups by username or email try the
+        # shards in turn (the username's home shard first) and leave the session on
+        # the user's shard
+        for shard in user_lookup_shards(user_id, username):
+            use_shard(self.db, shard)
+            user = self.db.query(User).filter(condition).first()
+            if user is not None:
+                return user
+        return None
 
     def create_user(self, username: str, email: str, hashed_password: str):
         try:
-            db_user = User(username=username, email=email, hashed_password=hashed_password, created_at=datetime.now(),
-                updated_at=datetime.now())
+            user_id = new_user_id(username, len(SHARD_URLS))
+            use_shard(self.db, shard_for_user(user_id))
+            db_user = User(id=user_id, username=username, email=email,
+                           hashed_password=hashed_password,
+                           created_at=datetime.now(), updated_at=datetime.now())
             self.db.add(db_user)
             self.db.commit()
             self.db.refresh(db_user)
-            logger.info(f"User {username} created successfully.")
+            logger.info("User %s created successfully.", username)
             return db_user
         except Exception as e:
-            logger.error(f"Failed to create user {username}: {e}")
+            logger.error("Failed to create user %s: %s", username, e)
             self.db.rollback()
             raise
 
-    def get_user_by_username(self, username: str):
+    def get_user_by_username(self, username: str, user_id=None):
         try:
-            user = self.db.query(User).filter(User.username == username).first()
+            user = self._find_user(User.username == username, user_id, username)
             if user:
-                logger.info(f"User {username} found.")
+                logger.info("User %s found.", username, extra=SAMPLED)
             else:
-                logger.warning(f"User {username} not found.")
+                logger.warning("User %s not found.", username)
             return user
         except Exception as e:
-            logger.error(f"Error retrieving user {username}: {e}")
+            logger.error("Error retrieving user %s: %s", username, e)
             raise
 
     def get_user_by_email(self, email: str):
         try:
-            user = self.db.query(User).filter(User.email == email).first()
+            user = self._find_user(User.email == email)
             if user:
-                logger.info(f"User with email {email} found.")
+                logger.info("User with email %s found.", email, extra=SAMPLED)
             else:
-                logger.warning(f"User with email {email} not found.")
+                logger.warning("User with email %s not found.", email)
             return user
         except Exception as e:
-            logger.error(f"Error retrieving user with email {email}: {e}")
+            logger.error("Error retrieving user with email %s: %s", email, e)
             raise
 
     def update_username(self, old_username: str, new_username: str):
         try:
-            user = self.db.query(User).filter(User.username == old_username).first()
+            # Checked first: the lookup moves the session across shards
+            if self.get_user_by_username(new_username):
+                logger.warning("New username %s is already taken.", new_username)
+                raise
+            user = self._find_user(User.username == old_username, username=old_username)
             if user:
-                if self.get_user_by_username(new_username):
-                    logger.warning(f"New username {new_username} is already taken.")
-                    raise
                 user.username = new_username
                 self.db.commit()
-                logger.info(f"Username updated from {old_username} to {new_username}.")
+                # Cached tokens for the old username must be looked up again
+                token_cache.invalidate_user(old_username)
+                logger.info("Username updated from %s to %s.", old_username,
+                            new_username)
             else:
-                logger.warning(f"User with username {old_username} not found.")
+                logger.warning("User with username %s not found.", old_username)
         except Exception as e:
-            logger.error(f"Failed to update username from {old_username} to {new_username}: {e}")
+            logger.error("Failed to update username from %s to %s: %s", old_username,
+                         new_username, e)
             self.db.rollback()
             raise
 
     def update_password(self, username: str, new_hashed_password: str):
         try:
-            user = self.db.query(User).filter(User.username == username).first()
+            user = self._find_user(User.username == username, username=username)
             if user:
                 user.hashed_password = new_hashed_password
                 self.db.commit()
-                logger.info(f"Password updated for user {username}.")
+                token_cache.invalidate_user(username)
+                logger.info("Password updated for user %s.", username)
             else:
-                logger.warning(f"User with username {username} not found.")
+                logger.warning("User with username %s not found.", username)
         except Exception as e:
-            logger.error(f"Failed to update password for user {username}: {e}")
+            logger.error("Failed to update password for user %s: %s", username, e)
             self.db.rollback()
             raise
@@ -1,24 +1,132 @@
-from sqlite3 import IntegrityError
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, desc
+import base64
+import json
+import uuid
 from datetime import datetime
 
-from app.domain.db import SessionLocal
+from sqlalchemy import (
+    and_,
+    delete,
+    desc,
+    insert,
+    literal_column,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.domain.covers import THUMBNAIL_JOB, store_inline_cover
+from app.domain.db import SessionLocal, shard_for_user, use_shard
+from app.domain.duplicates import (
+    book_profile,
+    group_duplicates,
+    indexed_buckets,
+    indexed_matches,
+    similarity,
+    supports_duplicate_index,
+    title_buckets,
+    title_keys,
+)
+from app.domain.isbn import fill_from_metadata, isbn_metadata, normalize_isbn
+from app.domain.jobs import enqueue_job
+from app.domain.library_stats import count_books, get_library_stats, get_library_version
+from app.domain.search import FTS_TABLE, build_match_query, supports_fts
 from app.models.book import Book
 
+
+def _encode_token(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_token(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+
+# Opaque keyset cursor: the (created_at, id) of the last book on the previous page
+def encode_cursor(created_at: datetime, book_id: str) -> str:
+    return _encode_token([created_at.isoformat(), book_id])
+
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, book_id = _decode_token(cursor)
+        return datetime.fromisoformat(created_at), str(book_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+
+# Opaque search cursor: the (rank, rowid) of the last search hit on the previous page
+def encode_search_cursor(rank: float, rowid: int) -> str:
+    return _encode_token([rank, rowid])
+
+
+def decode_search_cursor(cursor: str):
+    try:
+        rank, rowid = _decode_token(cursor)
+        return float(rank), int(rowid)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid search cursor") from e
+
+
+# A book as the API returns it (BookResponse). Listing queries select these columns as
+# plain rows instead of ORM instances; rows still support attribute access
+# (row.created_at).
+BOOK_COLUMNS = (Book.id, Book.title, Book.author, Book.publication_date, Book.isbn,
+                Book.cover_image, Book.cover_id, Book.created_at, Book.updated_at,
+                Book.is_deleted)
+BOOK_FIELDS = tuple(column.key for column in BOOK_COLUMNS)
+
+MISSING_TITLE_OR_AUTHOR = ("Title and author are required unless the ISBN is in "
+                           "the catalog")
+
+# Ids per IN list when loading candidate duplicates
+DUPLICATE_LOAD_BATCH = 500
+
+
 class BookService:
-    def __init__(self):
-        self.db: Session = SessionLocal()
+    def __init__(self, db: Session = None, user_id=None, shard: int = None):
+        # Services either share a request-scoped session or own one they must close
+        self.owns_session = db is None
+        self.db: Session = db if db is not None else SessionLocal()
+        # A user's books live on their shard; maintenance passes the shard
+        # to work on instead
+        if user_id is not None:
+            shard = shard_for_user(user_id)
+        if shard is not None:
+            use_shard(self.db, shard, user_id)
+
+    def close(self):
+        if self.owns_session:
+            self.db.close()
+
+    def _enqueue_thumbnails(self, user_id: int, cover_ids):
+        # Thumbnails for newly stored covers are made by the job workers, after this
+        # transaction commits
+        for cover_id in sorted(set(filter(None, cover_ids))):
+            enqueue_job(self.db, THUMBNAIL_JOB, {"cover_id": cover_id},
+                        user_id=user_id)
 
     def add_book(self, user_id: int, title: str, author: str, publication_date: str = None, isbn: str = None,
                  cover_image: str = None):
         try:
-            # Check if a book with the same ISBN already exists
+            # Check if a book with the same ISBN already exists (in this database: with
+            # DATABASE_SHARD_URLS, in the user's shard)
             if isbn:
                 existing_book = self.db.query(Book).filter_by(isbn=isbn).first()
                 if existing_book:
                     return {"success": False, "message": "Book with ISBN already exists"}
 
+            # Fill in whatever the user left out from the ISBN catalog
+            if isbn and not (title and author and publication_date):
+                title, author, publication_date = fill_from_metadata(
+                    isbn_metadata.lookup(isbn), title, author, publication_date)
+            if not title or not author:
+                return {"success": False, "message": MISSING_TITLE_OR_AUTHOR}
+
             # Parse publication date if provided
             if publication_date:
                 try:
@@ -26,21 +134,36 @@ class BookService:
                 except ValueError:
                     return {"success": False, "message": "Invalid publication date format"}
 
+            # Inline (data URI) covers go to the blob store; the book keeps a reference
+            try:
+                cover_image, cover_id = store_inline_cover(cover_image)
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
+
+            # Warn-on-insert: existing books this one looks like; it is
+            # created either way
+            possible_duplicates = []
+            if settings.DUPLICATE_WARN_ON_INSERT:
+                possible_duplicates = self._possible_duplicates(user_id, title, author)
+
             new_book = Book(
                 title=title,
                 author=author,
                 publication_date=publication_date,
                 isbn=isbn,
                 cover_image=cover_image,
+                cover_id=cover_id,
                 user_id=user_id,
                 created_at=datetime.now(),
                 updated_at=datetime.now(),
                 is_deleted=False
             )
             self.db.add(new_book)
+            self._enqueue_thumbnails(user_id, [cover_id])
             self.db.commit()
             self.db.refresh(new_book)
-            return {"success": True, "data": new_book}
+            return {"success": True, "data": new_book,
+                    "possible_duplicates": possible_duplicates}
 
         except IntegrityError:
             self.db.rollback()
@@ -48,29 +171,151 @@ class BookService:
         except Exception as e:
             return {"success": False, "message": str(e)}
 
-    def get_books(self, user_id: int, page: int = 1, limit: int = 10):
+    def add_books(self, user_id: int, books: list):
+        # books: (row_number, BookCreate) pairs for one import chunk, inserted in a
+        # single transaction
+        try:
+            isbns = {book.isbn for _, book in books if book.isbn}
+            taken = set()
+            if isbns:
+                existing = self.db.query(Book.isbn).filter(Book.isbn.in_(isbns))
+                taken = {isbn for (isbn,) in existing}
+
+            # One catalog lookup for every row that has blanks to fill
+            incomplete = (book.isbn for _, book in books
+                          if book.isbn and not (book.title and book.author
+                                                and book.publication_date))
+            catalog = isbn_metadata.lookup_many(incomplete)
+
+            errors = []
+            rows = []
+            now = datetime.now()
+            for row_number, book in books:
+                if book.isbn and book.isbn in taken:
+                    errors.append({"row": row_number,
+                                   "message": "Book with ISBN already exists"})
+                    continue
+                title, author, publication_date = fill_from_metadata(
+                    catalog.get(normalize_isbn(book.isbn)), book.title, book.author,
+                    book.publication_date)
+                if not title or not author:
+                    errors.append({"row": row_number,
+                                   "message": MISSING_TITLE_OR_AUTHOR})
+                    continue
+                if publication_date:
+                    try:
+                        publication_date = datetime.strptime(
+                            publication_date, '%Y-%m-%d').date()
+                    except ValueError:
+                        errors.append({"row": row_number,
+                                       "message": "Invalid publication date format"})
+                        continue
+                try:
+                    cover_image, cover_id = store_inline_cover(book.cover_image)
+                except ValueError as e:
+                    errors.append({"row": row_number, "message": str(e)})
+                    continue
+                if book.isbn:
+                    taken.add(book.isbn)
+                rows.append((row_number, {
+                    "id": str(uuid.uuid4()),
+                    "title": title,
+                    "author": author,
+                    "publication_date": publication_date,
+                    "isbn": book.isbn,
+                    "cover_image": cover_image,
+                    "cover_id": cover_id,
+                    "user_id": user_id,
+                    "created_at": now,
+                    "updated_at": now,
+                    "is_deleted": False
+                }))
+
+            if not rows:
+                return {"success": True, "inserted": 0, "errors": errors}
+            try:
+                self.db.execute(insert(Book), [row for _, row in rows])
+                self._enqueue_thumbnails(user_id,
+                                         [row["cover_id"] for _, row in rows])
+                self.db.commit()
+                return {"success": True, "inserted": len(rows), "errors": errors}
+            except IntegrityError:
+                # A concurrent writer took one of the ISBNs; retry row by
+                # row to isolate it
+                self.db.rollback()
+
+            inserted = []
+            for row_number, row in rows:
+                try:
+                    with self.db.begin_nested():
+                        self.db.execute(insert(Book), [row])
+                    inserted.append(row)
+                except IntegrityError:
+                    errors.append({"row": row_number,
+                                   "message": "Book with ISBN already exists"})
+            self._enqueue_thumbnails(user_id, [row["cover_id"] for row in inserted])
+            self.db.commit()
+            errors.sort(key=lambda error: error["row"])
+            return {"success": True, "inserted": len(inserted), "errors": errors}
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": str(e)}
+
+    def get_books(self, user_id: int, page: int = 1, limit: int = 10,
+                  after: tuple = None, include_total: bool = True):
         try:
-            # Calculate offset based on the page number and limit
-            offset = (page - 1) * limit
+            books_query = self.db.query(*BOOK_COLUMNS).filter(Book.user_id == user_id,
+                                                              ~Book.is_deleted)
+            total_books = count_books(self.db, user_id) if include_total else None
 
-            # Query the database with pagination parameters
-            books_query = self.db.query(Book).filter(Book.user_id == user_id, Book.is_deleted == False)
-            total_books = books_query.count()
-            books = books_query.order_by(Book.created_at.desc()).offset(offset).limit(limit).all()
+            ordered_query = books_query.order_by(Book.created_at.desc(), Book.id.desc())
+            if after is not None:
+                # Keyset seek: resume strictly after the last (created_at, id) returned
+                after_created_at, after_id = after
+                ordered_query = ordered_query.filter(or_(
+                    Book.created_at < after_created_at,
+                    and_(Book.created_at == after_created_at, Book.id < after_id)
+                ))
+            else:
+                ordered_query = ordered_query.offset((page - 1) * limit)
 
+            # Fetch one extra row to know whether another page exists
+            books = ordered_query.limit(limit + 1).all()
+            has_more = len(books) > limit
+            books = books[:limit]
+            next_cursor = None
+            if has_more:
+                next_cursor = encode_cursor(books[-1].created_at, books[-1].id)
+
+            total_pages = (total_books + limit - 1) // limit if include_total else None
+            pagination = {
+                "page": page if after is None else None,
+                "limit": limit,
+                "total": total_books,
+                "total_pages": total_pages,
+                "next_cursor": next_cursor
+            }
             return {
                 "success": True,
-                "pagination": {
-                    "page": page,
-                    "limit": limit,
-                    "total": total_books,
-                    "total_pages": (total_books + limit - 1) // limit  # Calculate total pages
-                },
+                "pagination": pagination,
                 "data": books
             }
         except Exception as e:
             return {"success": False, "message": str(e)}
 
+    def iter_books_for_export(self, user_id: int, batch_size: int = 1000):
+        # Plain row tuples streamed from a server-side cursor; no ORM
+        # identity map builds up
+        statement = select(
+            Book.id, Book.title, Book.author, Book.publication_date, Book.isbn,
+            Book.cover_image, Book.created_at, Book.updated_at
+        ).where(
+            Book.user_id == user_id, ~Book.is_deleted
+        ).order_by(Book.created_at.desc(), Book.id.desc())
+        statement = statement.execution_options(yield_per=batch_size)
+        for row in self.db.execute(statement):
+            yield tuple(row)
+
     def get_book_by_id(self, book_id: str, user_id: int):
         try:
             book = self.db.query(Book).filter(Book.id == book_id, Book.user_id == user_id, Book.is_deleted == False).first()
@@ -82,7 +327,8 @@ class BookService:
 
     def update_book(self, book_id: str, user_id: int, title: str = None, author: str = None,
                     publication_date: str = None,
-                    isbn: str = None, cover_image: str = None):
+                    isbn: str = None, cover_image: str = None,
+                    expected_updated_at: datetime = None):
         try:
             # Parse publication date if provided
             if publication_date:
@@ -95,11 +341,40 @@ class BookService:
             if book["success"]:
                 book = book["data"]
 
-                # Check if the new ISBN is already used by another book
+                # Check if the new ISBN is already used by another book (before the
+                # If-Match claim below, so returning here leaves nothing pending)
                 if isbn:
-                    existing_book = self.db.query(Book).filter(Book.isbn == isbn, Book.id != book_id).first()
+                    existing_book = self.db.query(Book).filter(
+                        Book.isbn == isbn, Book.id != book_id).first()
                     if existing_book:
-                        return {"success": False, "message": "ISBN already exists for another book"}
+                        return {"success": False,
+                                "message": "ISBN already exists for another book"}
+
+                # Optimistic concurrency (If-Match): claim the row only if nobody has
+                # written it since the caller read it; the guarded UPDATE also takes the
+                # write lock for this transaction
+                if expected_updated_at is not None:
+                    claimed = self.db.execute(
+                        update(Book).where(Book.id == book_id,
+                                           Book.updated_at == expected_updated_at)
+                        .values(updated_at=datetime.now()).execution_options(synchronize_session=False)
+                    ).rowcount
+                    if not claimed:
+                        self.db.rollback()
+                        return {"success": False,
+                                "message": "Book was modified by another request",
+                                "conflict": True}
+
+                # Inline (data URI) covers go to the blob store only now that the update
+                # is going ahead: a missing book or failed check never leaves a file
+                # behind
+                cover_id = None
+                if cover_image:
+                    try:
+                        cover_image, cover_id = store_inline_cover(cover_image)
+                    except ValueError as e:
+                        self.db.rollback()
+                        return {"success": False, "message": str(e)}
 
                 # Update book details
                 if title:
@@ -110,10 +385,14 @@ class BookService:
                     book.publication_date = publication_date
                 if isbn:
                     book.isbn = isbn
-                if cover_image:
+                # A new cover replaces the old one, whether it is a URL
+                # or an inline image
+                if cover_image or cover_id:
                     book.cover_image = cover_image
+                    book.cover_id = cover_id
                 book.updated_at = datetime.now()
 
+                self._enqueue_thumbnails(user_id, [cover_id])
                 self.db.commit()
                 self.db.refresh(book)
                 return {"success": True, "data": book}
@@ -121,6 +400,8 @@ class BookService:
             return {"success": False, "message": "Book not found"}
 
         except Exception as e:
+            # Also drops an If-Match claim made before the failure
+            self.db.rollback()
             return {"success": False, "message": str(e)}
 
     def delete_book(self, book_id: str, user_id: int):
@@ -136,28 +417,284 @@ class BookService:
         except Exception as e:
             return {"success": False, "message": str(e)}
 
-    def search_books(self, search_query: str):
+    def set_cover(self, book_id: str, user_id: int, cover_id: str = None):
+        # Point the book at a stored cover (None removes it); any
+        # cover_image URL is dropped
+        try:
+            book = self.get_book_by_id(book_id, user_id)
+            if not book["success"]:
+                return book
+            book = book["data"]
+            book.cover_id = cover_id
+            book.cover_image = None
+            book.updated_at = datetime.now()
+            self._enqueue_thumbnails(user_id, [cover_id])
+            self.db.commit()
+            self.db.refresh(book)
+            return {"success": True, "data": book}
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": str(e)}
+
+    def referenced_cover_ids(self, cover_ids: list):
+        # Which of these stored covers some book uses (soft-deleted books included,
+        # since they can be restored)
+        try:
+            referenced = self.db.execute(
+                select(Book.cover_id).where(Book.cover_id.in_(cover_ids)).distinct()).scalars()
+            return {"success": True, "data": set(referenced)}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def get_books_by_ids(self, user_id: int, book_ids: list):
+        try:
+            books = self.db.query(*BOOK_COLUMNS).filter(
+                Book.id.in_(book_ids), Book.user_id == user_id, ~Book.is_deleted).all()
+            by_id = {book.id: book for book in books}
+            return {
+                "success": True,
+                "data": [by_id[book_id] for book_id in book_ids if book_id in by_id],
+                "not_found": [book_id for book_id in book_ids if book_id not in by_id]
+            }
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def _update_live_books(self, user_id: int, book_ids: list, values: dict) -> set:
+        # One set-based UPDATE for the whole batch; RETURNING reports
+        # which ids it matched
+        live = and_(Book.id.in_(book_ids), Book.user_id == user_id, ~Book.is_deleted)
+        statement = update(Book).where(live).values(**values).execution_options(
+            synchronize_session=False)
+        if self.db.get_bind().dialect.update_returning:
+            return set(self.db.execute(statement.returning(Book.id)).scalars())
+        matched = set(self.db.execute(select(Book.id).where(live)).scalars())
+        self.db.execute(statement)
+        return matched
+
+    @staticmethod
+    def _batch_results(book_ids: list, matched: set) -> list:
+        return [{"id": book_id, "success": True} if book_id in matched else
+                {"id": book_id, "success": False, "message": "Book not found"}
+                for book_id in book_ids]
+
+    def update_books(self, user_id: int, book_ids: list, title: str = None,
+                     author: str = None, publication_date: str = None,
+                     cover_image: str = None):
+        try:
+            values = {"title": title, "author": author}
+            if publication_date:
+                try:
+                    values["publication_date"] = datetime.strptime(
+                        publication_date, '%Y-%m-%d').date()
+                except ValueError:
+                    return {"success": False,
+                            "message": "Invalid publication date format"}
+            # Same rule as update_book: empty values leave the field unchanged
+            values = {field: value for field, value in values.items() if value}
+            if not values and not cover_image:
+                return {"success": False, "message": "No changes to apply"}
+            if cover_image:
+                # Nothing is stored for a batch that matches none of the caller's books
+                live = and_(Book.id.in_(book_ids), Book.user_id == user_id,
+                            ~Book.is_deleted)
+                any_live = self.db.execute(select(Book.id).where(live).limit(1)).first()
+                if any_live is None:
+                    return {"success": True,
+                            "results": self._batch_results(book_ids, set())}
+                try:
+                    values["cover_image"], values["cover_id"] = store_inline_cover(
+                        cover_image)
+                except ValueError as e:
+                    return {"success": False, "message": str(e)}
+            values["updated_at"] = datetime.now()
+
+            matched = self._update_live_books(user_id, book_ids, values)
+            if matched:
+                self._enqueue_thumbnails(user_id, [values.get("cover_id")])
+            self.db.commit()
+            return {"success": True, "results": self._batch_results(book_ids, matched)}
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": str(e)}
+
+    def delete_books(self, user_id: int, book_ids: list):
+        try:
+            values = {"is_deleted": True, "updated_at": datetime.now()}
+            matched = self._update_live_books(user_id, book_ids, values)
+            self.db.commit()
+            return {"success": True, "results": self._batch_results(book_ids, matched)}
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": str(e)}
+
+    def restore_book(self, book_id: str, user_id: int, deleted_after: datetime):
+        # Undo a soft delete that is still within the retention window
+        # (not yet purgeable)
+        try:
+            book = self.db.query(Book).filter(
+                Book.id == book_id, Book.user_id == user_id, Book.is_deleted,
+                Book.updated_at >= deleted_after
+            ).first()
+            if not book:
+                return {"success": False,
+                        "message": "Book not found or no longer restorable"}
+            book.is_deleted = False
+            book.updated_at = datetime.now()
+            self.db.commit()
+            self.db.refresh(book)
+            return {"success": True, "data": book}
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": str(e)}
+
+    def purge_deleted_books(self, deleted_before: datetime, batch_size: int):
+        # Hard-delete one batch of tombstones; callers repeat until fewer than
+        # batch_size are purged
+        try:
+            batch = select(Book.id).where(
+                Book.is_deleted, Book.updated_at < deleted_before).limit(batch_size)
+            purged = self.db.execute(
+                delete(Book).where(Book.id.in_(batch)).execution_options(synchronize_session=False)
+            ).rowcount
+            self.db.commit()
+            return {"success": True, "purged": purged}
+        except Exception as e:
+            self.db.rollback()
+            return {"success": False, "message": str(e)}
+
+    def search_books(self, user_id: int, search_query: str, limit: int = 20,
+                     after: tuple = None):
+        try:
+            if not supports_fts(self.db.get_bind()):
+                return self._search_books_like(user_id, search_query, limit)
+
+            match_query = build_match_query(user_id, search_query)
+            if match_query is None:
+                return {"success": True, "data": [], "next_cursor": None}
+
+            # Ranked prefix search on the FTS index; the cursor seeks on (rank, rowid)
+            seek = ""
+            params = {"match": match_query, "limit": limit + 1}
+            if after is not None:
+                seek = ("AND (rank > :after_rank OR "
+                        "(rank = :after_rank AND rowid > :after_rowid))")
+                params["after_rank"], params["after_rowid"] = after
+            matches = self.db.execute(text(f"""
+                SELECT rowid, rank FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH :match {seek}
+                ORDER BY rank, rowid
+                LIMIT :limit
+            """), params).all()
+
+            has_more = len(matches) > limit
+            matches = matches[:limit]
+            rowids = [match.rowid for match in matches]
+            books_by_rowid = {}
+            if rowids:
+                book_rowid = literal_column("books.rowid")
+                rows = self.db.query(*BOOK_COLUMNS, book_rowid).filter(
+                    book_rowid.in_(rowids)).all()
+                books_by_rowid = {row[-1]: row for row in rows}
+
+            books = [books_by_rowid[rowid] for rowid in rowids
+                     if rowid in books_by_rowid]
+            next_cursor = None
+            if has_more:
+                next_cursor = encode_search_cursor(matches[-1].rank, matches[-1].rowid)
+            return {"success": True, "data": books, "next_cursor": next_cursor}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def _search_books_like(self, user_id: int, search_query: str, limit: int):
+        books = self.db.query(*BOOK_COLUMNS).filter(
+            or_(
+                Book.title.ilike(f"%{search_query}%"),
+                Book.author.ilike(f"%{search_query}%")
+            ),
+            Book.user_id == user_id,
+            ~Book.is_deleted
+        ).order_by(Book.created_at.desc()).limit(limit).all()
+        return {"success": True, "data": books, "next_cursor": None}
+
+    def _live_books_by_id(self, user_id: int, book_ids) -> dict:
+        book_ids = list(book_ids)
+        books = {}
+        for start in range(0, len(book_ids), DUPLICATE_LOAD_BATCH):
+            rows = self.db.query(*BOOK_COLUMNS).filter(
+                Book.id.in_(book_ids[start:start + DUPLICATE_LOAD_BATCH]),
+                Book.user_id == user_id, ~Book.is_deleted)
+            books.update((row.id, row) for row in rows)
+        return books
+
+    def _live_titles(self, user_id: int):
+        # (id, title) of every live book, for databases without the duplicate index
+        return self.db.query(Book.id, Book.title).filter(Book.user_id == user_id,
+                                                         ~Book.is_deleted)
+
+    def _possible_duplicates(self, user_id: int, title: str, author: str) -> list:
+        # Ids of the user's live books sharing an LSH bucket with the title
+        # and similar enough
+        keys = title_keys(title)
+        if supports_duplicate_index(self.db.get_bind()):
+            candidate_ids = indexed_matches(self.db, user_id, keys)
+        else:
+            keys = set(keys)
+            candidate_ids = {book_id for book_id, other in self._live_titles(user_id)
+                             if keys & set(title_keys(other))}
+        profile = book_profile(title, author)
+        candidates = sorted(self._live_books_by_id(user_id, candidate_ids).values(),
+                            key=lambda book: (book.created_at, book.id))
+        threshold = settings.DUPLICATE_SIMILARITY_THRESHOLD
+        return [book.id for book in candidates
+                if similarity(profile, book_profile(book.title, book.author))
+                >= threshold]
+
+    def find_duplicates(self, user_id: int, limit: int = 50):
+        # Groups of live books that look like the same book, largest first.
+        # Only books sharing an LSH bucket are loaded and compared, never every
+        # pair in the library.
+        try:
+            if supports_duplicate_index(self.db.get_bind()):
+                buckets = indexed_buckets(self.db, user_id)
+            else:
+                buckets = title_buckets(self._live_titles(user_id))
+            candidate_ids = {book_id for bucket in buckets for book_id in bucket}
+            candidates = self._live_books_by_id(user_id, candidate_ids)
+            books = {book.id: (book.title, book.author) for book in candidates.values()}
+            groups = group_duplicates(books, buckets,
+                                      settings.DUPLICATE_SIMILARITY_THRESHOLD)
+            groups.sort(key=lambda group: (-len(group[0]), -group[1]))
+            return {
+                "success": True,
+                "total_groups": len(groups),
+                "data": [{
+                    "similarity": round(score, 3),
+                    # Oldest first: the copy that was there before the duplicates
+                    "books": sorted((candidates[book_id] for book_id in ids),
+                                    key=lambda book: (book.created_at, book.id))
+                } for ids, score in groups[:limit]]
+            }
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def get_library_version(self, user_id: int):
         try:
-            books = self.db.query(Book).filter(
-                or_(
-                    Book.title.ilike(f"%{search_query}%"),
-                    Book.author.ilike(f"%{search_query}%")
-                ),
-                Book.is_deleted == False
-            ).all()
-            return {"success": True, "data": books}
+            return {"success": True, "data": get_library_version(self.db, user_id)}
         except Exception as e:
             return {"success": False, "message": str(e)}
 
     def get_library_summary(self, user_id: int):
         try:
-            total_books = self.db.query(Book).filter(Book.user_id == user_id, Book.is_deleted == False).count()
-            recent_additions = self.db.query(Book).filter(Book.user_id == user_id, Book.is_deleted == False).order_by(
-                desc(Book.created_at)).limit(5).all()
+            # Counts come from the trigger-maintained aggregates; the newest five
+            # is an index seek
+            stats = get_library_stats(self.db, user_id)
+            recent_additions = self.db.query(*BOOK_COLUMNS).filter(
+                Book.user_id == user_id, ~Book.is_deleted
+            ).order_by(desc(Book.created_at), desc(Book.id)).limit(5).all()
 
             return {
                 "success": True,
-                "total_books": total_books,
+                **stats,
                 "recent_additions": recent_additions
             }
         except Exception as e:
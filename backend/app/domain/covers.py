@@ -0,0 +1,218 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Cover images live in a content-addressed blob store on local disk: a cover's id is
+# the sha256 of its bytes, so identical uploads share one file and a stored file
+# never changes. Books reference covers by id (books.cover_id) instead of carrying
+# the image inline.
+#     <COVER_STORAGE_DIR>/original/ab/abcdef...        uploaded bytes, as sent
+#     <COVER_STORAGE_DIR>/small/ab/abcdef....webp      thumbnails, generated on demand
+COVER_ID = re.compile(r"^[0-9a-f]{64}$")
+ORIGINAL = "original"
+# Thumbnail name -> bounding box (px); the aspect ratio is kept
+THUMBNAIL_SIZES = {"small": 96, "medium": 320}
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_MEDIA_TYPE = "image/webp"
+# Background job (app/domain/jobs.py) that pre-generates every thumbnail
+# size of a new cover
+THUMBNAIL_JOB = "covers.thumbnails"
+
+# Accepted upload formats, and the magic bytes used to serve originals
+# with the right type
+COVER_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif",
+                 "WEBP": "image/webp"}
+_MAGIC = ((b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG\r\n\x1a\n", "image/png"),
+          (b"GIF8", "image/gif"))
+# Refuse images that would decompress to more than this many pixels
+# (decompression bombs)
+MAX_COVER_PIXELS = 40_000_000
+
+# Inline covers as the frontend sends them: data:image/png;base64,....
+DATA_URI = re.compile(r"^data:image/[\w.+-]+;base64,", re.IGNORECASE)
+
+
+def is_cover_id(value: str) -> bool:
+    return bool(value) and COVER_ID.match(value) is not None
+
+
+def validate_cover(data: bytes) -> str:
+    # Returns the image format; raises ValueError for anything that is not
+    # a supported image
+    if len(data) > settings.COVER_MAX_BYTES:
+        raise ValueError(f"Cover image is larger than {settings.COVER_MAX_BYTES} bytes")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in COVER_FORMATS:
+                raise ValueError(f"Unsupported cover image format: {image.format}")
+            if image.width * image.height > MAX_COVER_PIXELS:
+                raise ValueError("Cover image dimensions are too large")
+            image.verify()
+            return image.format
+    except (UnidentifiedImageError, OSError, SyntaxError,
+            Image.DecompressionBombError) as e:
+        raise ValueError("Cover is not a valid image") from e
+
+
+def sniff_media_type(header: bytes) -> str:
+    for magic, media_type in _MAGIC:
+        if header.startswith(magic):
+            return media_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def decode_data_uri(value: str) -> bytes:
+    try:
+        return base64.b64decode(value[DATA_URI.match(value).end():], validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("Cover image is not valid base64") from e
+
+
+class CoverStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, cover_id: str, size: str = ORIGINAL) -> str:
+        name = cover_id
+        if size != ORIGINAL:
+            name = f"{cover_id}.{THUMBNAIL_FORMAT.lower()}"
+        return os.path.join(self.root, size, cover_id[:2], name)
+
+    def exists(self, cover_id: str, size: str = ORIGINAL) -> bool:
+        return os.path.isfile(self.path(cover_id, size))
+
+    def media_type(self, cover_id: str, size: str = ORIGINAL) -> str:
+        if size != ORIGINAL:
+            return THUMBNAIL_MEDIA_TYPE
+        with open(self.path(cover_id), "rb") as file:
+            return sniff_media_type(file.read(12))
+
+    def _write(self, path: str, data: bytes):
+        # Write to a temporary file in the same directory and rename it into place, so
+        # readers never see a partial file and concurrent writers of the same content
+        # just race benignly
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                                 prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def save(self, data: bytes) -> str:
+        validate_cover(data)
+        cover_id = hashlib.sha256(data).hexdigest()
+        path = self.path(cover_id)
+        if os.path.exists(path):
+            # Already stored; refresh mtime so the unreferenced-cover sweep
+            # sees it as new again
+            os.utime(path)
+        else:
+            self._write(path, data)
+        return cover_id
+
+    def make_thumbnail(self, cover_id: str, size: str) -> str:
+        path = self.path(cover_id, size)
+        if os.path.exists(path):
+            return path
+        with Image.open(self.path(cover_id)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((THUMBNAIL_SIZES[size], THUMBNAIL_SIZES[size]))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+            output = io.BytesIO()
+            image.save(output, THUMBNAIL_FORMAT, quality=80, method=4)
+        self._write(path, output.getvalue())
+        return path
+
+    def remove(self, cover_id: str, older_than: float = None) -> bool:
+        # With older_than, keep the cover if it was (re)saved since, e.g. by a
+        # concurrent upload
+        try:
+            if older_than is not None and \
+                    os.stat(self.path(cover_id)).st_mtime >= older_than:
+                return False
+        except FileNotFoundError:
+            return False
+        for size in (ORIGINAL, *THUMBNAIL_SIZES):
+            try:
+                os.unlink(self.path(cover_id, size))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def iter_cover_ids(self, older_than: float):
+        # Stored originals last written before the given timestamp
+        original_dir = os.path.join(self.root, ORIGINAL)
+        if not os.path.isdir(original_dir):
+            return
+        for prefix in os.scandir(original_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if is_cover_id(entry.name) and entry.stat().st_mtime < older_than:
+                    yield entry.name
+
+
+cover_store = CoverStore(settings.COVER_STORAGE_DIR)
+
+
+# Move an inline data-URI cover into the store: returns the (cover_image, cover_id)
+# pair to save on the book. URLs and empty values are kept as cover_image; raises
+# ValueError for bad images.
+def store_inline_cover(cover_image: str):
+    if not cover_image or not DATA_URI.match(cover_image):
+        return cover_image, None
+    return None, cover_store.save(decode_data_uri(cover_image))
+
+
+# Migration 0005: rewrite books that still carry inline covers to
+# reference the blob store. updated_at moves too, so ETags handed out for the
+# inline representation stop matching.
+def move_inline_covers(conn: Connection, batch_size: int = 200) -> int:
+    moved = 0
+    start = time.perf_counter()
+    last_id = ""
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, cover_image FROM books WHERE id > :last_id AND cover_image "
+            "LIKE 'data:image/%' ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": batch_size}).all()
+        if not rows:
+            break
+        for book_id, cover_image in rows:
+            try:
+                _, cover_id = store_inline_cover(cover_image)
+            except ValueError as e:
+                logger.warning("Inline cover of book %s left in place: %s", book_id, e)
+                continue
+            conn.execute(text("UPDATE books SET cover_id = :cover_id, "
+                              "cover_image = NULL, updated_at = :now WHERE id = :id"),
+                         {"cover_id": cover_id, "now": datetime.now(), "id": book_id})
+            moved += 1
+        last_id = rows[-1][0]
+    if moved:
+        logger.info("Moved %d inline covers to the blob store in %.1fs", moved,
+                    time.perf_counter() - start)
+    return moved
@@ -1,27 +1,431 @@
 import logging
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.domain.duplicates import create_duplicate_index, register_duplicate_functions
+from app.domain.migrations import run_migrations
+from app.domain.replicas import (
+    ReplicaSet,
+    note_write,
+    parse_replica_urls,
+    wrote_recently,
+)
+from app.domain.search import create_search_index, register_search_functions
+from app.domain.sharding import lookup_order, parse_shard_urls, shard_for_key
+from app.metrics import db_pool_checkout_wait_seconds, record_query
 
 logger = logging.getLogger(__name__)
 
-# Define the SQLite URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+# Async drivers for each supported backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+# Connection pool settings shared by the sync and async engines
+POOL_OPTIONS = {
+    "pool_size": settings.DATABASE_POOL_SIZE,
+    "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+    "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+    "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+    "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+}
+
+# PRAGMAs applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer and, with synchronous=NORMAL, only syncs at checkpoints instead of on
+# every commit; "default" keeps SQLite's own settings (rollback journal,
+# synchronous=FULL).
+SQLITE_PROFILES = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        # Negative cache_size is in KiB rather than pages
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY",
+    },
+}
+
+# Connections opened and checkouts served, per engine, for pool_metrics()
+pool_counters = {}
+
+
+def _track_pool(sync_engine, name: str):
+    counters = pool_counters.setdefault(name, {"connections_opened": 0, "checkouts": 0})
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        counters["connections_opened"] += 1
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        counters["checkouts"] += 1
+
+
+# Statement count and latency per engine, attributed to the current
+# request (app.metrics)
+def _track_queries(sync_engine, name: str):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query(name, statement,
+                     time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        started = conn.info.get("query_started") if conn else None
+        if started:
+            record_query(name, exception_context.statement or "",
+                         time.perf_counter() - started.pop())
+
+
+# QueuePool variants that time _do_get(), where a checkout blocks until a connection
+# is returned (or overflow allows a new one); _configure_engine sets pool_name
+class TimedQueuePool(QueuePool):
+    pool_name = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            db_pool_checkout_wait_seconds.labels(self.pool_name).observe(wait)
+
+    # engine.dispose() swaps in a fresh pool built from the constructor arguments
+    def recreate(self):
+        new_pool = super().recreate()
+        new_pool.pool_name = self.pool_name
+        return new_pool
+
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _apply_sqlite_profile(sync_engine, profile: str):
+    pragmas = SQLITE_PROFILES[profile]
+    if sync_engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+def _pool_options(url) -> dict:
+    # In-memory SQLite lives inside a single connection, so keep SQLAlchemy's
+    # default pool for it
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return POOL_OPTIONS
+
+
+def _configure_engine(sync_engine, name: str, sqlite_profile: str):
+    _apply_sqlite_profile(sync_engine, sqlite_profile)
+    register_search_functions(sync_engine)
+    register_duplicate_functions(sync_engine)
+    _track_pool(sync_engine, name)
+    _track_queries(sync_engine, name)
+    if isinstance(sync_engine.pool, TimedQueuePool):
+        sync_engine.pool.pool_name = name
+
+
+# Engine factory for the configured DATABASE_URL (SQLite or Postgres)
+def create_database_engine(url: str, sqlite_profile: str = settings.SQLITE_PROFILE,
+                           name: str = "sync"):
+    url = make_url(url)
+    connect_args = ({"check_same_thread": False} if url.get_backend_name() == "sqlite"
+                    else {})
+    options = _pool_options(url)
+    if options:
+        options = {"poolclass": TimedQueuePool, **options}
+    new_engine = create_engine(url, connect_args=connect_args, **options)
+    _configure_engine(new_engine, name, sqlite_profile)
+    return new_engine
+
+
+def async_database_url(url: str) -> str:
+    url = make_url(url)
+    url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    return url.render_as_string(hide_password=False)
+
+
+def create_async_database_engine(url: str,
+                                 sqlite_profile: str = settings.SQLITE_PROFILE,
+                                 name: str = "async"):
+    url = make_url(async_database_url(url))
+    # aiosqlite defaults to NullPool (a new connection per checkout); pool it
+    # like the sync engine
+    options = _pool_options(url)
+    if options:
+        options = {"poolclass": TimedAsyncAdaptedQueuePool, **options}
+    new_engine = create_async_engine(url, **options)
+    _configure_engine(new_engine.sync_engine, name, sqlite_profile)
+    return new_engine
+
+
+# Databases holding the users' rows, in shard order: DATABASE_SHARD_URLS, or just
+# DATABASE_URL. Every user lives in exactly one of them (app/domain/sharding.py).
+SHARD_URLS = parse_shard_urls(settings.DATABASE_SHARD_URLS, settings.DATABASE_URL)
+
+
+def _engine_name(kind: str, shard: int) -> str:
+    return kind if len(SHARD_URLS) == 1 else f"{kind}-{shard}"
+
+
+# Create an engine per shard; `engine` is the first (the only one unless sharded)
+shard_engines = [create_database_engine(url, name=_engine_name("sync", shard))
+                 for shard, url in enumerate(SHARD_URLS)]
+engine = shard_engines[0]
+
+# Read replicas of each shard (DATABASE_REPLICA_URLS, app/domain/replicas.py), with
+# their health
+REPLICA_URLS = parse_replica_urls(settings.DATABASE_REPLICA_URLS, len(SHARD_URLS))
+replica_sets = [ReplicaSet(urls) for urls in REPLICA_URLS]
+
+
+def _replica_name(kind: str, shard: int, index: int) -> str:
+    return f"{_engine_name(kind, shard)}-replica-{index}"
+
+
+def _watch_replica(sync_engine, shard: int, index: int):
+    # A replica that drops connections leaves the rotation now rather than
+    # at the next check
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        if exception_context.is_disconnect:
+            replica_sets[shard].mark(index, False)
 
-# Create the SQLite engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+
+def _create_replica_engines(factory, kind: str) -> list:
+    engines = []
+    for shard, urls in enumerate(REPLICA_URLS):
+        engines.append([])
+        for index, url in enumerate(urls):
+            replica_engine = factory(url, name=_replica_name(kind, shard, index))
+            _watch_replica(getattr(replica_engine, "sync_engine", replica_engine),
+                           shard, index)
+            engines[shard].append(replica_engine)
+    return engines
+
+
+replica_engines = _create_replica_engines(create_database_engine, "sync")
 
 # Create a base class for our models
 Base = declarative_base()
 
+
+# Sessions run every statement on one shard: the one pinned with use_shard (shard 0
+# until then). Services pin the shard of the user they work for before their first
+# query. Sessions marked with use_replica read from one of that shard's replicas
+# instead, chosen once per session, until they write: from the first INSERT, UPDATE,
+# DELETE or flush on, everything (reads of what was just written included) goes to the
+# primary.
+class ShardSession(Session):
+    shard_engines = shard_engines
+    replica_engines = replica_engines
+
+    def get_bind(self, mapper=None, **kwargs):
+        shard = self.info.get("shard", 0)
+        if self.info.get("replica") and not self.info.get("wrote") and \
+                not self._flushing:
+            replicas = self.info.setdefault("replicas", {})
+            if shard not in replicas:
+                replicas[shard] = replica_sets[shard].pick()
+            index = replicas[shard]
+            if index is not None and replica_sets[shard].healthy[index]:
+                return self.replica_engines[shard][index]
+        return self.shard_engines[shard]
+
+
+@event.listens_for(ShardSession, "do_orm_execute")
+def _on_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+@event.listens_for(ShardSession, "after_flush")
+def _on_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+# Read-your-writes across requests: the user's next reads skip the replicas, in this
+# process and (through the signed last-write marker of the request) in the others
+@event.listens_for(ShardSession, "after_commit")
+def _on_commit(session):
+    if session.info.get("wrote") and session.info.get("user_id") is not None:
+        note_write(session.info["user_id"])
+
+
 # Define the SessionLocal class for creating database sessions
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=ShardSession, autocommit=False, autoflush=False)
+
+
+# Optional async engines (DATABASE_ASYNC=true): queries are awaited on the event loop
+# through aiosqlite/asyncpg instead of occupying a worker thread each
+async_shard_engines = []
+async_replica_engines = [[] for _ in REPLICA_URLS]
+AsyncSessionLocal = None
+if settings.DATABASE_ASYNC:
+    async_shard_engines = [
+        create_async_database_engine(url, name=_engine_name("async", shard))
+        for shard, url in enumerate(SHARD_URLS)
+    ]
+
+    async_replica_engines = _create_replica_engines(create_async_database_engine,
+                                                    "async")
+
+    # AsyncSession runs its ORM work on a sync Session bound to the async engines'
+    # sync facades
+    class AsyncShardSession(ShardSession):
+        shard_engines = [async_engine.sync_engine
+                         for async_engine in async_shard_engines]
+        replica_engines = [[async_engine.sync_engine for async_engine in engines]
+                           for engines in async_replica_engines]
+
+    AsyncSessionLocal = async_sessionmaker(sync_session_class=AsyncShardSession,
+                                           autoflush=False, expire_on_commit=False)
+
+
+def has_replicas() -> bool:
+    return any(REPLICA_URLS)
+
+
+def shard_for_user(user_id) -> int:
+    return shard_for_key(user_id, len(SHARD_URLS))
+
+
+def user_lookup_shards(user_id=None, username: str = None) -> list:
+    return lookup_order(len(SHARD_URLS), user_id, username)
+
+
+# Pin a session to a shard; its later statements (and flushes) go there. Works on the
+# sync session an AsyncSession wraps too, as both share info. user_id is the user whose
+# data the session works on, whose commits count as their writes for read-your-writes.
+def use_shard(db, shard: int, user_id=None):
+    db.info["shard"] = shard
+    db.info["user_id"] = user_id
+
+
+# Let a request session read from the replicas of the user's shard (its writes
+# still go to the primary). Not for reads that guard a write, such as If-Match
+# checks: a replica may lag. Users with a write in the last
+# REPLICA_READ_YOUR_WRITES_SECONDS, served by this worker or another one, keep reading
+# from the primary, so they see their own changes.
+def use_replica(db, user_id):
+    has_replicas = bool(REPLICA_URLS[shard_for_user(user_id)])
+    db.info["replica"] = has_replicas and not wrote_recently(user_id)
+
+
+# FastAPI dependency: one session per request, shared by every service the request
+# touches (get_current_user and the route handler receive the same instance)
+async def get_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        await run_in_threadpool(session.close)
+
+
+# Run a sync service call on the request session without blocking the event loop. fn
+# receives the session as the db keyword: for an AsyncSession its sync facade, whose
+# I/O is awaited on the loop; for a plain Session fn runs in the threadpool. The
+# session gives its connection back to the pool after every call (close() keeps loaded
+# objects readable), so slow work between calls, such as password hashing, never pins a
+# pooled connection.
+async def run_in_session(db, fn, *args, **kwargs):
+    if isinstance(db, AsyncSession):
+        try:
+            return await db.run_sync(
+                lambda sync_session: fn(*args, db=sync_session, **kwargs))
+        finally:
+            await db.close()
+
+    def call():
+        try:
+            return fn(*args, db=db, **kwargs)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(call)
+
+
+def pool_metrics():
+    metrics = {}
+    engines = {_engine_name("sync", shard): shard_engine
+               for shard, shard_engine in enumerate(shard_engines)}
+    engines.update({_engine_name("async", shard): async_engine.sync_engine
+                    for shard, async_engine in enumerate(async_shard_engines)})
+    for kind, engine_lists in (("sync", replica_engines),
+                               ("async", async_replica_engines)):
+        for shard, engine_list in enumerate(engine_lists):
+            for index, replica_engine in enumerate(engine_list):
+                sync_engine = getattr(replica_engine, "sync_engine", replica_engine)
+                engines[_replica_name(kind, shard, index)] = sync_engine
+    for name, sync_engine in engines.items():
+        pool = sync_engine.pool
+        metrics[name] = {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            **pool_counters[name],
+        }
+    return metrics
+
+
+# Close pooled connections on shutdown; aiosqlite connections own a
+# background thread each
+async def dispose_engines():
+    for async_engine in async_shard_engines + sum(async_replica_engines, []):
+        await async_engine.dispose()
+    for shard_engine in shard_engines + sum(replica_engines, []):
+        shard_engine.dispose()
+
+
+# Create the tables, indexes and triggers of one database (a shard, or a rebalance
+# target)
+def init_shard(shard_engine):
+    Base.metadata.create_all(bind=shard_engine)
+    # create_all skips existing tables; later schema changes are applied as migrations
+    run_migrations(shard_engine)
+    create_search_index(shard_engine)
+    create_duplicate_index(shard_engine)
+    # Imported here: the stats module depends on the models, which depend on Base above
+    from app.domain.library_stats import create_library_stats
+    create_library_stats(shard_engine)
+
 
 # Function to initialize the database tables
 def init_db():
     try:
-        Base.metadata.create_all(bind=engine)
+        for shard_engine in shard_engines:
+            init_shard(shard_engine)
         logger.info("Database tables created successfully.")
     except Exception as e:
-        logger.error(f"Failed to create tables: {e}")
+        logger.error("Failed to create tables: %s", e)
         raise
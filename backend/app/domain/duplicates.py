@@ -0,0 +1,310 @@
+import json
+import logging
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Duplicate-book detection. Titles are normalized (unicode folding, casefold,
+# punctuation, bracketed notes and stopwords removed) and compared by the Jaccard
+# similarity of their character trigrams. To avoid comparing every pair, each live book
+# is blocked into MINHASH_BANDS buckets by MinHash LSH over those trigrams: books whose
+# titles are similar share a bucket with high probability, unrelated ones almost never.
+# The buckets live in the book_duplicate_keys table, kept in sync by triggers on books
+# like the search index, so only books sharing a bucket are ever compared. Changing the
+# MinHash parameters needs the table dropped; it is recreated and backfilled at startup.
+DUPLICATE_KEYS_TABLE = "book_duplicate_keys"
+_TRIGGERS = ["book_duplicate_keys_ai", "book_duplicate_keys_au",
+             "book_duplicate_keys_ad"]
+
+MINHASH_BANDS = 12
+MINHASH_ROWS = 3
+_BINS = MINHASH_BANDS * MINHASH_ROWS
+_FNV_PRIME = 0x100000001B3
+_UINT64 = (1 << 64) - 1
+
+# Books in one bucket are sorted by normalized title and each is compared with this
+# many neighbours. A band value shared by more than MAX_BUCKET_SIZE books says little
+# (short or formulaic titles), so in such a bucket only books with the same normalized
+# title are compared.
+BUCKET_WINDOW = 20
+MAX_BUCKET_SIZE = 100
+
+STOPWORDS = frozenset("""
+    a an and the of or in on at to for from by with
+    de del la le les el los das der die und
+""".split())
+
+_WORD_SPLIT = re.compile(r"[\W_]+")
+_BRACKETED = re.compile(r"[(\[{][^)\]}]*[)\]}]")
+
+_DUPLICATES_DDL = [
+    f"""
+    CREATE TABLE {DUPLICATE_KEYS_TABLE} (
+        user_id INTEGER NOT NULL,
+        key INTEGER NOT NULL,
+        book_id TEXT NOT NULL,
+        PRIMARY KEY (user_id, key, book_id)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_duplicate_keys_ai AFTER INSERT ON books
+    WHEN NOT coalesce(new.is_deleted, 0) BEGIN
+        INSERT OR IGNORE INTO {DUPLICATE_KEYS_TABLE} (user_id, key, book_id)
+        SELECT new.user_id, value, new.id FROM json_each(duplicate_keys(new.title));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_duplicate_keys_au
+    AFTER UPDATE OF title, user_id, is_deleted ON books BEGIN
+        DELETE FROM {DUPLICATE_KEYS_TABLE}
+        WHERE user_id = old.user_id
+          AND key IN (SELECT value FROM json_each(duplicate_keys(old.title)))
+          AND book_id = old.id;
+        INSERT OR IGNORE INTO {DUPLICATE_KEYS_TABLE} (user_id, key, book_id)
+        SELECT new.user_id, value, new.id FROM json_each(duplicate_keys(new.title))
+        WHERE NOT coalesce(new.is_deleted, 0);
+    END
+    """,
+    # Tombstones have no keys, so the purge skips the lookup
+    f"""
+    CREATE TRIGGER IF NOT EXISTS book_duplicate_keys_ad AFTER DELETE ON books
+    WHEN NOT coalesce(old.is_deleted, 0) BEGIN
+        DELETE FROM {DUPLICATE_KEYS_TABLE}
+        WHERE user_id = old.user_id
+          AND key IN (SELECT value FROM json_each(duplicate_keys(old.title)))
+          AND book_id = old.id;
+    END
+    """,
+    # Backfill books that existed before the index was created
+    f"""
+    INSERT OR IGNORE INTO {DUPLICATE_KEYS_TABLE} (user_id, key, book_id)
+    SELECT books.user_id, keys.value, books.id
+    FROM books, json_each(duplicate_keys(books.title)) AS keys
+    WHERE NOT coalesce(books.is_deleted, 0)
+    """,
+]
+
+
+def fold(value: str) -> str:
+    # Compatibility decomposition without combining marks, casefolded: "Ｃafé" -> "cafe"
+    if not value or value.isascii():
+        return (value or "").casefold()
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in decomposed
+                   if not unicodedata.combining(char)).casefold()
+
+
+def normalize_title(title: str) -> str:
+    words = [word for word in _WORD_SPLIT.split(_BRACKETED.sub(" ", fold(title)))
+             if word]
+    # A title made only of stopwords keeps them
+    return " ".join([word for word in words if word not in STOPWORDS] or words)
+
+
+def normalize_author(author: str) -> frozenset:
+    # Name parts, in any order ("Herbert, Frank" == "Frank Herbert");
+    # initials are dropped
+    return frozenset(word for word in _WORD_SPLIT.split(fold(author)) if len(word) > 1)
+
+
+def title_shingles(normalized: str) -> frozenset:
+    if len(normalized) < 3:
+        return frozenset([normalized] if normalized else [])
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def minhash_signature(shingles) -> list:
+    # One-permutation MinHash: every shingle is hashed once into one of _BINS bins,
+    # keeping the smallest value per bin, and an empty bin borrows the next filled
+    # one (offset by the distance). One pass over the shingles instead of one per
+    # hash function, which the triggers need on every insert: about 20us per title
+    # rather than 150us.
+    bins = [None] * _BINS
+    for shingle in shingles:
+        value, index = divmod(zlib.crc32(shingle.encode()), _BINS)
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    signature = []
+    for index in range(_BINS):
+        distance = 0
+        while bins[(index + distance) % _BINS] is None:
+            distance += 1
+        signature.append(bins[(index + distance) % _BINS] + (distance << 32))
+    return signature
+
+
+def title_keys(title: str) -> list:
+    # The LSH bucket of each band for a title; empty when nothing is left
+    # after normalization
+    shingles = title_shingles(normalize_title(title))
+    if not shingles:
+        return []
+    signature = minhash_signature(shingles)
+    keys = []
+    for band in range(MINHASH_BANDS):
+        # A band takes every MINHASH_BANDS-th bin, so its rows are never neighbouring
+        # empty bins that borrowed the same value. FNV-style mixing: stable across
+        # processes, unlike hash(), and a rare collision only adds a candidate that
+        # fails verification.
+        key = band
+        for value in signature[band::MINHASH_BANDS]:
+            key = (key * _FNV_PRIME ^ value) & _UINT64
+        keys.append(key - (1 << 64) if key >> 63 else key)
+    return keys
+
+
+# SQL function used by the triggers; updates recompute the old title's
+# keys, hence the cache
+@lru_cache(maxsize=4096)
+def _duplicate_keys_json(title) -> str:
+    return json.dumps(title_keys(title))
+
+
+def book_profile(title: str, author: str) -> tuple:
+    # (normalized title, its trigrams, their count, author name parts)
+    normalized = normalize_title(title)
+    shingles = title_shingles(normalized)
+    return normalized, shingles, len(shingles), normalize_author(author)
+
+
+def similarity(profile: tuple, other: tuple) -> float:
+    # Title trigram Jaccard, or 0 when both authors are known and share less than half
+    # the names of the shorter one
+    _, shingles, size, authors = profile
+    _, other_shingles, other_size, other_authors = other
+    if authors and other_authors:
+        if 2 * len(authors & other_authors) < min(len(authors), len(other_authors)):
+            return 0.0
+    if not size or not other_size:
+        return 0.0
+    shared = len(shingles & other_shingles)
+    return shared / (size + other_size - shared)
+
+
+def _blocks(members: list, profiles: dict) -> list:
+    if len(members) <= MAX_BUCKET_SIZE:
+        return [members]
+    same_title = defaultdict(list)
+    for book_id in members:
+        same_title[profiles[book_id][0]].append(book_id)
+    return [ids for ids in same_title.values() if len(ids) > 1]
+
+
+def group_duplicates(books: dict, buckets: list, threshold: float) -> list:
+    # books: id -> (title, author); buckets: lists of ids sharing an LSH bucket.
+    # Candidates are verified and linked transitively; returns (ids, lowest similarity
+    # of a link) per group.
+    profiles = {book_id: book_profile(title, author)
+                for book_id, (title, author) in books.items()}
+    parent = {book_id: book_id for book_id in profiles}
+    weakest = {}
+
+    def find(book_id):
+        while parent[book_id] != book_id:
+            parent[book_id] = parent[parent[book_id]]
+            book_id = parent[book_id]
+        return book_id
+
+    for bucket in buckets:
+        members = [book_id for book_id in set(bucket) if book_id in profiles]
+        for block in _blocks(members, profiles):
+            block.sort(key=lambda book_id: (profiles[book_id][0],
+                                            sorted(profiles[book_id][3])))
+            for i, book_id in enumerate(block):
+                for other in block[max(0, i - BUCKET_WINDOW):i]:
+                    root, other_root = find(book_id), find(other)
+                    if root == other_root:
+                        continue
+                    score = similarity(profiles[book_id], profiles[other])
+                    if score >= threshold:
+                        parent[other_root] = root
+                        weakest[root] = min(score, weakest.get(root, 1.0),
+                                            weakest.get(other_root, 1.0))
+
+    groups = defaultdict(list)
+    for book_id in profiles:
+        groups[find(book_id)].append(book_id)
+    return [(ids, weakest[root]) for root, ids in groups.items() if len(ids) > 1]
+
+
+def supports_duplicate_index(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite" and settings.DUPLICATE_INDEX
+
+
+def register_duplicate_functions(engine: Engine):
+    if not supports_duplicate_index(engine):
+        return
+
+    # Called by the index triggers, so it must exist on every connection
+    # that writes books
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("duplicate_keys", 1, _duplicate_keys_json,
+                                         deterministic=True)
+
+
+def create_duplicate_index(engine: Engine):
+    if not supports_duplicate_index(engine):
+        if engine.dialect.name == "sqlite":
+            # Disabled with DUPLICATE_INDEX: stop paying for the keys on every write
+            with engine.begin() as conn:
+                for trigger in _TRIGGERS:
+                    conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+                conn.exec_driver_sql(f"DROP TABLE IF EXISTS {DUPLICATE_KEYS_TABLE}")
+        logger.info("Duplicate index skipped: duplicate checks scan the library on "
+                    "this database.")
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": DUPLICATE_KEYS_TABLE}
+        ).first()
+        if exists:
+            return
+        for statement in _DUPLICATES_DDL:
+            conn.exec_driver_sql(statement)
+    logger.info("Duplicate index created.")
+
+
+def indexed_buckets(db: Session, user_id) -> list:
+    # Buckets of the user's live books holding more than one book, read in key order
+    # off the primary key
+    rows = db.execute(text(f"""
+        SELECT group_concat(book_id, ' ') FROM {DUPLICATE_KEYS_TABLE}
+        WHERE user_id = :user_id GROUP BY key HAVING count(*) > 1
+    """), {"user_id": user_id})
+    return [ids.split(" ") for (ids,) in rows]
+
+
+def indexed_matches(db: Session, user_id, keys: list) -> set:
+    # Live books of the user sharing at least one bucket with the given keys
+    # (deduplicated here: DISTINCT would sort the matches in a temporary B-tree)
+    if not keys:
+        return set()
+    rows = db.execute(text(f"""
+        SELECT book_id FROM {DUPLICATE_KEYS_TABLE}
+        WHERE user_id = :user_id AND key IN :keys
+    """).bindparams(bindparam("keys", expanding=True)),
+        {"user_id": user_id, "keys": keys})
+    return set(rows.scalars())
+
+
+def title_buckets(rows) -> list:
+    # The same blocking computed in memory from (id, title) rows, for databases
+    # without the index
+    buckets = defaultdict(list)
+    for book_id, title in rows:
+        for key in title_keys(title):
+            buckets[key].append(book_id)
+    return [ids for ids in buckets.values() if len(ids) > 1]
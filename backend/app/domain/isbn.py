@@ -0,0 +1,160 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Book metadata by ISBN, used to fill in the title, author and publication date a
+# user left out. Lookups go to a pluggable provider (by default the local catalog
+# built by app/domain/isbn_catalog.py) through an in-process LRU cache that also
+# remembers misses.
+ISBN_SEPARATORS = re.compile(r"[\s-]")
+ISBN_10 = re.compile(r"^\d{9}[\dX]$")
+ISBN_13 = re.compile(r"^97[89]\d{10}$")
+
+
+def _isbn13_check_digit(first12: str) -> str:
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(value: str):
+    # ISBN-10 or ISBN-13 (hyphens and spaces allowed) -> ISBN-13 digits; None unless
+    # the checksum holds
+    if not value:
+        return None
+    isbn = ISBN_SEPARATORS.sub("", value).upper()
+    if ISBN_10.match(isbn):
+        total = sum((10 - i) * (10 if char == "X" else int(char))
+                    for i, char in enumerate(isbn))
+        if total % 11:
+            return None
+        first12 = "978" + isbn[:9]
+        return first12 + _isbn13_check_digit(first12)
+    if ISBN_13.match(isbn) and _isbn13_check_digit(isbn[:12]) == isbn[12]:
+        return isbn
+    return None
+
+
+class NullProvider:
+    def lookup_many(self, isbns: list) -> dict:
+        return {}
+
+
+def _catalog_provider():
+    # Imported here: the catalog module uses normalize_isbn above when loading dumps
+    from app.domain.isbn_catalog import SQLiteCatalogProvider
+    return SQLiteCatalogProvider(settings.ISBN_CATALOG_PATH)
+
+
+# Provider name (ISBN_METADATA_PROVIDER) -> factory. A provider maps a list of ISBN-13s
+# to {isbn: {"title", "author", "publication_date"}} for the ones it knows.
+PROVIDERS = {
+    "catalog": _catalog_provider,
+    "none": NullProvider,
+}
+
+# Cached "not in the catalog" marker
+_MISSING = object()
+
+
+# LRU of provider answers, found or not. Misses expire after a TTL, so ISBNs added to
+# the catalog (or found by a network provider later) are picked up without a restart.
+class IsbnMetadataCache:
+    def __init__(self, max_size: int, negative_ttl_seconds: int):
+        self.max_size = max_size
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, isbn: str):
+        # (found, metadata): found is False when the ISBN is not cached at all
+        with self._lock:
+            entry = self._entries.get(isbn)
+            if entry is None:
+                return False, None
+            metadata, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[isbn]
+                return False, None
+            self._entries.move_to_end(isbn)
+            return True, None if metadata is _MISSING else metadata
+
+    def put(self, isbn: str, metadata):
+        if self.max_size <= 0:
+            return
+        if metadata is None:
+            entry = (_MISSING, time.monotonic() + self.negative_ttl_seconds)
+        else:
+            entry = (metadata, None)
+        with self._lock:
+            self._entries[isbn] = entry
+            self._entries.move_to_end(isbn)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IsbnMetadataService:
+    def __init__(self, provider, cache: IsbnMetadataCache):
+        self.provider = provider
+        self.cache = cache
+        self.stats = {"lookups": 0, "cache_hits": 0, "found": 0, "not_found": 0,
+                      "errors": 0}
+
+    def lookup(self, isbn: str):
+        return self.lookup_many([isbn]).get(normalize_isbn(isbn))
+
+    def lookup_many(self, isbns) -> dict:
+        # {ISBN-13: metadata} for the given ISBNs (any format) that resolve; one
+        # provider call for everything not cached. A failing provider means no metadata,
+        # not a failed write.
+        results = {}
+        wanted = []
+        for isbn in {normalize_isbn(isbn) for isbn in isbns} - {None}:
+            self.stats["lookups"] += 1
+            cached, metadata = self.cache.get(isbn)
+            if cached:
+                self.stats["cache_hits"] += 1
+                if metadata is not None:
+                    results[isbn] = metadata
+            else:
+                wanted.append(isbn)
+        if wanted:
+            try:
+                found = self.provider.lookup_many(wanted)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("ISBN metadata lookup failed: %s", e)
+                return results
+            for isbn in wanted:
+                self.cache.put(isbn, found.get(isbn))
+            self.stats["found"] += len(found)
+            self.stats["not_found"] += len(wanted) - len(found)
+            results.update(found)
+        return results
+
+
+def fill_from_metadata(metadata, title: str = None, author: str = None,
+                       publication_date: str = None):
+    # Fields the user supplied win; the catalog only fills the blanks
+    if metadata:
+        title = title or metadata["title"]
+        author = author or metadata["author"]
+        publication_date = publication_date or metadata["publication_date"]
+    return title, author, publication_date
+
+
+isbn_metadata = IsbnMetadataService(PROVIDERS[settings.ISBN_METADATA_PROVIDER](),
+                                    IsbnMetadataCache(settings.ISBN_CACHE_SIZE,
+                                                      settings.ISBN_NEGATIVE_CACHE_TTL_SECONDS))
@@ -0,0 +1,214 @@
+import csv
+import gzip
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+import orjson
+
+from app.config import settings
+from app.domain.isbn import normalize_isbn
+
+logger = logging.getLogger(__name__)
+
+# Local ISBN catalog: a standalone read-only SQLite file with one row per ISBN-13, keyed
+# by the ISBN in a WITHOUT ROWID table (the B-tree is the sorted file) and read through
+# mmap, so a lookup is a single index probe with no network. Built offline from a dump
+# (CSV columns: isbn,title,author,publication_date):
+#     python -m app.domain.isbn_catalog load editions.txt.gz --format openlibrary \
+#         [--authors authors.txt.gz]
+#     python -m app.domain.isbn_catalog load books.csv --format csv
+#     python -m app.domain.isbn_catalog load books.ndjson --format ndjson
+# Loading writes a new file next to ISBN_CATALOG_PATH and renames it over the old one,
+# so running servers keep reading a complete catalog and switch to the new one on
+# their next lookup.
+CATALOG_TABLE = "isbn_catalog"
+CATALOG_DDL = f"""
+CREATE TABLE {CATALOG_TABLE} (
+    isbn TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT,
+    publication_date TEXT
+) WITHOUT ROWID
+"""
+CATALOG_INSERT = f"INSERT OR REPLACE INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?)"
+# Open Library publish_date values seen in the dumps that carry a full date
+PUBLISH_DATE_FORMATS = ("%Y-%m-%d", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%B %d %Y",
+                        "%Y/%m/%d")
+LOAD_BATCH_SIZE = 10000
+
+
+# One read-only connection per thread (lookups run in the threadpool), reopened when a
+# load replaced the file; a missing file means an empty catalog until one is loaded
+class SQLiteCatalogProvider:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._warned = False
+
+    def _connect(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            if not self._warned:
+                logger.warning("ISBN catalog %s not found; ISBN lookups return nothing",
+                               self.path)
+                self._warned = True
+            return None
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.inode != inode:
+            connection.close()
+            connection = None
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                         check_same_thread=False)
+            connection.execute(f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}")
+            self._local.connection, self._local.inode = connection, inode
+        return connection
+
+    def lookup_many(self, isbns: list) -> dict:
+        connection = self._connect()
+        if connection is None or not isbns:
+            return {}
+        rows = connection.execute(
+            f"SELECT isbn, title, author, publication_date FROM {CATALOG_TABLE} "
+            f"WHERE isbn IN ({', '.join('?' * len(isbns))})", isbns).fetchall()
+        return {isbn: {"title": title, "author": author,
+                       "publication_date": publication_date}
+                for isbn, title, author, publication_date in rows}
+
+
+def parse_publish_date(value: str):
+    # ISO date for full dates; None for years, seasons and free text
+    for date_format in PUBLISH_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date().isoformat()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def load_author_names(path: str) -> dict:
+    # Open Library authors dump: type, key, revision, last_modified, JSON
+    names = {}
+    with _open_text(path) as lines:
+        for line in lines:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) == 5 and columns[0] == "/type/author":
+                name = orjson.loads(columns[4]).get("name")
+                if name:
+                    names[columns[1]] = name
+    return names
+
+
+def iter_openlibrary_editions(path: str, authors: dict):
+    # Open Library editions dump; an edition yields a row for each of its
+    # ISBN-10s and ISBN-13s
+    with _open_text(path) as lines:
+        for line in lines:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) != 5 or columns[0] != "/type/edition":
+                continue
+            edition = orjson.loads(columns[4])
+            title = edition.get("title")
+            isbns = edition.get("isbn_13", []) + edition.get("isbn_10", [])
+            if not title or not isbns:
+                continue
+            names = [authors[author["key"]] for author in edition.get("authors", [])
+                     if isinstance(author, dict) and author.get("key") in authors]
+            by_statement = edition.get("by_statement") or ""
+            by_statement = by_statement.removeprefix("by ").strip()
+            author = ", ".join(names) or by_statement or None
+            publication_date = parse_publish_date(edition.get("publish_date") or "")
+            for isbn in isbns:
+                yield isbn, title, author, publication_date
+
+
+def iter_records(path: str, file_format: str):
+    with _open_text(path) as lines:
+        if file_format == "csv":
+            records = csv.DictReader(lines)
+        else:
+            records = map(orjson.loads, filter(str.strip, lines))
+        for record in records:
+            if record.get("title"):
+                yield (record.get("isbn"), record["title"],
+                       record.get("author") or None,
+                       parse_publish_date(record.get("publication_date") or ""))
+
+
+def load_catalog(rows, path: str) -> int:
+    # rows: (isbn in any format, title, author, publication_date); invalid ISBNs are
+    # skipped and the last row for an ISBN wins
+    temporary = f"{path}.loading"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(temporary)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute(CATALOG_DDL)
+        batch = []
+        for isbn, title, author, publication_date in rows:
+            isbn = normalize_isbn(isbn)
+            if isbn is None:
+                continue
+            batch.append((isbn, title, author, publication_date))
+            if len(batch) >= LOAD_BATCH_SIZE:
+                connection.executemany(CATALOG_INSERT, batch)
+                batch = []
+        if batch:
+            connection.executemany(CATALOG_INSERT, batch)
+        connection.commit()
+        loaded = connection.execute(
+            f"SELECT count(*) FROM {CATALOG_TABLE}").fetchone()[0]
+        # Compact the finished file: lookups only ever read it
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+    os.replace(temporary, path)
+    return loaded
+
+
+def main(argv: list):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m app.domain.isbn_catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser(
+        "load", help="build the catalog from a dump (replaces the current one)")
+    load.add_argument("source", help="dump file (.gz accepted)")
+    load.add_argument("--format", choices=("openlibrary", "csv", "ndjson"),
+                      default="openlibrary")
+    load.add_argument("--authors",
+                      help="Open Library authors dump, for author names of editions")
+    load.add_argument("--output", default=settings.ISBN_CATALOG_PATH)
+    lookup = commands.add_parser("lookup", help="print the catalog entry for ISBNs")
+    lookup.add_argument("isbns", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "load":
+        if args.format == "openlibrary":
+            authors = load_author_names(args.authors) if args.authors else {}
+            rows = iter_openlibrary_editions(args.source, authors)
+        else:
+            rows = iter_records(args.source, args.format)
+        print(f"Loaded {load_catalog(rows, args.output)} ISBNs into {args.output}")
+    else:
+        found = SQLiteCatalogProvider(settings.ISBN_CATALOG_PATH).lookup_many(
+            [normalize_isbn(isbn) for isbn in args.isbns if normalize_isbn(isbn)])
+        for isbn in args.isbns:
+            print(isbn, found.get(normalize_isbn(isbn)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+import logging
+from datetime import datetime, timedelta
+
+import orjson
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+# Durable job queue kept in the database (the background_jobs outbox). Writers enqueue
+# follow-up work on their own session, so the job commits or rolls back with the write;
+# workers in app/application/jobs.py claim due jobs in batches, holding each for
+# JOB_LEASE_SECONDS. A job whose worker died is claimed again once its lease runs out,
+# so handlers must be idempotent.
+# Only work that may lag the write belongs here. What the response or the next read
+# depends on stays in the write's transaction: the library stats, search index and
+# duplicate keys are kept by triggers (so ETags and summaries never run behind a
+# write), and the refresh after commit loads the row the response is built from.
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def enqueue_job(db: Session, kind: str, payload: dict, delay_seconds: float = 0,
+                user_id: int = None):
+    # Added to the caller's transaction; nothing is committed here. user_id is the
+    # user the job is done for, who can follow it in GET /api/v1/jobs.
+    now = datetime.now()
+    db.add(Job(kind=kind, payload=orjson.dumps(payload).decode(), status=PENDING,
+               attempts=0, run_after=now + timedelta(seconds=delay_seconds),
+               user_id=user_id, created_at=now, updated_at=now))
+
+
+def retry_delay(attempts: int) -> float:
+    # Exponential backoff after the given number of failed attempts, capped
+    return min(settings.JOB_RETRY_MAX_SECONDS,
+               settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def claim_jobs(engine: Engine, limit: int) -> list:
+    # Marks up to `limit` due jobs as running under a fresh lease, in one statement
+    # so two workers (or processes) never claim the same job; returns (id, kind,
+    # payload, attempts) tuples. Jobs whose lease ran out (their worker died) are
+    # made pending again first.
+    now = datetime.now()
+    due = (select(Job.id).where(Job.status == PENDING, Job.run_after <= now)
+           .order_by(Job.run_after).limit(limit))
+    with engine.begin() as conn:
+        conn.execute(update(Job).where(Job.status == RUNNING, Job.run_after <= now)
+                     .values(status=PENDING, updated_at=now))
+        rows = conn.execute(
+            update(Job).where(Job.id.in_(due.scalar_subquery()), Job.status == PENDING,
+                              Job.run_after <= now)
+            .values(status=RUNNING, attempts=Job.attempts + 1, updated_at=now,
+                    run_after=now + timedelta(seconds=settings.JOB_LEASE_SECONDS))
+            .returning(Job.id, Job.kind, Job.payload, Job.attempts)
+        ).all()
+    return [(job_id, kind, orjson.loads(payload), attempts)
+            for job_id, kind, payload, attempts in rows]
+
+
+def complete_jobs(engine: Engine, job_ids: list):
+    with engine.begin() as conn:
+        conn.execute(update(Job).where(Job.id.in_(job_ids))
+                     .values(status=DONE, last_error=None, updated_at=datetime.now()))
+
+
+def fail_jobs(engine: Engine, jobs: list, error: str) -> int:
+    # Reschedules each (id, attempts) with backoff, or gives up once it reached
+    # JOB_MAX_ATTEMPTS; returns how many were given up
+    now = datetime.now()
+    given_up = 0
+    with engine.begin() as conn:
+        for job_id, attempts in jobs:
+            if attempts >= settings.JOB_MAX_ATTEMPTS:
+                values = {"status": FAILED}
+                given_up += 1
+            else:
+                values = {"status": PENDING,
+                          "run_after": now + timedelta(seconds=retry_delay(attempts))}
+            conn.execute(update(Job).where(Job.id == job_id)
+                         .values(last_error=error[:1000], updated_at=now, **values))
+    return given_up
+
+
+def purge_finished_jobs(engine: Engine, finished_before: datetime,
+                        batch_size: int) -> int:
+    # Done and failed jobs older than the cutoff, in short batches like
+    # the tombstone purge
+    purged = 0
+    for status in (DONE, FAILED):
+        while True:
+            batch = (select(Job.id)
+                     .where(Job.status == status, Job.updated_at < finished_before)
+                     .limit(batch_size))
+            with engine.begin() as conn:
+                deleted = conn.execute(
+                    delete(Job).where(Job.id.in_(batch.scalar_subquery()))).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                break
+    return purged
+
+
+def job_counts(engine: Engine) -> list:
+    # One indexed lookup per status rather than a scan of the whole table
+    counts = []
+    with engine.connect() as conn:
+        for status in (PENDING, RUNNING, DONE, FAILED):
+            rows = conn.execute(select(Job.kind, func.count())
+                                .where(Job.status == status).group_by(Job.kind))
+            counts += [{"status": status, "kind": kind, "count": count}
+                       for kind, count in rows]
+    return counts
+
+
+
+# A user's own jobs, newest first (or just job_id), as status dicts. Payloads and
+# failure text are left out: the status is all a caller needs to follow their write.
+def user_jobs(engine: Engine, user_id: int, limit: int, job_id: int = None) -> list:
+    query = (select(Job.id, Job.kind, Job.status, Job.attempts, Job.created_at,
+                    Job.updated_at)
+             .where(Job.user_id == user_id).order_by(Job.id.desc()).limit(limit))
+    if job_id is not None:
+        query = query.where(Job.id == job_id)
+    with engine.connect() as conn:
+        return [dict(row._mapping) for row in conn.execute(query)]
@@ -0,0 +1,199 @@
+import logging
+
+from sqlalchemy import desc, extract, func
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.models.book import Book
+from app.models.library_stat import LibraryStat
+
+logger = logging.getLogger(__name__)
+
+# Per-user library aggregates kept in the library_stats table. Triggers on books
+# adjust the counts in the same transaction as every insert, update, soft delete and
+# hard delete, so the dashboard reads a handful of rows instead of counting and
+# grouping the whole library.
+STATS_TABLE = LibraryStat.__tablename__
+
+# kind -> SQL expression for the key of a books row ("{row}" is new or old)
+_DIMENSIONS = {
+    "total": "''",
+    "author": "{row}.author",
+    "decade": "coalesce(substr({row}.publication_date, 1, 3) || '0s', 'unknown')",
+}
+
+_TRIGGERS = ["library_stats_ai", "library_stats_au", "library_stats_ad"]
+
+
+def _adjust(row: str, delta: int) -> str:
+    return "\n".join(
+        f"""
+        INSERT INTO {STATS_TABLE} (user_id, kind, key, count)
+        SELECT {row}.user_id, '{kind}', {key.format(row=row)}, {delta}
+        WHERE NOT coalesce({row}.is_deleted, 0)
+        ON CONFLICT (user_id, kind, key) DO UPDATE SET count = count + excluded.count;
+        """
+        for kind, key in _DIMENSIONS.items()
+    )
+
+
+def _prune(row: str) -> str:
+    return f"DELETE FROM {STATS_TABLE} WHERE user_id = {row}.user_id AND count <= 0;"
+
+
+_STATS_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS library_stats_ai AFTER INSERT ON books BEGIN
+        {_adjust("new", 1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS library_stats_au
+    AFTER UPDATE OF author, publication_date, user_id, is_deleted ON books BEGIN
+        {_adjust("old", -1)}
+        {_adjust("new", 1)}
+        {_prune("old")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS library_stats_ad AFTER DELETE ON books BEGIN
+        {_adjust("old", -1)}
+        {_prune("old")}
+    END
+    """,
+    # Rebuild the counts for books that existed before the triggers
+    # (versions only ever grow)
+    f"DELETE FROM {STATS_TABLE} WHERE kind != 'version'",
+] + [
+    f"""
+    INSERT INTO {STATS_TABLE} (user_id, kind, key, count)
+    SELECT user_id, '{kind}', {key.format(row="books")}, count(*) FROM books
+    WHERE NOT coalesce(is_deleted, 0) GROUP BY 1, 2, 3
+    """
+    for kind, key in _DIMENSIONS.items()
+]
+
+
+# Per-user library version, bumped by every write to a user's books (any column).
+# List and summary responses derive their ETag from it, so revalidation is one
+# primary-key lookup.
+def _bump_version(row: str, condition: str = "1") -> str:
+    return f"""
+        INSERT INTO {STATS_TABLE} (user_id, kind, key, count)
+        SELECT {row}.user_id, 'version', '', 1 WHERE {condition}
+        ON CONFLICT (user_id, kind, key) DO UPDATE SET count = count + 1;
+    """
+
+
+_VERSION_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS library_version_ai AFTER INSERT ON books BEGIN
+        {_bump_version("new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS library_version_au AFTER UPDATE ON books BEGIN
+        {_bump_version("new")}
+        {_bump_version("old", "old.user_id IS NOT new.user_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS library_version_ad AFTER DELETE ON books BEGIN
+        {_bump_version("old")}
+    END
+    """,
+]
+
+
+def supports_library_stats(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def create_library_stats(engine: Engine):
+    if not supports_library_stats(engine):
+        logger.info("Library stats triggers skipped: summaries are computed per "
+                    "request on this database.")
+        return
+    with engine.begin() as conn:
+        existing = conn.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN "
+            "(?, ?, ?)", tuple(_TRIGGERS)
+        ).scalar()
+        if existing == len(_TRIGGERS):
+            return
+        for statement in _STATS_DDL:
+            conn.exec_driver_sql(statement)
+    logger.info("Library stats triggers created.")
+
+
+def create_library_version_triggers(conn: Connection):
+    if not supports_library_stats(conn.engine):
+        return
+    for statement in _VERSION_DDL:
+        conn.exec_driver_sql(statement)
+
+
+def decade_key(publication_year) -> str:
+    if publication_year is None:
+        return "unknown"
+    return f"{int(publication_year) // 10 * 10:04d}s"
+
+
+def count_books(db: Session, user_id) -> int:
+    if not supports_library_stats(db.get_bind()):
+        return db.query(Book).filter(Book.user_id == user_id,
+                                     ~Book.is_deleted).count()
+    total = db.query(LibraryStat.count).filter(
+        LibraryStat.user_id == user_id, LibraryStat.kind == "total",
+        LibraryStat.key == ""
+    ).scalar()
+    return total or 0
+
+
+def get_library_version(db: Session, user_id) -> str:
+    if not supports_library_stats(db.get_bind()):
+        # Without the triggers, derive a version from the row count and the latest write
+        latest = func.max(func.coalesce(Book.updated_at, Book.created_at))
+        count, last_write = db.query(func.count(), latest).filter(
+            Book.user_id == user_id).one()
+        return f"{count}:{last_write.isoformat() if last_write else ''}"
+    version = db.query(LibraryStat.count).filter(
+        LibraryStat.user_id == user_id, LibraryStat.kind == "version",
+        LibraryStat.key == ""
+    ).scalar()
+    return str(version or 0)
+
+
+def get_library_stats(db: Session, user_id, top_authors: int = 10) -> dict:
+    if not supports_library_stats(db.get_bind()):
+        return _compute_library_stats(db, user_id, top_authors)
+
+    authors = db.query(LibraryStat.key, LibraryStat.count).filter(
+        LibraryStat.user_id == user_id, LibraryStat.kind == "author"
+    ).order_by(desc(LibraryStat.count), LibraryStat.key).limit(top_authors).all()
+    decades = db.query(LibraryStat.key, LibraryStat.count).filter(
+        LibraryStat.user_id == user_id, LibraryStat.kind == "decade"
+    ).order_by(LibraryStat.key).all()
+    return {
+        "total_books": count_books(db, user_id),
+        "top_authors": [{"author": key, "count": count} for key, count in authors],
+        "by_decade": [{"decade": key, "count": count} for key, count in decades],
+    }
+
+
+def _compute_library_stats(db: Session, user_id, top_authors: int) -> dict:
+    live = db.query(Book).filter(Book.user_id == user_id, ~Book.is_deleted)
+    authors = (live.with_entities(Book.author, func.count()).group_by(Book.author)
+               .order_by(desc(func.count()), Book.author).limit(top_authors).all())
+    decades = {}
+    year = extract("year", Book.publication_date)
+    per_year = live.with_entities(year, func.count()).group_by(year)
+    for publication_year, count in per_year:
+        key = decade_key(publication_year)
+        decades[key] = decades.get(key, 0) + count
+    return {
+        "total_books": live.count(),
+        "top_authors": [{"author": key, "count": count} for key, count in authors],
+        "by_decade": [{"decade": key, "count": decades[key]}
+                      for key in sorted(decades)],
+    }
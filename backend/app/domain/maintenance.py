@@ -0,0 +1,42 @@
+import logging
+
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Storage upkeep for SQLite files. Other databases (Postgres autovacuum/autoanalyze)
+# maintain themselves, so these are no-ops there.
+
+
+def supports_storage_maintenance(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def storage_stats(engine: Engine) -> dict:
+    if not supports_storage_maintenance(engine):
+        return {}
+    with engine.connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return {"database_bytes": page_size * page_count,
+            "free_bytes": page_size * free_pages}
+
+
+# Refresh planner statistics; PRAGMA optimize only re-analyzes tables
+# whose stats are stale
+def analyze(engine: Engine):
+    if not supports_storage_maintenance(engine):
+        return
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.commit()
+
+
+# Rewrite the file without its free pages. VACUUM cannot run inside a transaction and
+# blocks writers while it runs, so callers only do it once enough space is reclaimable.
+def vacuum(engine: Engine):
+    if not supports_storage_maintenance(engine):
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
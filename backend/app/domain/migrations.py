@@ -0,0 +1,146 @@
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema changes for databases that already exist. create_all() only creates
+# missing tables, so anything added to an existing table (indexes, columns) ships as a
+# migration here. Migrations run in order at startup, each in its own transaction, and
+# are recorded in schema_migrations; fresh databases run them too (they must be
+# idempotent against create_all).
+# Usage (from backend/):
+#     python -m app.domain.migrations [upgrade|status]
+MIGRATIONS_TABLE = "schema_migrations"
+
+_migrations_metadata = MetaData()
+schema_migrations = Table(
+    MIGRATIONS_TABLE, _migrations_metadata,
+    Column("version", String, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# (version, description, apply(conn)) in the order they must run
+MIGRATIONS = []
+
+
+def migration(version: str, description: str):
+    def register(apply):
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return register
+
+
+# Create an index exactly as the models declare it (dialect-specific options included)
+def create_declared_index(conn: Connection, table_name: str, index_name: str):
+    from app.domain.db import Base
+    table = Base.metadata.tables[table_name]
+    index = next(index for index in table.indexes if index.name == index_name)
+    index.create(bind=conn, checkfirst=True)
+
+
+# Add a column exactly as the models declare it, unless create_all already did
+def add_declared_column(conn: Connection, table_name: str, column_name: str):
+    from app.domain.db import Base
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    conn.exec_driver_sql(
+        f"ALTER TABLE {table_name} ADD COLUMN {column_name} "
+        f"{column.type.compile(dialect=conn.dialect)}")
+
+
+def drop_index(conn: Connection, index_name: str):
+    conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+
+
+@migration("0001", "Partial index over live books for per-user listings")
+def _books_live_listing_index(conn: Connection):
+    create_declared_index(conn, "books", "ix_books_user_live_created")
+    # Full (user_id, is_deleted, created_at, id) index created by earlier startups
+    drop_index(conn, "ix_books_user_deleted_created")
+
+
+@migration("0002", "Top-authors index on library_stats covering the key tie-break")
+def _library_stats_top_index(conn: Connection):
+    create_declared_index(conn, "library_stats", "ix_library_stats_user_kind_top")
+    drop_index(conn, "ix_library_stats_user_kind_count")
+
+
+@migration("0003", "Per-user library version triggers for ETags")
+def _library_version_triggers(conn: Connection):
+    from app.domain.library_stats import create_library_version_triggers
+    create_library_version_triggers(conn)
+
+
+@migration("0004", "Partial index over soft-deleted books for the tombstone purge")
+def _books_tombstone_index(conn: Connection):
+    create_declared_index(conn, "books", "ix_books_deleted_updated")
+
+
+@migration("0005",
+           "Cover blob store references; inline data-URI covers moved into the store")
+def _book_cover_ids(conn: Connection):
+    from app.domain.covers import move_inline_covers
+    add_declared_column(conn, "books", "cover_id")
+    create_declared_index(conn, "books", "ix_books_cover_id")
+    move_inline_covers(conn)
+
+
+@migration("0006", "Owner of each background job, for the caller-scoped job status")
+def _background_job_owner(conn: Connection):
+    add_declared_column(conn, "background_jobs", "user_id")
+    create_declared_index(conn, "background_jobs", "ix_background_jobs_user_id")
+
+
+def applied_versions(conn: Connection) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine) -> list:
+    _migrations_metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+    return [entry for entry in MIGRATIONS if entry[0] not in applied]
+
+
+def run_migrations(engine: Engine):
+    for version, description, apply in pending_migrations(engine):
+        with engine.begin() as conn:
+            apply(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.now()))
+        logger.info("Applied migration %s: %s", version, description)
+
+
+def main(argv: list):
+    # Imported to register their tables
+    import app.models.book  # noqa: F401
+    import app.models.job  # noqa: F401
+    import app.models.library_stat  # noqa: F401
+    import app.models.user  # noqa: F401
+    from app.domain.db import init_db, shard_engines
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    command = argv[0] if argv else "upgrade"
+    if command == "status":
+        for shard_engine in shard_engines:
+            if len(shard_engines) > 1:
+                print(shard_engine.url)
+            pending = {entry[0] for entry in pending_migrations(shard_engine)}
+            for version, description, _ in MIGRATIONS:
+                print(f"{version}  {'pending' if version in pending else 'applied'}  "
+                      f"{description}")
+    elif command == "upgrade":
+        init_db()
+    else:
+        sys.exit(f"Unknown command {command!r}; expected 'upgrade' or 'status'")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
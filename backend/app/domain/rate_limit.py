@@ -0,0 +1,204 @@
+import fnmatch
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Token buckets: each (rule, client) key holds up to `burst` tokens, refilled at
+# `rate` tokens per second; a request takes one token or is rejected with the time
+# until one is available. A request matching several rules takes a token from each
+# bucket only when every one of them has one, so a request rejected by one rule
+# spends nothing from the others.
+PERIODS = {"s": 1, "second": 1, "m": 60, "minute": 60, "h": 3600, "hour": 3600,
+           "d": 86400, "day": 86400}
+RATE_PATTERN = re.compile(r"^(?P<count>\d+(?:\.\d+)?)/(?P<period>[a-z]+)"
+                          r"(?:\s+burst\s+(?P<burst>\d+))?$")
+# "<name>: <METHOD|*> <path globs> <rate> by <ip|user>", e.g.
+#     "login: POST /api/v1/login 20/minute burst 10 by ip"
+# where <path globs> is a comma-separated list; globs starting with "!" exclude
+# paths, e.g. "/api/v1/*,!/api/v1/login"
+RULE_PATTERN = re.compile(r"^(?P<name>[\w-]+):\s*(?P<method>\*|[A-Z]+)\s+(?P<path>\S+)"
+                          r"\s+(?P<rate>.+?)\s+by\s+(?P<key>ip|user)$")
+
+
+def parse_rate(spec: str):
+    # "10/minute" or "10/minute burst 5" -> (tokens per second, bucket size); burst
+    # defaults to count
+    found = RATE_PATTERN.match(spec.strip().lower())
+    if not found or found["period"] not in PERIODS or float(found["count"]) <= 0:
+        raise ValueError(f"Invalid rate limit {spec!r}; "
+                         "expected e.g. '10/minute burst 5'")
+    count = float(found["count"])
+    burst = int(found["burst"]) if found["burst"] else max(1, int(count))
+    return count / PERIODS[found["period"]], burst
+
+
+class RateLimitRule:
+    def __init__(self, name: str, method: str, path: str, rate: float, burst: int,
+                 key: str):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.key = key
+        globs = path.split(",")
+        self.included = [glob for glob in globs if not glob.startswith("!")]
+        self.excluded = [glob[1:] for glob in globs if glob.startswith("!")]
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method not in ("*", method):
+            return False
+        return any(fnmatch.fnmatchcase(path, glob) for glob in self.included) and \
+            not any(fnmatch.fnmatchcase(path, glob) for glob in self.excluded)
+
+
+def parse_rules(spec: str) -> list:
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        found = RULE_PATTERN.match(item)
+        if not found:
+            raise ValueError(f"Invalid rate limit rule {item!r}")
+        rate, burst = parse_rate(found["rate"])
+        rules.append(RateLimitRule(found["name"], found["method"], found["path"], rate,
+                                   burst, found["key"]))
+    return rules
+
+
+# In-process buckets. Only touched from the event loop, so no locking; the least
+# recently used keys are dropped beyond max_keys (a dropped bucket comes back full, as
+# an idle one would be).
+class MemoryBucketStore:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return (await self.take_all([(key, rate, burst)]))[0]
+
+    async def take_all(self, buckets: list) -> list:
+        # buckets: (key, rate, burst); the seconds until each has a token, all 0 when
+        # one was taken from every bucket
+        now = time.monotonic()
+        refilled = []
+        for key, rate, burst in buckets:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            refilled.append(min(burst, tokens + (now - updated) * rate))
+        allowed = all(tokens >= 1 for tokens in refilled)
+        waits = []
+        for (key, rate, _), tokens in zip(buckets, refilled):
+            waits.append(0.0 if tokens >= 1 else (1 - tokens) / rate)
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return waits
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Buckets shared by every worker and host through Redis (RATE_LIMIT_STORE=redis, needs
+# the redis package). The refill-and-take of all of a request's buckets runs as one
+# Lua script on the server clock, so it is atomic. ARGV holds rate, burst per key.
+REDIS_TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local tokens, waits = {}, {}
+local allowed = true
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local updated = tonumber(bucket[2]) or now
+    tokens[i] = math.min(burst, (tonumber(bucket[1]) or burst)
+                         + math.max(0, now - updated) * rate)
+    if tokens[i] >= 1 then
+        waits[i] = '0'
+    else
+        waits[i] = tostring((1 - tokens[i]) / rate)
+        allowed = false
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    if allowed then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens[i]), 'updated', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000))
+end
+return waits
+"""
+
+
+class RedisBucketStore:
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio
+        self.prefix = prefix
+        self._client = redis.asyncio.from_url(url)
+        self._take = self._client.register_script(REDIS_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return (await self.take_all([(key, rate, burst)]))[0]
+
+    async def take_all(self, buckets: list) -> list:
+        args = [value for _, rate, burst in buckets for value in (rate, burst)]
+        waits = await self._take(keys=[self.prefix + key for key, _, _ in buckets],
+                                 args=args)
+        return [float(wait) for wait in waits]
+
+    def __len__(self):
+        return 0
+
+
+class RateLimiter:
+    def __init__(self, store, rules: list):
+        self.store = store
+        self.rules = rules
+
+    def matching_rules(self, method: str, path: str) -> list:
+        return [rule for rule in self.rules if rule.matches(method, path)]
+
+    # Seconds until the request would be allowed; 0 when it is. A failing shared store
+    # lets requests through rather than taking the API down with it.
+    async def hit(self, rule: RateLimitRule, client_key: str) -> float:
+        return (await self.hit_all([(rule, client_key)]))[1]
+
+    # hits: (rule, client key) for every rule a request matches. Returns the rule that
+    # rejected it, with the longest wait, and that wait; (None, 0) when every bucket
+    # had a token, and only then are tokens taken.
+    async def hit_all(self, hits: list):
+        if not hits:
+            return None, 0.0
+        buckets = [(f"{rule.name}:{client_key}", rule.rate, rule.burst)
+                   for rule, client_key in hits]
+        try:
+            waits = await self.store.take_all(buckets)
+        except Exception as e:
+            logger.error("Rate limit store failed for rules %s: %s",
+                         ", ".join(rule.name for rule, _ in hits), e)
+            return None, 0.0
+        wait, index = max((wait, index) for index, wait in enumerate(waits))
+        return (hits[index][0], wait) if wait > 0 else (None, 0.0)
+
+
+def create_bucket_store():
+    if settings.RATE_LIMIT_STORE == "redis":
+        return RedisBucketStore(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryBucketStore(settings.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limiter = RateLimiter(create_bucket_store(),
+                           parse_rules(settings.RATE_LIMIT_RULES))
+
+# Attempts per account and client address on /login, on top of the per-IP rule: slows
+# down guessing one user's password, while anyone else sending bad logins with that
+# username (to lock its owner out) only drains their own bucket ("" disables)
+login_username_rule = None
+if settings.RATE_LIMIT_LOGIN_PER_USERNAME:
+    login_username_rule = RateLimitRule(
+        "login-username", "POST", "/api/v1/login",
+        *parse_rate(settings.RATE_LIMIT_LOGIN_PER_USERNAME), "username")
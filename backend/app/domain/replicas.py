@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+import hmac
+import itertools
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Read replicas: copies of a shard's database that only serve reads. GET handlers that
+# opt in (app.domain.db.use_replica) run their queries on one of the shard's healthy
+# replicas, picked round-robin per request; everything else, and every read of a user
+# who wrote within REPLICA_READ_YOUR_WRITES_SECONDS, stays on the primary. Postgres
+# replicas are hot standbys fed by streaming replication; for SQLite,
+# `python -m app.domain.replicas sync` stands in for replication by copying each
+# primary file over its replicas.
+
+# Replica lag on a Postgres standby; NULL on a primary, where it is not a replica at all
+POSTGRES_LAG_QUERY = ("SELECT CASE WHEN pg_is_in_recovery() "
+                      "THEN COALESCE(EXTRACT(EPOCH FROM now() - "
+                      "pg_last_xact_replay_timestamp()), 0) END")
+
+# Users with a recent write in this process, oldest first: user id -> monotonic time
+# of the write
+_recent_writes = OrderedDict()
+_recent_writes_lock = threading.Lock()
+
+# Read-your-writes across processes: the time of a user's last write goes back to the
+# client signed (app.api.replicas.LastWriteMiddleware), comes back with their next
+# requests and counts like a write made in this process. Per request: {"seen": (user
+# id, time) the request carried, or None; "written": (user id, time) of a write
+# committed while serving it, or None}.
+request_last_write = ContextVar("request_last_write", default=None)
+
+
+def parse_replica_urls(value: str, shards: int) -> list:
+    # "url,url;url,url;..." lists each shard's replicas in shard order (";" between
+    # shards); an empty group, or a missing one at the end, leaves that shard
+    # without replicas
+    groups = [[url.strip() for url in group.split(",") if url.strip()]
+              for group in (value or "").split(";")]
+    if len(groups) > shards:
+        raise ValueError(f"DATABASE_REPLICA_URLS lists replicas for {len(groups)} "
+                         f"shards, there are {shards}")
+    return groups + [[] for _ in range(shards - len(groups))]
+
+
+def display_url(url: str) -> str:
+    return make_url(url).render_as_string(hide_password=True)
+
+
+class ReplicaSet:
+    # The replicas of one shard: which are healthy, and the round-robin over those
+    def __init__(self, urls: list):
+        self.urls = urls
+        self.healthy = [True] * len(urls)
+        self.lag_seconds = [None] * len(urls)
+        self.failed_checks = [0] * len(urls)
+        self.reads = [0] * len(urls)
+        self._turn = itertools.count()
+
+    def pick(self):
+        # Index of the next healthy replica, or None when there is none (reads
+        # use the primary)
+        healthy = [index for index, ok in enumerate(self.healthy) if ok]
+        if not healthy:
+            return None
+        index = healthy[next(self._turn) % len(healthy)]
+        self.reads[index] += 1
+        return index
+
+    def mark(self, index: int, healthy: bool, lag_seconds: float = None):
+        if self.healthy[index] != healthy:
+            logger.warning("Replica %s is %s", display_url(self.urls[index]),
+                           "healthy again" if healthy else "down")
+        self.healthy[index] = healthy
+        self.lag_seconds[index] = lag_seconds
+        if not healthy:
+            self.failed_checks[index] += 1
+
+    def status(self) -> list:
+        return [{"url": display_url(url), "healthy": self.healthy[index],
+                 "lag_seconds": self.lag_seconds[index],
+                 "failed_checks": self.failed_checks[index], "reads": self.reads[index]}
+                for index, url in enumerate(self.urls)]
+
+
+def check_replica(replica_engine):
+    # (healthy, lag in seconds or None); a replica that can't be reached or lags
+    # more than REPLICA_MAX_LAG_SECONDS is taken out of the rotation until a
+    # later check passes
+    try:
+        with replica_engine.connect() as conn:
+            # Fails on a replica without the schema, e.g. a SQLite file not copied yet
+            conn.execute(text("SELECT 1 FROM books LIMIT 1"))
+            lag = None
+            if replica_engine.dialect.name == "postgresql":
+                lag = conn.execute(text(POSTGRES_LAG_QUERY)).scalar()
+                lag = float(lag) if lag is not None else None
+    except Exception as e:
+        logger.warning("Replica %s failed its health check: %s", replica_engine.url, e)
+        return False, None
+    return lag is None or lag <= settings.REPLICA_MAX_LAG_SECONDS, lag
+
+
+def note_write(user_id):
+    last_write = request_last_write.get()
+    if last_write is not None:
+        last_write["written"] = (user_id, time.time())
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[user_id] = now
+        _recent_writes.move_to_end(user_id)
+        # Entries past the window no longer matter
+        while _recent_writes:
+            oldest, written_at = next(iter(_recent_writes.items()))
+            if now - written_at <= settings.REPLICA_READ_YOUR_WRITES_SECONDS:
+                break
+            del _recent_writes[oldest]
+
+
+def wrote_recently(user_id) -> bool:
+    # A write made in this process, or one another worker served, as told by the
+    # signed last-write marker of the request
+    window = settings.REPLICA_READ_YOUR_WRITES_SECONDS
+    written_at = _recent_writes.get(user_id)
+    if written_at is not None and time.monotonic() - written_at <= window:
+        return True
+    last_write = request_last_write.get()
+    seen = last_write and last_write["seen"]
+    return bool(seen) and seen[0] == str(user_id) and time.time() - seen[1] <= window
+
+
+def _last_write_signature(value: str) -> str:
+    return hmac.new((settings.SECRET_KEY or "").encode(), value.encode(),
+                    hashlib.sha256).hexdigest()
+
+
+# "<user id>.<unix time in ms>.<HMAC>", signed with SECRET_KEY so a client can't
+# make up writes (and pin itself to the primary)
+def last_write_token(user_id, written_at: float) -> str:
+    value = f"{user_id}.{int(written_at * 1000)}"
+    return f"{value}.{_last_write_signature(value)}"
+
+
+def read_last_write_token(token: str):
+    # (user id as a string, unix time), or None for a token we did not sign
+    user_id, _, rest = token.partition(".")
+    written_ms, _, signature = rest.partition(".")
+    if not user_id or not written_ms.isdigit() or not hmac.compare_digest(
+            signature, _last_write_signature(f"{user_id}.{written_ms}")):
+        return None
+    return user_id, int(written_ms) / 1000
+
+
+def copy_database(primary_path: str, replica_path: str):
+    # SQLite online backup: a consistent snapshot of the primary, even while it is being
+    # written, replacing the replica's pages in one transaction (readers of the replica
+    # wait, then see it)
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def sync_sqlite_replicas(shard_urls: list, replica_urls: list) -> int:
+    copied = 0
+    for shard_url, urls in zip(shard_urls, replica_urls):
+        primary = make_url(shard_url)
+        for url in urls:
+            replica = make_url(url)
+            if primary.get_backend_name() != "sqlite" or \
+                    replica.get_backend_name() != "sqlite":
+                logger.info("Skipping %s: only SQLite files are copied",
+                            display_url(url))
+                continue
+            copy_database(primary.database, replica.database)
+            copied += 1
+    return copied
+
+
+# SQLite replica stand-in (from backend/):
+#   python -m app.domain.replicas sync
+#       copy every shard's primary over its replicas once
+#   python -m app.domain.replicas sync --interval 2
+#       keep copying, like a replica lagging up to ~2 s
+#   python -m app.domain.replicas status
+#       health check of every configured replica
+def main(argv: list):
+    from app.domain.db import REPLICA_URLS, SHARD_URLS, replica_engines
+
+    parser = argparse.ArgumentParser(prog="python -m app.domain.replicas")
+    parser.add_argument("command", choices=["sync", "status"])
+    parser.add_argument("--interval", type=float, default=0,
+                        help="seconds between copies (0: copy once)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not any(REPLICA_URLS):
+        sys.exit("No replicas configured (DATABASE_REPLICA_URLS)")
+    if args.command == "status":
+        for shard, engines in enumerate(replica_engines):
+            for replica_engine in engines:
+                healthy, lag = check_replica(replica_engine)
+                print(f"shard {shard}  {display_url(replica_engine.url)}  "
+                      f"{'healthy' if healthy else 'DOWN'}  lag={lag}")
+        return
+    while True:
+        started = time.perf_counter()
+        copied = sync_sqlite_replicas(SHARD_URLS, REPLICA_URLS)
+        logger.info("Copied %d replica(s) in %.3fs", copied,
+                    time.perf_counter() - started)
+        if args.interval <= 0:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+import logging
+import re
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Full-text index over book title/author. Every indexed term is prefixed with its owner
+# ("<owner>_<word>"), so a per-user prefix query only walks that user's postings no
+# matter how many books other users have. Rows are maintained by triggers on the books
+# table, so every writer (single inserts, updates, soft deletes) keeps the index in
+# sync.
+FTS_TABLE = "books_fts"
+
+_WORD_SPLIT = re.compile(r"[\W_]+")
+
+_SEARCH_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, author,
+        tokenize = "unicode61 remove_diacritics 2 tokenchars '_'"
+    )
+    """,
+    # Rank title matches above author matches
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 5.0)')",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books
+    WHEN NOT coalesce(new.is_deleted, 0) BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author)
+        VALUES (new.rowid, fts_terms(new.user_id, new.title),
+                fts_terms(new.user_id, new.author));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_fts_au
+    AFTER UPDATE OF title, author, user_id, is_deleted ON books BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+        INSERT INTO {FTS_TABLE}(rowid, title, author)
+        SELECT new.rowid, fts_terms(new.user_id, new.title),
+               fts_terms(new.user_id, new.author)
+        WHERE NOT coalesce(new.is_deleted, 0);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+    END
+    """,
+    # Backfill books that existed before the index was created
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, title, author)
+    SELECT rowid, fts_terms(user_id, title), fts_terms(user_id, author) FROM books
+    WHERE NOT coalesce(is_deleted, 0)
+    """,
+]
+
+
+def supports_fts(engine: Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def owner_token(user_id) -> str:
+    return "u" + str(user_id).replace("-", "")
+
+
+def fts_terms(user_id, value) -> str:
+    if value is None:
+        return ""
+    owner = owner_token(user_id)
+    return " ".join(f"{owner}_{word}" for word in _WORD_SPLIT.split(value) if word)
+
+
+def register_search_functions(engine: Engine):
+    if not supports_fts(engine):
+        return
+
+    # The index triggers call fts_terms(), so it must exist on every connection that
+    # writes books
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("fts_terms", 2, fts_terms, deterministic=True)
+
+
+def create_search_index(engine: Engine):
+    if not supports_fts(engine):
+        logger.info("Full-text search index skipped: not supported by the "
+                    "configured database.")
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first()
+        if exists:
+            return
+        for statement in _SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+    logger.info("Full-text search index created.")
+
+
+def build_match_query(user_id, search_query: str):
+    # Every word becomes a quoted, owner-scoped prefix term, so input can never inject
+    # FTS5 syntax
+    words = [word for word in _WORD_SPLIT.split(search_query) if word]
+    if not words:
+        return None
+    owner = owner_token(user_id)
+    terms = " AND ".join(f'"{owner}_{word}"*' for word in words)
+    return f"{{title author}} : ({terms})"
@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import logging
+import sys
+import uuid
+
+from sqlalchemy import delete, func, inspect, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Shared-nothing partitioning by user: an account and everything hanging off it (books,
+# library stats, search and duplicate index rows) live in one database, the shard its
+# user id hashes to. Shards are separate SQLite files (or Postgres databases), each with
+# its own writer lock, so writes of users on different shards never wait for each other.
+# Jump consistent hashing maps ids to shards: growing from N to N + 1 shards only moves
+# the users that now belong to the new one (about 1 in N + 1), which
+# `python -m app.domain.sharding rebalance` does offline.
+_UINT64 = (1 << 64) - 1
+_JUMP_MULTIPLIER = 2862933555777941757
+
+# Rows copied per INSERT when moving a user's books
+REBALANCE_BATCH_SIZE = 1000
+
+
+def parse_shard_urls(value: str, default: str) -> list:
+    # "url,url,..." in shard order; empty means one shard, the default database
+    return [url.strip() for url in (value or "").split(",") if url.strip()] or [default]
+
+
+def _key_hash(key) -> int:
+    # Stable across processes and restarts, unlike hash()
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(),
+                          "big")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    # Lamping & Veach, "A Fast, Minimal Memory, Consistent Hash Algorithm"
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * _JUMP_MULTIPLIER + 1) & _UINT64
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_key(key, shards: int) -> int:
+    return jump_hash(_key_hash(key), shards) if shards > 1 else 0
+
+
+def new_user_id(username: str, shards: int) -> str:
+    # A random id that hashes to the same shard as the username. Concurrent signups for
+    # one username then land on the same shard, where its unique constraint settles the
+    # race, and logins (which only know the username) find the account with one lookup.
+    home = shard_for_key(username, shards)
+    while True:
+        user_id = str(uuid.uuid4())
+        if shard_for_key(user_id, shards) == home:
+            return user_id
+
+
+def lookup_order(shards: int, user_id=None, username: str = None) -> list:
+    # Shards that may hold an account: only its own when the id is known,
+    # otherwise the username's home shard first, then the rest (accounts renamed
+    # or moved by a rebalance)
+    if user_id is not None:
+        return [shard_for_key(user_id, shards)]
+    first = shard_for_key(username, shards) if username is not None else 0
+    return [first] + [shard for shard in range(shards) if shard != first]
+
+
+def _copy_user(source: Engine, target: Engine, user_id: str) -> int:
+    # Imported here: the models depend on app.domain.db, which depends on this module
+    from app.domain.library_stats import supports_library_stats
+    from app.models.book import Book
+    from app.models.library_stat import LibraryStat
+    from app.models.user import User
+
+    books = Book.__table__
+    with source.connect() as conn:
+        user = conn.execute(
+            select(User.__table__).where(User.id == user_id)).mappings().one()
+        book_rows = conn.execute(select(books).where(books.c.user_id == user_id))
+        rows = [dict(row) for row in book_rows.mappings()]
+        version = None
+        if supports_library_stats(source):
+            version = conn.execute(select(LibraryStat.count).where(
+                LibraryStat.user_id == user_id, LibraryStat.kind == "version")).scalar()
+
+    # One transaction on the target; leftovers of an interrupted earlier run are
+    # replaced. The triggers rebuild the stats, search and duplicate index rows as the
+    # books are inserted.
+    with target.begin() as conn:
+        conn.execute(delete(books).where(books.c.user_id == user_id))
+        conn.execute(delete(User.__table__).where(User.id == user_id))
+        conn.execute(User.__table__.insert(), [dict(user)])
+        for offset in range(0, len(rows), REBALANCE_BATCH_SIZE):
+            conn.execute(books.insert(), rows[offset:offset + REBALANCE_BATCH_SIZE])
+        if version is not None and supports_library_stats(target):
+            # Past the source's version, so ETags handed out before the move
+            # never match again
+            conn.execute(update(LibraryStat).where(
+                LibraryStat.user_id == user_id, LibraryStat.kind == "version"
+            ).values(count=LibraryStat.count + version + 1))
+
+    # Only removed from the source once the copy committed: a crash leaves a duplicate
+    # that the next run replaces, never a lost library
+    with source.begin() as conn:
+        conn.execute(delete(books).where(books.c.user_id == user_id))
+        conn.execute(delete(User.__table__).where(User.id == user_id))
+    return len(rows)
+
+
+def plan_moves(source_urls: list, target_urls: list, engines: dict) -> dict:
+    # user id -> (source URL, target URL) for every user whose shard under target_urls
+    # is not the database it is in now; a URL in both lists keeps the users that still
+    # hash to it
+    from app.models.user import User
+
+    moves = {}
+    for source_url in dict.fromkeys(source_urls):
+        with engines[source_url].connect() as conn:
+            for user_id in conn.execute(select(User.id)).scalars():
+                target_url = target_urls[shard_for_key(user_id, len(target_urls))]
+                if target_url != source_url:
+                    moves[user_id] = (source_url, target_url)
+    return moves
+
+
+def isbn_collisions(moves: dict, engines: dict) -> list:
+    # ISBNs are unique per database, so two users' books can share one only while they
+    # are on different shards. Finds the ISBNs that would meet in a target: a moving
+    # user's book against one already there, or against another user moving to the same
+    # target. Rows of users leaving a target still count, as their move may run after
+    # the one into it; leftovers of the moving user's own interrupted copy don't, as the
+    # copy replaces them.
+    from app.models.book import Book
+
+    books = Book.__table__
+    owners = {}  # target URL -> {isbn: user id}
+    collisions = []
+
+    def claim(target_url, isbn, user_id):
+        owner = owners.setdefault(target_url, {}).setdefault(isbn, user_id)
+        if owner != user_id:
+            collisions.append({"isbn": isbn, "target": target_url,
+                               "users": [owner, user_id]})
+
+    with_isbn = select(books.c.user_id, books.c.isbn).where(books.c.isbn.isnot(None))
+    for source_url in dict.fromkeys(source for source, _ in moves.values()):
+        with engines[source_url].connect() as conn:
+            for user_id, isbn in conn.execute(with_isbn):
+                move = moves.get(user_id)
+                if move and move[0] == source_url:
+                    claim(move[1], isbn, user_id)
+    for target_url in dict.fromkeys(target for _, target in moves.values()):
+        if not inspect(engines[target_url]).has_table(books.name):
+            # Not created yet (a dry run skips that): holds nothing
+            continue
+        with engines[target_url].connect() as conn:
+            for user_id, isbn in conn.execute(with_isbn):
+                move = moves.get(user_id)
+                if not move or move[1] != target_url:
+                    claim(target_url, isbn, user_id)
+    return collisions
+
+
+def rebalance(source_urls: list, target_urls: list, engines: dict,
+              dry_run: bool = False) -> dict:
+    # Moves every user whose shard under target_urls is not the database it is in now.
+    # engines maps each URL (sources and targets) to an engine. Nothing is copied when
+    # an ISBN would collide in a target: the collisions are returned for the operator
+    # to resolve first. Run with the app stopped: requests during a move could read a
+    # half-copied library, write to the old shard, or add a colliding ISBN after the
+    # check.
+    moves = plan_moves(source_urls, target_urls, engines)
+    moved = {"users": 0, "books": 0, "failed": 0,
+             "per_target": {url: 0 for url in target_urls},
+             "collisions": isbn_collisions(moves, engines)}
+    for collision in moved["collisions"]:
+        logger.error("ISBN %s would be held by users %s and %s in %s",
+                     collision["isbn"], *collision["users"], collision["target"])
+    if moved["collisions"] and not dry_run:
+        return moved
+    for user_id, (source_url, target_url) in moves.items():
+        if not dry_run:
+            try:
+                moved["books"] += _copy_user(engines[source_url], engines[target_url],
+                                             user_id)
+            except IntegrityError as e:
+                # Missed by the check (the app was left running?): the user stays put
+                moved["failed"] += 1
+                logger.error("Could not move user %s to %s: %s",
+                             user_id, target_url, e)
+                continue
+            logger.info("Moved user %s to %s", user_id, target_url)
+        moved["users"] += 1
+        moved["per_target"][target_url] += 1
+    return moved
+
+
+def shard_sizes(engines: dict) -> dict:
+    from app.models.book import Book
+    from app.models.user import User
+
+    sizes = {}
+    for url, shard_engine in engines.items():
+        with shard_engine.connect() as conn:
+            sizes[url] = {
+                "users": conn.execute(select(func.count()).select_from(User)).scalar(),
+                "books": conn.execute(select(func.count()).select_from(Book)).scalar(),
+            }
+    return sizes
+
+
+# Shard maintenance (from backend/):
+#   python -m app.domain.sharding status
+#   python -m app.domain.sharding rebalance \
+#       --to "sqlite:///./shard0.db,sqlite:///./shard1.db" [--dry-run]
+# rebalance moves users from the configured shards (DATABASE_SHARD_URLS, or
+# DATABASE_URL) to their shard in the new list, creating missing schemas first; then set
+# DATABASE_SHARD_URLS to the new list and restart. Appending URLs moves the fewest
+# users. It exits non-zero, having moved nobody, if an ISBN would collide in a target,
+# and non-zero if any user failed to move.
+def main(argv: list):
+    # Imported to register their tables
+    import app.models.book  # noqa: F401
+    import app.models.job  # noqa: F401
+    import app.models.library_stat  # noqa: F401
+    import app.models.user  # noqa: F401
+    from app.domain.db import (
+        SHARD_URLS,
+        create_database_engine,
+        init_shard,
+        shard_engines,
+    )
+
+    parser = argparse.ArgumentParser(prog="python -m app.domain.sharding")
+    parser.add_argument("command", choices=["status", "rebalance"])
+    parser.add_argument("--to", dest="target_urls", default="",
+                        help="comma-separated shard URLs, in shard order")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    target_urls = [url.strip() for url in args.target_urls.split(",") if url.strip()]
+    if args.command == "rebalance" and not target_urls:
+        sys.exit("rebalance needs --to with the new shard URLs")
+    engines = dict(zip(SHARD_URLS, shard_engines))
+    for number, url in enumerate(target_urls):
+        if url not in engines:
+            engines[url] = create_database_engine(url, name=f"target-{number}")
+    if args.command == "status":
+        for url, size in shard_sizes(dict(zip(SHARD_URLS, shard_engines))).items():
+            print(f"{url}  {size['users']} users  {size['books']} books")
+        return
+    if not args.dry_run:
+        for url in target_urls:
+            init_shard(engines[url])
+    moved = rebalance(SHARD_URLS, target_urls, engines, args.dry_run)
+    collisions = len(moved["collisions"])
+    if collisions and not args.dry_run:
+        sys.exit(f"Nothing moved: {collisions} ISBN collision(s) in the target shards")
+    if args.dry_run:
+        print(f"Would move {moved['users']} users, {collisions} ISBN collision(s)")
+    else:
+        print(f"Moved {moved['users']} users ({moved['books']} books), "
+              f"{moved['failed']} failed")
+    for url, users in moved["per_target"].items():
+        print(f"  -> {url}: {users} users")
+    # Non-zero for scripts: users were left behind, or would be
+    if moved["failed"] or collisions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,138 @@
+import atexit
+import logging
+import queue
+import sys
+import traceback
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+from app.config import settings
+
+# Request id of the request being handled; set by RequestIdMiddleware, copied into
+# threadpool calls
+request_id = ContextVar("request_id", default=None)
+
+# Pass as extra= on high-frequency messages (per-request lookups and reads): only one in
+# every 1/LOG_SAMPLE_RATE of them is written, per logger and message template
+SAMPLED = {"sampled": True}
+
+# Attributes every LogRecord has; anything else on a record came from extra= and is
+# emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime"}
+
+# Background listener draining the log queue, while logging is configured
+_listener = {"listener": None}
+
+
+class RequestIdFilter(logging.Filter):
+    # Runs in the calling thread, before the record is queued, so the request context is
+    # still current. Records logged outside a request (startup, maintenance) get "-"
+    def filter(self, record):
+        record.request_id = request_id.get() or "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.seen = {}
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or record.levelno > logging.INFO:
+            return True
+        if not self.every:
+            return False
+        key = (record.name, record.msg)
+        count = self.seen.get(key, 0)
+        self.seen[key] = count + 1
+        # Keep the first occurrence, then one in every `every`
+        if count % self.every:
+            return False
+        record.sample_rate = 1 / self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sampled" and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+        return orjson.dumps(entry, default=str).decode()
+
+
+class DeferredQueueHandler(QueueHandler):
+    # QueueHandler.prepare() formats the message in the calling thread (so records can
+    # be pickled); the queue is in-process, so keep the record as is and let the
+    # listener thread do the formatting. Log arguments must therefore be plain values,
+    # not live ORM objects.
+    def prepare(self, record):
+        return record
+
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+
+def parse_levels(spec: str) -> dict:
+    # "app.domain.auth=WARNING,sqlalchemy.engine=INFO"
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+# Route every logger (uvicorn's included) through one queue drained by a background
+# thread, so request handlers only pay for building a LogRecord
+def configure_logging():
+    stop_logging()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json"
+                        else logging.Formatter(TEXT_FORMAT))
+
+    if settings.LOG_QUEUE:
+        handler = DeferredQueueHandler(queue.SimpleQueue())
+        _listener["listener"] = QueueListener(handler.queue, output,
+                                              respect_handler_level=True)
+        _listener["listener"].start()
+    else:
+        handler = output
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    for name, level in parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+# Flush queued records and stop the listener thread; runs at interpreter exit, after
+# uvicorn's own shutdown messages have been queued
+def stop_logging():
+    if _listener["listener"] is not None:
+        _listener["listener"].stop()
+        _listener["listener"] = None
+
+
+atexit.register(stop_logging)
@@ -1,21 +1,49 @@
+import logging
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
-from app.domain.db import init_db
 from app.api.auth import router as auth_routes
 from app.api.book import router as book_routes
-from app.config import settings
-import logging
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+from app.api.covers import router as cover_routes
+from app.api.isbn import router as isbn_routes
+from app.api.jobs import router as job_routes
+from app.api.metrics import MetricsMiddleware
+from app.api.metrics import router as metrics_routes
+from app.api.rate_limit import RateLimitMiddleware
+from app.api.replicas import LastWriteMiddleware
+from app.api.request_id import RequestIdMiddleware
+from app.application.auth import password_pool_stats, shutdown_password_pool
+from app.application.covers import shutdown_cover_pool, thumbnail_stats
+from app.application.jobs import job_stats, start_job_workers, stop_job_workers
+from app.application.maintenance import (
+    maintenance_stats,
+    start_maintenance,
+    stop_maintenance,
 )
+from app.application.replicas import (
+    replica_status,
+    start_replica_checks,
+    stop_replica_checks,
+)
+from app.domain.db import dispose_engines, init_db, pool_metrics, shard_engines
+from app.domain.isbn import isbn_metadata
+from app.logging_config import configure_logging
+
+# JSON records with request ids, written by a background thread (see app.logging_config)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Innermost: over-limit requests get a 429 before routing, auth or database work, while
+# CORS headers, request ids and metrics still apply to them
+app.add_middleware(RateLimitMiddleware)
+# Hands out and reads back the signed time of a user's last write, so any worker keeps
+# their next reads off the replicas
+app.add_middleware(LastWriteMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,15 +53,58 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend read ETags for If-Match on updates, request ids for bug reports,
+    # Retry-After on 429s, duplicate warnings on created books and last-write markers
+    expose_headers=["ETag", "X-Request-ID", "Retry-After", "X-Possible-Duplicates",
+                    "X-Last-Write"],
 )
 
+# Per-route latency, status and DB time for /metrics; added after CORS so it also
+# times CORS handling
+app.add_middleware(MetricsMiddleware)
+# Outermost, so every log record of the request, metrics and CORS included, has its id
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(auth_routes)
 app.include_router(book_routes)
+app.include_router(cover_routes)
+app.include_router(isbn_routes)
+app.include_router(job_routes)
+app.include_router(metrics_routes)
+
+
+# Liveness plus connection pool, replica, password worker pool, thumbnail worker, job
+# worker, ISBN lookup and maintenance gauges
+@app.get("/health")
+async def health():
+    return {"status": "ok", "database_pool": pool_metrics(),
+            "replicas": replica_status(), "password_pool": password_pool_stats,
+            "thumbnails": thumbnail_stats, "jobs": job_stats,
+            "isbn_metadata": isbn_metadata.stats, "maintenance": maintenance_stats}
 
 
 # Startup event to create tables when the app starts
 @app.on_event("startup")
 def on_startup():
     init_db()
-    logger.info(f"Database connected: {settings.DATABASE_URL}")
+    for shard_engine in shard_engines:
+        logger.info("Database connected: %s (%s)", shard_engine.url,
+                    shard_engine.dialect.name)
     logger.info("Database tables checked/created.")
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    start_maintenance()
+    start_job_workers()
+    start_replica_checks()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_maintenance()
+    await stop_job_workers()
+    await stop_replica_checks()
+    await dispose_engines()
+    shutdown_password_pool()
+    shutdown_cover_pool()
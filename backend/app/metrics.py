@@ -0,0 +1,71 @@
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics shared by the API middleware, the engine hooks and the password
+# pool. They live in the default registry and are rendered by GET /metrics. Under
+# gunicorn they run in multiprocess mode (PROMETHEUS_MULTIPROC_DIR): counters and
+# histograms are summed over the workers, gauges as their multiprocess_mode says.
+
+# Sub-millisecond buckets: most SQLite statements finish well under the HTTP defaults
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+PASSWORD_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# HTTP requests, labelled by route template ("/books/{book_id}") rather
+# than the raw path
+http_requests = Counter("http_requests_total", "HTTP requests by route and status code",
+                        ["method", "route", "status"])
+http_request_seconds = Histogram("http_request_duration_seconds",
+                                 "HTTP request latency by route", ["method", "route"])
+http_requests_in_flight = Gauge("http_requests_in_flight",
+                                "HTTP requests currently being served",
+                                multiprocess_mode="livesum")
+
+# Database time spent by each request (summed over its statements)
+http_request_db_queries = Histogram("http_request_db_queries",
+                                    "SQL statements executed per HTTP request",
+                                    ["method", "route"], buckets=QUERY_COUNT_BUCKETS)
+http_request_db_seconds = Histogram("http_request_db_seconds",
+                                    "Time spent in SQL statements per HTTP request",
+                                    ["method", "route"], buckets=QUERY_BUCKETS)
+
+# Individual statements and pool checkouts, per engine ("sync"/"async")
+db_query_seconds = Histogram("db_query_duration_seconds",
+                             "SQL statement latency by engine and statement type",
+                             ["engine", "statement"], buckets=QUERY_BUCKETS)
+db_pool_checkout_wait_seconds = Histogram("db_pool_checkout_wait_seconds",
+                                          "Time spent waiting for a pooled connection",
+                                          ["engine"], buckets=QUERY_BUCKETS)
+
+# Requests turned away by the token-bucket rate limiter, per rule
+rate_limit_rejections = Counter("rate_limit_rejections_total",
+                                "Requests rejected by the rate limiter", ["rule"])
+
+# Password hashing: time queued for a worker slot and time spent hashing/verifying
+password_queue_seconds = Histogram("password_hash_queue_seconds",
+                                   "Time password jobs wait for a worker",
+                                   buckets=PASSWORD_BUCKETS)
+password_hash_seconds = Histogram("password_hash_duration_seconds",
+                                  "Password hash/verify latency",
+                                  ["operation"], buckets=PASSWORD_BUCKETS)
+
+# Statement totals for the request being served; set by the metrics middleware.
+# Threadpool calls run in a copy of the request context, so they update the same dict.
+request_db_usage = ContextVar("request_db_usage", default=None)
+
+STATEMENT_TYPES = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def statement_type(statement: str) -> str:
+    verb = statement.lstrip()[:6].upper()
+    return verb if verb in STATEMENT_TYPES else "OTHER"
+
+
+def record_query(engine_name: str, statement: str, seconds: float):
+    db_query_seconds.labels(engine_name, statement_type(statement)).observe(seconds)
+    usage = request_db_usage.get()
+    if usage is not None:
+        usage["queries"] += 1
+        usage["seconds"] += seconds
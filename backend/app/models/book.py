@@ -1,21 +1,52 @@
 import uuid
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Date, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    text,
+)
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 
 from app.domain.db import Base
 
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # Serves the per-user listing ordered by newest first, including keyset seeks.
+        # Partial: every listing filters is_deleted = 0, so soft-deleted rows are left
+        # out of the index. Existing databases get indexes through
+        # app/domain/migrations.py.
+        Index("ix_books_user_live_created", "user_id", "created_at", "id",
+              sqlite_where=text("is_deleted = 0"),
+              postgresql_where=text("NOT is_deleted")),
+        # Tombstones by age, for the purge job; only soft-deleted rows are indexed
+        Index("ix_books_deleted_updated", "updated_at",
+              sqlite_where=text("is_deleted = 1"), postgresql_where=text("is_deleted")),
+        # Books referencing a stored cover, for the sweep that deletes
+        # unreferenced cover files
+        Index("ix_books_cover_id", "cover_id",
+              sqlite_where=text("cover_id IS NOT NULL"),
+              postgresql_where=text("cover_id IS NOT NULL")),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
     publication_date = Column(Date, nullable=True)
+    # Unique per database: across all users with one database, per shard when sharded
     isbn = Column(String, unique=True, nullable=True)
     cover_image = Column(String, nullable=True)
+    # sha256 of an uploaded cover in the blob store (app/domain/covers.py);
+    # cover_image then is NULL
+    cover_id = Column(String(64), nullable=True)
 
     # User association
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+
+from app.domain.db import Base
+
+
+# Outbox of deferred work (see app/domain/jobs.py). Rows are inserted in the same
+# transaction as the write that needs the follow-up work, so a committed write always
+# has its job recorded.
+# status: "pending" (waiting for run_after), "running" (claimed until run_after, the
+# lease), "done" or "failed" (gave up after JOB_MAX_ATTEMPTS); payload is JSON.
+# user_id is the user whose write queued the job (none for system work); they can see
+# its status, nobody else can.
+class Job(Base):
+    __tablename__ = "background_jobs"
+    __table_args__ = (
+        # Pending jobs that are due, oldest first, and running ones whose lease ran out
+        Index("ix_background_jobs_status_run_after", "status", "run_after"),
+        # Counts per status and kind for /metrics
+        Index("ix_background_jobs_status_kind", "status", "kind"),
+        # Finished jobs by age for the purge
+        Index("ix_background_jobs_status_updated", "status", "updated_at"),
+        # A user's jobs, newest first, for GET /api/v1/jobs
+        Index("ix_background_jobs_user_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Index, Integer, String
+
+from app.domain.db import Base
+
+
+# Per-user book counts maintained by triggers on the books table (see
+# app/domain/library_stats.py). kind is "total" (key ""), "author" (key = author) or
+# "decade" (key = "1990s" or "unknown").
+class LibraryStat(Base):
+    __tablename__ = "library_stats"
+    user_id = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Serves the "top authors" lookup (count desc, then key) without sorting any
+# of a user's rows
+Index("ix_library_stats_user_kind_top", LibraryStat.user_id, LibraryStat.kind,
+      LibraryStat.count.desc(), LibraryStat.key)
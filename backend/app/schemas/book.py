@@ -1,16 +1,24 @@
-from datetime import datetime, date
-from typing import Optional, List
+from datetime import date, datetime
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class BookCreate(BaseModel):
-    title: str
-    author: str
+    # Title and author may be left out when the ISBN is in the catalog
+    # (app/domain/isbn.py)
+    title: Optional[str] = None
+    author: Optional[str] = None
     publication_date: Optional[str] = None
     isbn: Optional[str] = None
     cover_image: Optional[str] = None
 
+class IsbnMetadataResponse(BaseModel):
+    isbn: str
+    title: str
+    author: Optional[str] = None
+    publication_date: Optional[str] = None
+
 class BookUpdate(BaseModel):
     title: Optional[str] = None
     author: Optional[str] = None
@@ -25,21 +33,93 @@ class BookResponse(BaseModel):
     publication_date: Optional[date] = None
     isbn: Optional[str] = None
     cover_image: Optional[str] = None
+    # Stored cover (GET /api/v1/covers/{cover_id}?size=small|medium|original)
+    cover_id: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     is_deleted: bool
 
 class Pagination(BaseModel):
-    page: int
+    page: Optional[int] = None
     limit: int
-    total: int
-    total_pages: int
+    total: Optional[int] = None
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class PaginatedBooksResponse(BaseModel):
     books: List[BookResponse] = []
     pagination: Pagination = {}
 
+class BulkImportError(BaseModel):
+    row: int
+    message: str
+
+class BulkImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: List[BulkImportError] = []
+
+# Ids accepted by one batch request; each batch is a single statement and transaction
+BATCH_MAX_IDS = 500
+
+class BatchIds(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_IDS)
+
+    # Duplicates would get one result each; keep the first occurrence in request order
+    @field_validator("ids")
+    @classmethod
+    def unique_ids(cls, ids):
+        return list(dict.fromkeys(ids))
+
+class BatchBookChanges(BaseModel):
+    # ISBNs are unique per book, so they can only be changed one book at a time
+    # (isbn is rejected)
+    model_config = ConfigDict(extra="forbid")
+
+    title: Optional[str] = None
+    author: Optional[str] = None
+    publication_date: Optional[str] = None
+    cover_image: Optional[str] = None
+
+class BatchUpdate(BatchIds):
+    changes: BatchBookChanges
+
+class BatchResult(BaseModel):
+    id: str
+    success: bool
+    message: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult] = []
+
+class BatchGetResponse(BaseModel):
+    books: List[BookResponse] = []
+    not_found: List[str] = []
+
+class SearchBooksResponse(BaseModel):
+    books: List[BookResponse] = []
+    next_cursor: Optional[str] = None
+
+class DuplicateGroup(BaseModel):
+    # Lowest title similarity between two linked books of the group (0-1)
+    similarity: float
+    books: List[BookResponse] = []
+
+class DuplicatesResponse(BaseModel):
+    groups: List[DuplicateGroup] = []
+    total_groups: int
+
+
+class AuthorCount(BaseModel):
+    author: str
+    count: int
+
+class DecadeCount(BaseModel):
+    decade: str
+    count: int
 
 class LibrarySummary(BaseModel):
     total_books: int
-    recent_additions: List[BookResponse]
\ No newline at end of file
+    recent_additions: List[BookResponse]
+    top_authors: List[AuthorCount] = []
+    by_decade: List[DecadeCount] = []
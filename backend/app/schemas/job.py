@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel
+
+
+# One of the caller's background jobs; status is "pending", "running", "done" or
+# "failed"
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
+
+class JobListResponse(BaseModel):
+    jobs: List[JobResponse] = []
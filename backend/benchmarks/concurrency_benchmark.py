@@ -0,0 +1,152 @@
+"""Concurrent throughput of authenticated book reads against a real uvicorn server.
+
+Starts uvicorn on a fresh SQLite database for each mode, seeds one user's library and
+drives GET /api/v1/books (random pages) plus GET /api/v1/library-summary from many
+concurrent clients, reporting throughput and latency percentiles.
+
+Usage (from backend/, needs httpx):
+    python -m benchmarks.concurrency_benchmark --modes threadpool async --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from app.domain.duplicates import _duplicate_keys_json
+from app.domain.search import fts_terms
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MODES = {
+    "threadpool": {"DATABASE_ASYNC": "false"},
+    "async": {"DATABASE_ASYNC": "true"},
+}
+
+
+def start_server(app_dir: Path, port: int, env_overrides: dict):
+    workdir = tempfile.mkdtemp()
+    shutil.copy(app_dir / ".env", workdir)
+    env = {**os.environ, **env_overrides, "PYTHONPATH": str(app_dir)}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return process, workdir
+
+
+async def wait_until_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            await client.get("/docs")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+async def seed(client: httpx.AsyncClient, database: Path, books: int):
+    user = {"username": "bench", "email": "bench@example.com", "password": "benchpw"}
+    await client.post("/api/v1/signup", json=user)
+    token = (await client.post("/api/v1/login", json=user)).json()["access_token"]
+
+    # Insert the library directly so seeding does not depend on the write
+    # path being measured
+    conn = sqlite3.connect(database)
+    conn.create_function("fts_terms", 2, fts_terms, deterministic=True)
+    conn.create_function("duplicate_keys", 1, _duplicate_keys_json, deterministic=True)
+    with conn:
+        (user_id,) = conn.execute("SELECT id FROM users WHERE username = ?",
+                                  (user["username"],)).fetchone()
+        conn.executemany(
+            "INSERT INTO books (id, title, author, user_id, created_at, updated_at, "
+            "is_deleted) VALUES (?, ?, ?, ?, ?, ?, 0)",
+            ((str(uuid.uuid4()), f"Book {i}", f"Author {i % 50}", user_id,
+              f"2024-01-01 00:00:00.{i:06d}", f"2024-01-01 00:00:00.{i:06d}")
+             for i in range(books)))
+    conn.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def drive(client: httpx.AsyncClient, headers: dict, books: int, concurrency: int,
+                duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    pages = max(1, books // 10)
+
+    async def worker(seed_value):
+        nonlocal errors
+        rng = random.Random(seed_value)
+        while time.perf_counter() < deadline:
+            if rng.random() < 0.8:
+                url = f"/api/v1/books?page={rng.randint(1, pages)}&limit=10"
+            else:
+                url = "/api/v1/library-summary"
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+async def run_mode(args, mode: str, port: int):
+    process, workdir = start_server(Path(args.app_dir), port, MODES[mode])
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                     timeout=60) as client:
+            await wait_until_ready(client)
+            headers = await seed(client, Path(workdir) / "test.db", args.books)
+            return await drive(client, headers, args.books, args.concurrency,
+                               args.duration)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES),
+                        default=["threadpool", "async"])
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--app-dir", default=str(BACKEND_DIR),
+                        help="backend directory to benchmark")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for offset, mode in enumerate(args.modes):
+        result = asyncio.run(run_mode(args, mode, args.port + offset))
+        print(f"{mode:10} {result['requests']:6} req  {result['rps']:8.1f} req/s  "
+              f"p50={result['p50']:7.1f}ms p95={result['p95']:7.1f}ms "
+              f"p99={result['p99']:7.1f}ms errors={result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Measure list-response size and render time with inline covers vs blob store ids.
+
+Seeds a library whose books carry their covers inline as data URIs (how the frontend
+used to store them), renders a page of GET /books the way the API does (BOOK_COLUMNS
+rows + orjson), then moves the covers into the blob store with the 0005 migration step
+and renders the same page again, now carrying only cover ids.
+
+Usage (from backend/):
+    python -m benchmarks.cover_payload_benchmark --books 200 --page 50 --cover-px 600
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+from fastapi.responses import ORJSONResponse
+from PIL import Image
+from sqlalchemy.orm import sessionmaker
+
+from app.api.serialization import book_dicts
+from app.domain.book import BOOK_COLUMNS
+from app.domain.covers import cover_store, move_inline_covers
+from app.domain.db import Base, create_database_engine
+from app.models import user  # noqa: F401  (register tables on Base.metadata)
+from app.models.book import Book
+
+
+def cover_data_uri(px: int, seed: int) -> str:
+    # Noisy image so JPEG can't compress it to nothing, roughly like a scanned cover
+    rng = random.Random(seed)
+    image = Image.effect_noise((px * 2 // 3, px), 64).convert("RGB")
+    image.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)),
+                (0, 0, px // 3, px // 3))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=80)
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode()
+
+
+def seed(engine, books: int, user_id: str, cover_px: int):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO books (id, title, author, cover_image, user_id, created_at, "
+            "updated_at, is_deleted) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            [(str(uuid.uuid4()), f"Title {i}", f"Author {i % 50}",
+              cover_data_uri(cover_px, i), user_id, f"2024-01-01 00:00:00.{i:06d}",
+              f"2024-01-02 00:00:00.{i:06d}") for i in range(books)])
+
+
+def render_page(Session, user_id: str, size: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        session = Session()
+        try:
+            start = time.perf_counter()
+            rows = session.query(*BOOK_COLUMNS).filter(
+                Book.user_id == user_id, ~Book.is_deleted
+            ).order_by(Book.created_at.desc(), Book.id.desc()).limit(size).all()
+            body = ORJSONResponse({"books": book_dicts(rows)}).body
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            session.close()
+    return len(body), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=200)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--cover-px", type=int, default=600,
+                        help="cover height in pixels")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    cover_store.root = os.path.join(workdir, "covers")
+    path = os.path.join(workdir, "covers.db")
+    engine = create_database_engine(f"sqlite:///{path}", name="covers")
+    try:
+        Base.metadata.create_all(bind=engine)
+        user_id = str(uuid.uuid4())
+        seed(engine, args.books, user_id, args.cover_px)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        inline_bytes, inline_ms = render_page(Session, user_id, args.page, args.repeat)
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            moved = move_inline_covers(conn)
+        migrate_seconds = time.perf_counter() - start
+        stored_bytes, stored_ms = render_page(Session, user_id, args.page, args.repeat)
+
+        print(f"{args.page} of {args.books} books, {args.cover_px}px covers "
+              f"({moved} moved in {migrate_seconds:.2f}s)")
+        print(f"  inline data URIs  {inline_bytes:>10,} bytes  {inline_ms:7.2f}ms")
+        print(f"  cover ids         {stored_bytes:>10,} bytes  {stored_ms:7.2f}ms"
+              f"  ({inline_bytes / stored_bytes:,.0f}x smaller)")
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Measure duplicate detection: index insert overhead, report latency and recall.
+
+Seeds a library of distinct titles plus near-duplicate copies of some of them (case
+changes, articles and bracketed notes, one-letter typos), then times bulk inserts with
+and without the index and the duplicate report, and counts how many of the planted
+copies it found.
+
+Usage (from backend/):
+    python -m benchmarks.duplicates_benchmark --books 20000 --duplicates 1000
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.domain.book import BookService
+from app.domain.db import Base, create_database_engine
+from app.domain.duplicates import book_profile, create_duplicate_index, similarity
+from app.domain.library_stats import create_library_stats
+from app.domain.search import create_search_index
+from app.models import book, job, library_stat, user  # noqa: F401  (register tables)
+from app.schemas.book import BookCreate
+
+COMMON_WORDS = ["history", "guide", "love", "war", "life", "world", "night", "secret",
+                "house", "story"]
+CHUNK_SIZE = 1000
+
+
+def library(books: int, duplicates: int, seed: int = 42):
+    # [(title, author)] for the originals followed by the planted copies, and the
+    # (original index, copy index) pairs
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase)
+                          for _ in range(rng.randint(3, 10)))
+                  for _ in range(books)]
+    authors = [f"{rng.choice(vocabulary).title()} {rng.choice(vocabulary).title()}"
+               for _ in range(books // 20 + 1)]
+    rows = []
+    for _ in range(books):
+        words = [rng.choice(COMMON_WORDS) if rng.random() < 0.3
+                 else rng.choice(vocabulary) for _ in range(rng.randint(1, 6))]
+        rows.append((" ".join(words).title(), rng.choice(authors)))
+    pairs = []
+    for _ in range(duplicates):
+        original = rng.randrange(books)
+        title, author = rows[original]
+        variant = rng.random()
+        if variant < 0.3:
+            title = title.upper()
+        elif variant < 0.5:
+            title = f"The {title} (Paperback)"
+        else:
+            position = rng.randrange(len(title))
+            typo = rng.choice(string.ascii_lowercase)
+            title = title[:position] + typo + title[position + 1:]
+        rows.append((title, author))
+        pairs.append((original, len(rows) - 1))
+    return rows, pairs
+
+
+def insert(with_index: bool, rows: list):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "duplicates.db")
+    engine = create_database_engine(f"sqlite:///{path}",
+                                    name=f"duplicates-{with_index}")
+    Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    create_library_stats(engine)
+    if with_index:
+        create_duplicate_index(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    service = BookService(session)
+    start = time.perf_counter()
+    for offset in range(0, len(rows), CHUNK_SIZE):
+        chunk = enumerate(rows[offset:offset + CHUNK_SIZE], offset)
+        service.add_books("bench", [(i, BookCreate(title=title, author=author))
+                                    for i, (title, author) in chunk])
+    return service, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--duplicates", type=int, default=1_000)
+    args = parser.parse_args()
+
+    rows, pairs = library(args.books, args.duplicates)
+    plain, plain_seconds = insert(False, rows)
+    plain.close()
+    service, indexed_seconds = insert(True, rows)
+    print(f"Inserted {len(rows)} books: "
+          f"{plain_seconds * 1e6 / len(rows):.0f}us per book without the index, "
+          f"{indexed_seconds * 1e6 / len(rows):.0f}us with it")
+
+    start = time.perf_counter()
+    report = service.find_duplicates("bench", limit=len(rows))
+    elapsed = time.perf_counter() - start
+    group_of = {}
+    for number, group in enumerate(report["data"]):
+        for row in group["books"]:
+            group_of[(row.title, row.author)] = number
+    # Copies whose title similarity is under the threshold are not duplicates by
+    # definition
+    threshold = settings.DUPLICATE_SIMILARITY_THRESHOLD
+    detectable = [(rows[a], rows[b]) for a, b in pairs
+                  if similarity(book_profile(*rows[a]), book_profile(*rows[b]))
+                  >= threshold]
+    found = sum(1 for a, b in detectable
+                if a in group_of and group_of.get(a) == group_of.get(b))
+    print(f"Report: {elapsed * 1000:.0f}ms for {len(rows)} books "
+          f"({len(rows) * (len(rows) - 1) // 2} possible pairs), "
+          f"{report['total_groups']} groups with {len(group_of)} books")
+    print(f"Recall: {found} of {len(detectable)} planted copies above the similarity "
+          f"threshold ({len(pairs) - len(detectable)} more planted below it)")
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure ISBN metadata lookup latency: catalog file (cold cache) vs in-process LRU.
+
+Usage (from backend/):
+    python -m benchmarks.isbn_lookup_benchmark --isbns 1000000 --lookups 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.domain.isbn import IsbnMetadataCache, IsbnMetadataService, _isbn13_check_digit
+from app.domain.isbn_catalog import SQLiteCatalogProvider, load_catalog
+from benchmarks.search_benchmark import SURNAMES, WORDS
+
+
+def synthetic_isbn(n: int) -> str:
+    first12 = f"978{n:09d}"
+    return first12 + _isbn13_check_digit(first12)
+
+
+def catalog_rows(count: int):
+    rng = random.Random(42)
+    for i in range(count):
+        yield (synthetic_isbn(i * 7),
+               " ".join(rng.choice(WORDS) for _ in range(3)).title(),
+               rng.choice(SURNAMES), f"{1950 + i % 70}-01-01")
+
+
+def time_lookups(service, isbns):
+    samples = []
+    for isbn in isbns:
+        start = time.perf_counter()
+        service.lookup(isbn)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--isbns", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "isbn_catalog.db")
+    start = time.perf_counter()
+    loaded = load_catalog(catalog_rows(args.isbns), path)
+    print(f"Loaded {loaded} ISBNs in {time.perf_counter() - start:.1f}s "
+          f"({os.path.getsize(path) / 1024 / 1024:.0f} MiB)")
+
+    rng = random.Random(7)
+    hits = [synthetic_isbn(rng.randrange(args.isbns) * 7) for _ in range(args.lookups)]
+    misses = [synthetic_isbn(rng.randrange(args.isbns) * 7 + 1)
+              for _ in range(args.lookups)]
+    service = IsbnMetadataService(SQLiteCatalogProvider(path),
+                                  IsbnMetadataCache(args.lookups * 2, 3600))
+    for name, isbns in (("hit", hits), ("miss", misses)):
+        service.cache.clear()
+        cold = time_lookups(service, isbns)
+        cached = time_lookups(service, isbns)
+        print(f"{name:5} catalog p50={cold[0]:7.1f}us p95={cold[1]:7.1f}us | "
+              f"cached p50={cached[0]:7.1f}us p95={cached[1]:7.1f}us")
+
+    start = time.perf_counter()
+    service.cache.clear()
+    for i in range(0, len(hits), 1000):
+        service.lookup_many(hits[i:i + 1000])
+    print(f"lookup_many (bulk import chunks of 1000): "
+          f"{(time.perf_counter() - start) * 1_000_000 / len(hits):.1f}us per ISBN")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Load test of the main API flows against a uvicorn server, with a regression gate.
+
+Starts uvicorn on a fresh SQLite database, seeds USERS x BOOKS synthetic libraries
+straight into the database, then runs each scenario in turn from many concurrent clients
+for a fixed duration, reporting throughput and p50/p95/p99 latency:
+
+    signup         POST /signup with new accounts (bcrypt hash)
+    login          POST /login (bcrypt verify)
+    refresh        POST /refresh-token
+    list_shallow   GET /books, first pages with the exact total
+    list_deep      GET /books, pages near the end of the library (OFFSET)
+    list_cursor    GET /books, walking the whole library with next_cursor (keyset)
+    search         GET /books/search for a word or prefix from the title vocabulary
+    summary        GET /library-summary
+    crud           create / read / update / delete mix on the user's own books
+
+With --baseline, the results are compared with a stored run: a scenario fails when its
+p95 grew or its throughput shrank by more than --tolerance, or when it had errors, and
+the script exits non-zero. --save-baseline writes the current run instead. Baselines
+only compare on the same hardware and settings; record one on the machine that runs
+the check.
+
+Rate limiting is switched off in the server under test so the limits don't cap
+throughput.
+
+Usage (from backend/, needs httpx):
+    python -m benchmarks.load_benchmark --users 20 --books 2000 --concurrency 32
+    python -m benchmarks.load_benchmark --save-baseline benchmarks/baselines/load.json
+    python -m benchmarks.load_benchmark --baseline benchmarks/baselines/load.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from app.application.auth import get_password_hash
+from app.domain.duplicates import _duplicate_keys_json
+from app.domain.search import fts_terms
+from benchmarks.concurrency_benchmark import BACKEND_DIR, start_server, wait_until_ready
+from benchmarks.search_benchmark import SURNAMES, WORDS
+
+SCENARIOS = ["signup", "login", "refresh", "list_shallow", "list_deep", "list_cursor",
+             "search", "summary", "crud"]
+PAGE_SIZE = 20
+PASSWORD = "benchpw1"
+SERVER_ENV = {"RATE_LIMIT_RULES": "", "RATE_LIMIT_LOGIN_PER_USERNAME": "",
+              "LOG_LEVEL": "WARNING"}
+
+
+def seed(database: Path, users: int, books: int):
+    # One bcrypt hash shared by every account: hashing thousands of passwords
+    # would dominate setup
+    hashed_password = get_password_hash(PASSWORD)
+    rng = random.Random(42)
+    accounts = [{"id": str(uuid.uuid4()), "username": f"bench{i}",
+                 "email": f"bench{i}@example.com"} for i in range(users)]
+    conn = sqlite3.connect(database)
+    conn.create_function("fts_terms", 2, fts_terms, deterministic=True)
+    conn.create_function("duplicate_keys", 1, _duplicate_keys_json, deterministic=True)
+    with conn:
+        conn.executemany("INSERT INTO users (id, username, email, hashed_password) "
+                         "VALUES (?, ?, ?, ?)",
+                         [(a["id"], a["username"], a["email"], hashed_password)
+                          for a in accounts])
+        for account in accounts:
+            account["book_ids"] = [str(uuid.uuid4()) for _ in range(books)]
+            conn.executemany(
+                "INSERT INTO books (id, title, author, publication_date, user_id, "
+                "created_at, updated_at, is_deleted) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                ((book_id, " ".join(rng.choice(WORDS) for _ in range(3)).title(),
+                  rng.choice(SURNAMES), f"{rng.randint(1900, 2024)}-01-01",
+                  account["id"], f"2024-01-01 00:00:00.{i:06d}",
+                  f"2024-01-01 00:00:00.{i:06d}")
+                 for i, book_id in enumerate(account["book_ids"])))
+    conn.close()
+    return accounts
+
+
+async def log_in(client: httpx.AsyncClient, accounts: list):
+    async def one(account):
+        credentials = {"username": account["username"], "password": PASSWORD}
+        response = await client.post("/api/v1/login", json=credentials)
+        response.raise_for_status()
+        tokens = response.json()
+        account["headers"] = {"Authorization": f"Bearer {tokens['access_token']}"}
+        account["refresh_token"] = tokens["refresh_token"]
+
+    await asyncio.gather(*(one(account) for account in accounts))
+
+
+# Each scenario is a coroutine issuing one or more requests through `request`, which
+# records the latency and status of every call
+async def scenario_signup(request, rng, account, state):
+    name = f"new{uuid.uuid4().hex[:12]}"
+    await request("POST", "/api/v1/signup",
+                  json={"username": name, "email": f"{name}@example.com",
+                        "password": PASSWORD})
+
+
+async def scenario_login(request, rng, account, state):
+    await request("POST", "/api/v1/login",
+                  json={"username": account["username"], "password": PASSWORD})
+
+
+async def scenario_refresh(request, rng, account, state):
+    await request("POST", "/api/v1/refresh-token",
+                  json={"refresh_token": account["refresh_token"]})
+
+
+async def scenario_list_shallow(request, rng, account, state):
+    await request("GET", f"/api/v1/books?page={rng.randint(1, 3)}&limit={PAGE_SIZE}",
+                  headers=account["headers"])
+
+
+async def scenario_list_deep(request, rng, account, state):
+    pages = max(1, len(account["book_ids"]) // PAGE_SIZE)
+    page = rng.randint(max(1, pages - 5), pages)
+    await request("GET", f"/api/v1/books?page={page}&limit={PAGE_SIZE}",
+                  headers=account["headers"])
+
+
+async def scenario_list_cursor(request, rng, account, state):
+    cursor = state.get("cursor")
+    url = f"/api/v1/books?limit={PAGE_SIZE}" + (f"&cursor={cursor}" if cursor else "")
+    response = await request("GET", url, headers=account["headers"])
+    next_cursor = None
+    if response is not None and response.status_code == 200:
+        next_cursor = response.json()["pagination"].get("next_cursor")
+    state["cursor"] = next_cursor
+
+
+async def scenario_search(request, rng, account, state):
+    word = rng.choice(WORDS)
+    query = word if rng.random() < 0.5 else word[:3]
+    await request("GET", f"/api/v1/books/search?search_query={query}&limit={PAGE_SIZE}",
+                  headers=account["headers"])
+
+
+async def scenario_summary(request, rng, account, state):
+    await request("GET", "/api/v1/library-summary", headers=account["headers"])
+
+
+async def scenario_crud(request, rng, account, state):
+    # 40% read a seeded book, 30% create, 20% update and 10% delete one of the
+    # books created here
+    headers = account["headers"]
+    created = state.setdefault("created", [])
+    roll = rng.random()
+    if roll < 0.4 or (roll >= 0.7 and not created):
+        await request("GET", f"/api/v1/books/{rng.choice(account['book_ids'])}",
+                      headers=headers)
+    elif roll < 0.7:
+        response = await request("POST", "/api/v1/books", headers=headers, json={
+            "title": " ".join(rng.choice(WORDS) for _ in range(3)).title(),
+            "author": rng.choice(SURNAMES),
+            "publication_date": f"{rng.randint(1900, 2024)}-06-01",
+            "isbn": uuid.uuid4().hex[:13]})
+        if response is not None and response.status_code == 200:
+            created.append(response.json()["id"])
+    elif roll < 0.9:
+        title = " ".join(rng.choice(WORDS) for _ in range(2)).title()
+        await request("PUT", f"/api/v1/books/{rng.choice(created)}", headers=headers,
+                      json={"title": title})
+    else:
+        book_id = created.pop(rng.randrange(len(created)))
+        await request("DELETE", f"/api/v1/books/{book_id}", headers=headers)
+
+
+def percentile(samples: list, fraction: float) -> float:
+    return samples[max(0, int(len(samples) * fraction) - 1)]
+
+
+async def drive(client: httpx.AsyncClient, scenario, accounts: list, concurrency: int,
+                duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def request(method, url, **kwargs):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response is None or response.status_code >= 400:
+            errors += 1
+        return response
+
+    async def worker(seed_value):
+        rng = random.Random(seed_value)
+        # Each worker sticks to one account and keeps its own cursor / created books
+        account = accounts[seed_value % len(accounts)]
+        state = {}
+        while time.perf_counter() < deadline:
+            await scenario(request, rng, account, state)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    if not latencies:
+        return {"requests": 0, "errors": errors, "rps": 0.0, "p50": 0.0, "p95": 0.0,
+                "p99": 0.0}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+async def run(args):
+    env = {**SERVER_ENV, "DATABASE_ASYNC": "true" if args.database_async else "false"}
+    process, workdir = start_server(Path(args.app_dir), args.port, env)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}",
+                                     limits=limits, timeout=60) as client:
+            await wait_until_ready(client)
+            start = time.perf_counter()
+            accounts = seed(Path(workdir) / "test.db", args.users, args.books)
+            await log_in(client, accounts)
+            print(f"Seeded {args.users} users x {args.books} books in "
+                  f"{time.perf_counter() - start:.1f}s")
+            for name in args.scenarios:
+                scenario = globals()[f"scenario_{name}"]
+                results[name] = await drive(client, scenario, accounts,
+                                            args.concurrency, args.duration)
+                print_result(name, results[name])
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_result(name: str, result: dict):
+    print(f"{name:13} {result['requests']:7} req  {result['rps']:8.1f} req/s  "
+          f"p50={result['p50']:7.1f}ms p95={result['p95']:7.1f}ms "
+          f"p99={result['p99']:7.1f}ms errors={result['errors']}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    failures = []
+    for name, result in results.items():
+        if result["errors"]:
+            failures.append(f"{name}: {result['errors']} failed requests")
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+        if result["p95"] > expected["p95"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {result['p95']:.1f}ms vs baseline "
+                            f"{expected['p95']:.1f}ms")
+        if result["rps"] < expected["rps"] * (1 - tolerance):
+            failures.append(f"{name}: {result['rps']:.1f} req/s vs baseline "
+                            f"{expected['rps']:.1f} req/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--books", type=int, default=2000, help="books per user")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds per scenario")
+    parser.add_argument("--database-async", action="store_true",
+                        help="run the server with DATABASE_ASYNC=true")
+    parser.add_argument("--baseline",
+                        help="fail on regressions against this baseline file")
+    parser.add_argument("--save-baseline",
+                        help="write this run's results to a baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p95 growth / throughput loss versus the baseline "
+                             "(0.25 = 25%%)")
+    parser.add_argument("--app-dir", default=str(BACKEND_DIR),
+                        help="backend directory to benchmark")
+    parser.add_argument("--port", type=int, default=8775)
+    args = parser.parse_args()
+
+    keys = ("users", "books", "concurrency", "duration", "database_async")
+    settings = {key: getattr(args, key) for key in keys}
+    results = asyncio.run(run(args))
+
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        baseline = {"settings": settings, "results": results}
+        path.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline written to {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("settings") != settings:
+            print(f"warning: baseline was recorded with {baseline.get('settings')}, "
+                  f"this run used {settings}")
+        failures = compare(results, baseline, args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} "
+              f"(tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
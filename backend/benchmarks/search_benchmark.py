@@ -0,0 +1,106 @@
+"""Compare book search latency: FTS5 index vs the previous ILIKE scan.
+
+Usage (from backend/):
+    python -m benchmarks.search_benchmark --books 1000000 --users 20
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine, text
+
+from app.domain.db import Base
+from app.domain.search import (
+    FTS_TABLE,
+    build_match_query,
+    create_search_index,
+    register_search_functions,
+)
+from app.models import book, user  # noqa: F401  (register tables on Base.metadata)
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "sha", "dor", "vel", "tin", "ar", "qu", "bel",
+             "os", "ni", "fer", "ga"]
+# Synthetic title vocabulary of a few thousand pseudo-words
+WORDS = sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES})
+SURNAMES = ["Tolkien", "Austen", "Orwell", "Morrison", "Atwood", "Ishiguro", "Murakami",
+            "Le Guin", "Adichie", "Pratchett", "Mantel", "Borges", "Calvino", "Lessing",
+            "Achebe", "Woolf"]
+
+
+def seed(engine, books: int, users: int):
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        batch = []
+        for i in range(books):
+            title = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+            batch.append((str(uuid.uuid4()), title, rng.choice(SURNAMES),
+                          user_ids[i % users],
+                          f"2020-01-01 00:00:{i % 60:02d}.{i:06d}"[:26]))
+            if len(batch) == 10000:
+                conn.exec_driver_sql(
+                    "INSERT INTO books (id, title, author, user_id, created_at, "
+                    "is_deleted) VALUES (?, ?, ?, ?, ?, 0)", batch)
+                batch = []
+        if batch:
+            conn.exec_driver_sql(
+                "INSERT INTO books (id, title, author, user_id, created_at, "
+                "is_deleted) VALUES (?, ?, ?, ?, ?, 0)", batch)
+    return user_ids
+
+
+def time_query(conn, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(text(sql), params).all()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "search_benchmark.db")
+    engine = create_engine(f"sqlite:///{path}")
+    register_search_functions(engine)
+    Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+
+    start = time.perf_counter()
+    user_ids = seed(engine, args.books, args.users)
+    print(f"Seeded {args.books} books for {args.users} users in "
+          f"{time.perf_counter() - start:.1f}s")
+
+    user_id = user_ids[0]
+    with engine.connect() as conn:
+        queries = [WORDS[100][:4], WORDS[200], f"{WORDS[300]} {WORDS[400][:3]}",
+                   "tolkien", "tolk orw", "zzz"]
+        for query in queries:
+            fts_ms = time_query(conn, f"""
+                SELECT books.* FROM {FTS_TABLE}
+                JOIN books ON books.rowid = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH :match ORDER BY rank LIMIT 20
+            """, {"match": build_match_query(user_id, query)}, args.repeat)
+            like_ms = time_query(conn, """
+                SELECT * FROM books
+                WHERE (title LIKE :pattern OR author LIKE :pattern)
+                  AND user_id = :user_id AND is_deleted = 0
+                ORDER BY created_at DESC LIMIT 20
+            """, {"pattern": f"%{query}%", "user_id": user_id},
+            max(3, args.repeat // 10))
+            print(f"{query!r:16} fts p50={fts_ms[0]:8.3f}ms p95={fts_ms[1]:8.3f}ms | "
+                  f"like p50={like_ms[0]:8.3f}ms p95={like_ms[1]:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Compare the list-response paths: ORM + response_model validation vs rows + orjson.
+
+For each page size, loads a page of books both ways and renders the response body
+exactly as the API does: the ORM path validates Book instances into
+PaginatedBooksResponse through FastAPI's serialize_response and renders with
+JSONResponse; the fast path selects BOOK_COLUMNS as rows and renders book_dicts() with
+ORJSONResponse. Both bodies are checked to decode to the same JSON before timing.
+
+Usage (from backend/):
+    python -m benchmarks.serialization_benchmark --sizes 10 100 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy.orm import sessionmaker
+
+from app.api.serialization import book_dicts
+from app.domain.book import BOOK_COLUMNS
+from app.domain.db import Base, create_database_engine
+from app.models import user  # noqa: F401  (register tables on Base.metadata)
+from app.models.book import Book
+from app.schemas.book import PaginatedBooksResponse
+
+RESPONSE_FIELD = create_model_field("Response_list_books", PaginatedBooksResponse,
+                                    mode="serialization")
+
+
+def seed(engine, books: int, user_id: str):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO books (id, title, author, publication_date, isbn, user_id, "
+            "created_at, updated_at, is_deleted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            [(str(uuid.uuid4()), f"Title {i}", f"Author {i % 50}",
+              f"{1900 + i % 120}-01-01", f"isbn-{i}", user_id,
+              f"2024-01-01 00:00:00.{i:06d}", f"2024-01-02 00:00:00.{i:06d}")
+             for i in range(books)])
+
+
+def page_query(session, entities, user_id: str, size: int):
+    return session.query(*entities).filter(
+        Book.user_id == user_id, ~Book.is_deleted
+    ).order_by(Book.created_at.desc(), Book.id.desc()).limit(size).all()
+
+
+def pagination(size: int) -> dict:
+    return {"page": 1, "limit": size, "total": None, "total_pages": None,
+            "next_cursor": None}
+
+
+async def orm_path(session, user_id: str, size: int):
+    start = time.perf_counter()
+    books = page_query(session, (Book,), user_id, size)
+    loaded = time.perf_counter()
+    response_content = {"books": books, "pagination": pagination(size)}
+    content = await serialize_response(field=RESPONSE_FIELD,
+                                       response_content=response_content)
+    body = JSONResponse(content).body
+    return body, loaded - start, time.perf_counter() - loaded
+
+
+async def fast_path(session, user_id: str, size: int):
+    start = time.perf_counter()
+    rows = page_query(session, BOOK_COLUMNS, user_id, size)
+    loaded = time.perf_counter()
+    content = {"books": book_dicts(rows), "pagination": pagination(size)}
+    body = ORJSONResponse(content).body
+    return body, loaded - start, time.perf_counter() - loaded
+
+
+async def measure(Session, path, user_id: str, size: int, repeat: int):
+    query_ms, render_ms = [], []
+    for _ in range(repeat):
+        # A fresh session per run, as each request gets one (no identity map reuse)
+        session = Session()
+        try:
+            _, query_seconds, render_seconds = await path(session, user_id, size)
+        finally:
+            session.close()
+        query_ms.append(query_seconds * 1000)
+        render_ms.append(render_seconds * 1000)
+    return statistics.median(query_ms), statistics.median(render_ms)
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "serialization.db")
+    engine = create_database_engine(f"sqlite:///{path}", name="serialization")
+    try:
+        Base.metadata.create_all(bind=engine)
+        user_id = str(uuid.uuid4())
+        seed(engine, max(args.sizes), user_id)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        for size in args.sizes:
+            session = Session()
+            try:
+                orm_body = (await orm_path(session, user_id, size))[0]
+            finally:
+                session.close()
+            session = Session()
+            try:
+                fast_body = (await fast_path(session, user_id, size))[0]
+            finally:
+                session.close()
+            assert json.loads(orm_body) == json.loads(fast_body), \
+                "fast path changed the response body"
+
+            repeat = max(5, args.rows_per_size // size)
+            orm_query, orm_render = await measure(Session, orm_path, user_id, size,
+                                                  repeat)
+            fast_query, fast_render = await measure(Session, fast_path, user_id, size,
+                                                    repeat)
+            orm_total, fast_total = orm_query + orm_render, fast_query + fast_render
+            print(f"{size:5} rows"
+                  f"  orm+response_model {orm_total:8.2f}ms"
+                  f" (query {orm_query:7.2f} render {orm_render:7.2f})"
+                  f"  rows+orjson {fast_total:8.2f}ms"
+                  f" (query {fast_query:7.2f} render {fast_render:7.2f})"
+                  f"  {orm_total / fast_total:5.1f}x")
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--rows-per-size", type=int, default=50000,
+                        help="rows rendered per size (sets repeats)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Write throughput of worker processes on one SQLite file vs user-sharded files.
+
+Runs the given number of writer processes (as gunicorn workers would be) for each
+shard count: every process inserts books through BookService for random users, each on
+the shard its user id hashes to, for a fixed duration. Reports commits per second over
+all processes, add_book latency and writes that failed with "database is locked". With
+one shard every commit waits for the same writer lock; with one shard per process they
+mostly don't, so throughput should grow with the shards up to the number of cores.
+
+Usage (from backend/):
+    python -m benchmarks.shard_write_benchmark --processes 4 --shards 1 4 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+from sqlalchemy.orm import sessionmaker
+
+from app.domain.book import BookService
+from app.domain.db import Base, create_database_engine
+from app.domain.duplicates import create_duplicate_index
+from app.domain.library_stats import create_library_stats
+from app.domain.search import create_search_index
+from app.domain.sharding import shard_for_key
+from app.models import book, job, library_stat, user  # noqa: F401  (register tables)
+
+USERS = 1000
+
+
+def writer(urls: list, user_ids: list, deadline: float, seed: int):
+    # One process: its own engines and a session per shard, like a worker of the app
+    engines = [create_database_engine(url, name=f"writer-{seed}-{shard}")
+               for shard, url in enumerate(urls)]
+    sessions = [sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+                for engine in engines]
+    rng = random.Random(seed)
+    latencies, failed, n = [], 0, 0
+    while time.time() < deadline:
+        user_id = rng.choice(user_ids)
+        service = BookService(sessions[shard_for_key(user_id, len(urls))])
+        start = time.perf_counter()
+        result = service.add_book(user_id, f"Book {seed}-{n}", f"Author {n % 50}")
+        latencies.append((time.perf_counter() - start) * 1000)
+        failed += not result["success"]
+        n += 1
+    for session in sessions:
+        session.close()
+    return latencies, failed
+
+
+def run(shards: int, processes: int, duration: float):
+    workdir = tempfile.mkdtemp()
+    urls = [f"sqlite:///{os.path.join(workdir, f'shard{shard}.db')}"
+            for shard in range(shards)]
+    for shard, url in enumerate(urls):
+        engine = create_database_engine(url, name=f"setup-{shard}")
+        Base.metadata.create_all(bind=engine)
+        create_search_index(engine)
+        create_duplicate_index(engine)
+        create_library_stats(engine)
+        engine.dispose()
+    user_ids = [str(uuid.uuid4()) for _ in range(USERS)]
+
+    # Processes start before the deadline is set, so imports and engine setup aren't
+    # timed
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        pool.map(abs, range(processes))
+        deadline = time.time() + duration
+        results = pool.starmap(writer, [(urls, user_ids, deadline, seed)
+                                        for seed in range(processes)])
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(sample for samples, _ in results for sample in samples)
+    failed = sum(count for _, count in results)
+    return {
+        "commits": len(latencies) - failed,
+        "failed": failed,
+        "wps": (len(latencies) - failed) / duration,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, nargs="+",
+                        default=[1, os.cpu_count() or 1])
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"{args.processes} writer processes, {os.cpu_count()} cores")
+    for shards in args.shards:
+        result = run(shards, args.processes, args.duration)
+        print(f"{shards:3} shard(s) {result['commits']:7} commits "
+              f"{result['wps']:8.1f} writes/s add_book p50={result['p50']:7.2f}ms "
+              f"p99={result['p99']:7.2f}ms failed={result['failed']}")
+
+
+if __name__ == "__main__":
+    main()
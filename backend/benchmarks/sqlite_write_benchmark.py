@@ -0,0 +1,113 @@
+"""Write throughput of add_book under concurrent writers, per SQLite profile.
+
+Each profile gets a fresh database file. Writer threads insert books through their own
+BookService session for a fixed duration while optional reader threads page through the
+library, reporting commits per second, add_book latency and any writes that failed with
+"database is locked".
+
+Usage (from backend/):
+    python -m benchmarks.sqlite_write_benchmark --writers 8 --readers 4
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+from sqlalchemy.orm import sessionmaker
+
+from app.domain.book import BookService
+from app.domain.db import SQLITE_PROFILES, Base, create_database_engine
+from app.domain.search import create_search_index
+from app.models import book, user  # noqa: F401  (register tables on Base.metadata)
+
+
+def run_profile(profile: str, writers: int, readers: int, duration: float):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "write_benchmark.db")
+    engine = create_database_engine(f"sqlite:///{path}", sqlite_profile=profile,
+                                    name=f"benchmark-{profile}")
+    Base.metadata.create_all(bind=engine)
+    create_search_index(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    user_id = str(uuid.uuid4())
+
+    latencies = []
+    failures = []
+    reads = []
+    deadline = time.perf_counter() + duration
+
+    def writer(index):
+        service = BookService(Session())
+        samples, failed, n = [], 0, 0
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                result = service.add_book(user_id, f"Book {index}-{n}",
+                                          f"Author {n % 50}",
+                                          isbn=f"{index:03d}-{n:09d}")
+                samples.append((time.perf_counter() - start) * 1000)
+                if not result["success"]:
+                    failed += 1
+                n += 1
+        finally:
+            service.close()
+        latencies.extend(samples)
+        failures.append(failed)
+
+    def reader():
+        service = BookService(Session())
+        count = 0
+        try:
+            while time.perf_counter() < deadline:
+                service.get_books(user_id, 1, 10, include_total=False)
+                count += 1
+        finally:
+            service.close()
+        reads.append(count)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies.sort()
+    failed = sum(failures)
+    return {
+        "commits": len(latencies) - failed,
+        "failed": failed,
+        "wps": (len(latencies) - failed) / elapsed,
+        "rps": sum(reads) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", nargs="+", choices=sorted(SQLITE_PROFILES),
+                        default=["default", "tuned"])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    for profile in args.profiles:
+        result = run_profile(profile, args.writers, args.readers, args.duration)
+        print(f"{profile:8} {result['commits']:7} commits "
+              f"{result['wps']:8.1f} writes/s add_book p50={result['p50']:7.2f}ms "
+              f"p99={result['p99']:7.2f}ms failed={result['failed']} "
+              f"| {result['rps']:8.1f} reads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Multi-worker launcher (from backend/): gunicorn -c gunicorn.conf.py app.main:app
+#
+# Each worker is a separate uvicorn process with its own event loop, connection pools
+# and in-process caches. With DATABASE_SHARD_URLS set, writes of users on different
+# shards go to different SQLite files and no longer queue on one writer lock, so write
+# throughput grows with the workers up to the number of shards; any worker serves any
+# user. Per-process state to keep in mind: rate limits are per worker unless
+# RATE_LIMIT_STORE=redis, a cached token outlives a password change on other workers for
+# up to TOKEN_CACHE_TTL_SECONDS, and /health reports the worker that answered.
+# Read-your-writes with replicas holds on every worker only for clients that send back
+# the signed last-write cookie or X-Last-Write header (app/api/replicas.py); for others
+# it holds on the worker that served the write. Maintenance cycles are shared through
+# MAINTENANCE_LOCK_FILE. /metrics covers every worker: the Prometheus metrics run in
+# multiprocess mode (see on_starting), and the /health counters it also exports carry a
+# pid label.
+#
+# Without gunicorn, uvicorn app.main:app --workers N runs the same app (but the schema
+# is then created by N workers at once on the first start; run
+# python -m app.domain.migrations first).
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Streaming imports/exports and covers can take longer than gunicorn's 30 s default
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then (with jitter, so they don't all restart together)
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+accesslog = None
+
+
+def on_starting(server):
+    # Every worker writes its Prometheus metrics to files in PROMETHEUS_MULTIPROC_DIR,
+    # which /metrics merges. Set before anything imports prometheus_client, and
+    # cleared of a previous run's files.
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(tempfile.gettempdir(), f"prometheus-multiproc-{os.getpid()}"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+
+    # Create and migrate every shard once, in the master before any worker
+    # starts: the workers' own startup check then finds nothing to do instead of
+    # racing on the schema
+    from app.domain.db import shard_engines
+    from app.domain.migrations import main as migrate
+
+    migrate(["upgrade"])
+    # Forked workers must not inherit the master's pooled connections
+    for shard_engine in shard_engines:
+        shard_engine.dispose()
+
+
+def child_exit(server, worker):
+    # A dead worker's live gauges (requests in flight) leave the totals; its counters
+    # and histograms keep counting
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
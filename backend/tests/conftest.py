@@ -0,0 +1,52 @@
+import os
+import tempfile
+import uuid
+
+# The app reads its settings at import time: point it at a scratch database and switch
+# off the background loops and limits that would make tests depend on timing
+_workdir = tempfile.mkdtemp(prefix="library-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "DATABASE_SHARD_URLS": "",
+    "DATABASE_REPLICA_URLS": "",
+    "DATABASE_ASYNC": "false",
+    "SECRET_KEY": "test-secret",
+    "REFRESH_SECRET_KEY": "test-refresh-secret",
+    "BCRYPT_ROUNDS": "4",
+    "RATE_LIMIT_RULES": "",
+    "RATE_LIMIT_LOGIN_PER_USERNAME": "",
+    "MAINTENANCE_INTERVAL_SECONDS": "0",
+    "MAINTENANCE_LOCK_FILE": os.path.join(_workdir, "maintenance.lock"),
+    "JOB_WORKERS": "0",
+    "COVER_STORAGE_DIR": os.path.join(_workdir, "covers"),
+    "ISBN_METADATA_PROVIDER": "none",
+    "LOG_LEVEL": "WARNING",
+    "LOG_QUEUE": "false",
+})
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def signup_and_login(client, username: str = None) -> dict:
+    username = username or f"user{uuid.uuid4().hex[:12]}"
+    client.post("/api/v1/signup", json={"username": username, "password": "secret1",
+                                        "email": f"{username}@example.com"})
+    response = client.post("/api/v1/login",
+                           json={"username": username, "password": "secret1"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth_headers(client):
+    # A fresh user per test, so libraries never leak between tests
+    return signup_and_login(client)
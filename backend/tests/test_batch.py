@@ -0,0 +1,97 @@
+import pytest
+from conftest import signup_and_login
+
+from app.schemas.book import BATCH_MAX_IDS
+
+NOT_FOUND = {"success": False, "message": "Book not found"}
+
+
+def create_books(client, headers, count) -> list:
+    ids = []
+    for number in range(count):
+        response = client.post("/api/v1/books", headers=headers,
+                               json={"title": f"Book {number}", "author": "Author"})
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["id"])
+    return ids
+
+
+def batch_get(client, headers, ids) -> dict:
+    response = client.post("/api/v1/books/batch-get", headers=headers,
+                           json={"ids": ids})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def results(response) -> dict:
+    assert response.status_code == 200, response.text
+    return {result.pop("id"): result for result in response.json()["results"]}
+
+
+@pytest.fixture
+def others_book(client):
+    return create_books(client, signup_and_login(client), 1)[0]
+
+
+def test_batch_get_keeps_request_order_and_reports_missing(client, auth_headers,
+                                                            others_book):
+    first, second, deleted = create_books(client, auth_headers, 3)
+    client.delete(f"/api/v1/books/{deleted}", headers=auth_headers)
+
+    found = batch_get(client, auth_headers,
+                      [second, "missing", first, others_book, deleted, second])
+    assert [book["id"] for book in found["books"]] == [second, first]
+    assert found["not_found"] == ["missing", others_book, deleted]
+
+
+def test_batch_update_changes_only_the_callers_books(client, auth_headers, others_book):
+    mine = create_books(client, auth_headers, 2)
+    response = client.patch("/api/v1/books/batch", headers=auth_headers,
+                            json={"ids": mine + [others_book],
+                                  "changes": {"author": "Frank Herbert"}})
+    assert results(response) == {mine[0]: {"success": True, "message": None},
+                                 mine[1]: {"success": True, "message": None},
+                                 others_book: NOT_FOUND}
+    found = batch_get(client, auth_headers, mine)["books"]
+    assert {book["author"] for book in found} == {"Frank Herbert"}
+    # The other user's book is not even visible, let alone changed
+    assert batch_get(client, auth_headers, [others_book])["not_found"] == [others_book]
+
+
+@pytest.mark.parametrize("changes, status_code", [
+    ({"isbn": "978-0441172719"}, 422),
+    ({}, 400),
+    ({"publication_date": "next spring"}, 400),
+])
+def test_batch_update_rejects_bad_changes(client, auth_headers, changes, status_code):
+    book_id = create_books(client, auth_headers, 1)[0]
+    response = client.patch("/api/v1/books/batch", headers=auth_headers,
+                            json={"ids": [book_id], "changes": changes})
+    assert response.status_code == status_code
+
+
+def test_batch_delete(client, auth_headers, others_book):
+    mine = create_books(client, auth_headers, 2)
+    response = client.post("/api/v1/books/batch-delete", headers=auth_headers,
+                           json={"ids": mine + [others_book]})
+    assert results(response) == {mine[0]: {"success": True, "message": None},
+                                 mine[1]: {"success": True, "message": None},
+                                 others_book: NOT_FOUND}
+    assert batch_get(client, auth_headers, mine)["not_found"] == mine
+
+    # Already deleted: nothing left to delete
+    again = client.post("/api/v1/books/batch-delete", headers=auth_headers,
+                        json={"ids": mine})
+    assert all(result == NOT_FOUND for result in results(again).values())
+
+
+@pytest.mark.parametrize("ids", [[], [f"id-{n}" for n in range(BATCH_MAX_IDS + 1)]])
+def test_batch_size_limits(client, auth_headers, ids):
+    for path in ("/api/v1/books/batch-get", "/api/v1/books/batch-delete"):
+        response = client.post(path, headers=auth_headers, json={"ids": ids})
+        assert response.status_code == 422
+
+
+def test_batch_at_the_limit_is_accepted(client, auth_headers):
+    ids = [f"id-{n}" for n in range(BATCH_MAX_IDS)]
+    assert len(batch_get(client, auth_headers, ids)["not_found"]) == BATCH_MAX_IDS
@@ -0,0 +1,82 @@
+import uuid
+
+from app.domain.book import BookService
+
+
+def create_book(client, headers, **fields):
+    response = client.post("/api/v1/books", headers=headers,
+                           json={"title": "Dune", "author": "Frank Herbert", **fields})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_book_etag_and_conditional_get(client, auth_headers):
+    book = create_book(client, auth_headers)
+    response = client.get(f"/api/v1/books/{book['id']}", headers=auth_headers)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    for tag in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        cached = client.get(f"/api/v1/books/{book['id']}",
+                            headers={**auth_headers, "If-None-Match": tag})
+        assert cached.status_code == 304
+        assert cached.headers["ETag"] == etag
+    fresh = client.get(f"/api/v1/books/{book['id']}",
+                       headers={**auth_headers, "If-None-Match": '"other"'})
+    assert fresh.status_code == 200
+
+
+def test_library_etags_change_with_every_write(client, auth_headers):
+    create_book(client, auth_headers)
+    for path in ("/api/v1/books", "/api/v1/library-summary"):
+        etag = client.get(path, headers=auth_headers).headers["ETag"]
+        conditional = {**auth_headers, "If-None-Match": etag}
+        assert client.get(path, headers=conditional).status_code == 304
+        create_book(client, auth_headers, title=f"Another {path}")
+        response = client.get(path, headers=conditional)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+
+def test_if_match_update(client, auth_headers):
+    book = create_book(client, auth_headers)
+    url = f"/api/v1/books/{book['id']}"
+    etag = client.get(url, headers=auth_headers).headers["ETag"]
+
+    updated = client.put(url, json={"title": "Dune Messiah"},
+                         headers={**auth_headers, "If-Match": etag})
+    assert updated.status_code == 200
+    assert updated.headers["ETag"] != etag
+
+    # The ETag read before the first update is stale now; weak tags never match
+    stale = client.put(url, json={"title": "Lost update"},
+                       headers={**auth_headers, "If-Match": etag})
+    assert stale.status_code == 412
+    weak_tag = f"W/{updated.headers['ETag']}"
+    weak = client.put(url, json={"title": "Lost update"},
+                      headers={**auth_headers, "If-Match": weak_tag})
+    assert weak.status_code == 412
+    current = client.get(url, headers=auth_headers).json()
+    assert current["title"] == "Dune Messiah"
+
+
+def test_if_match_update_rejected_by_isbn_check_leaves_book_untouched():
+    user_id = str(uuid.uuid4())
+    service = BookService(user_id=user_id)
+    try:
+        taken = f"isbn-{uuid.uuid4()}"
+        service.add_book(user_id, "First", "Author", isbn=taken)
+        book = service.add_book(user_id, "Second", "Author")["data"]
+        read_at = book.updated_at
+
+        result = service.update_book(book.id, user_id, isbn=taken,
+                                     expected_updated_at=read_at)
+        assert not result["success"]
+        # What the session commits next must not carry a claim from the failed update
+        service.db.commit()
+        service.db.expire_all()
+        assert service.get_book_by_id(book.id, user_id)["data"].updated_at == read_at
+        assert service.update_book(book.id, user_id, title="Renamed",
+                                   expected_updated_at=read_at)["success"]
+    finally:
+        service.close()
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import io
+import os
+import random
+
+from conftest import signup_and_login
+from PIL import Image
+from sqlalchemy import text
+
+from app.domain.covers import cover_store, move_inline_covers
+from app.domain.db import shard_engines
+
+
+def inline_cover():
+    # A PNG no other test uses, as a data URI, and the cover id it would be stored under
+    image = Image.new("RGB", (8, 8), tuple(random.randrange(256) for _ in range(3)))
+    image.putpixel((0, 0), (random.randrange(256), 0, random.randrange(256)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    data = buffer.getvalue()
+    uri = "data:image/png;base64," + base64.b64encode(data).decode()
+    return uri, hashlib.sha256(data).hexdigest()
+
+
+def stored(cover_id: str) -> bool:
+    return os.path.exists(cover_store.path(cover_id))
+
+
+def test_inline_cover_is_stored_and_referenced(client, auth_headers):
+    uri, cover_id = inline_cover()
+    book = client.post("/api/v1/books", headers=auth_headers,
+                       json={"title": "Dune", "author": "Frank Herbert"}).json()
+    response = client.put(f"/api/v1/books/{book['id']}", json={"cover_image": uri},
+                          headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["cover_id"] == cover_id
+    assert stored(cover_id)
+
+
+def test_update_of_another_users_book_stores_no_cover(client, auth_headers):
+    book = client.post("/api/v1/books", headers=auth_headers,
+                       json={"title": "Dune", "author": "Frank Herbert"}).json()
+    intruder = signup_and_login(client)
+
+    uri, cover_id = inline_cover()
+    response = client.put(f"/api/v1/books/{book['id']}", json={"cover_image": uri},
+                          headers=intruder)
+    assert response.status_code == 400
+    assert not stored(cover_id)
+
+    uri, cover_id = inline_cover()
+    response = client.patch("/api/v1/books/batch", headers=intruder,
+                            json={"ids": [book["id"]], "changes": {"cover_image": uri}})
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"id": book["id"], "success": False, "message": "Book not found"}]
+    assert not stored(cover_id)
+
+
+def test_update_of_missing_book_stores_no_cover(client, auth_headers):
+    uri, cover_id = inline_cover()
+    response = client.put("/api/v1/books/no-such-book", json={"cover_image": uri},
+                          headers=auth_headers)
+    assert response.status_code == 400
+    assert not stored(cover_id)
+
+
+def test_moving_an_inline_cover_changes_the_book_etag(client, auth_headers):
+    # A book saved with an inline cover before the blob store existed
+    uri, cover_id = inline_cover()
+    book = client.post("/api/v1/books", headers=auth_headers,
+                       json={"title": "Dune", "author": "Frank Herbert"}).json()
+    with shard_engines[0].begin() as conn:
+        conn.execute(text("UPDATE books SET cover_image = :uri WHERE id = :id"),
+                     {"uri": uri, "id": book["id"]})
+    etag = client.get(f"/api/v1/books/{book['id']}",
+                      headers=auth_headers).headers["ETag"]
+
+    with shard_engines[0].begin() as conn:
+        assert move_inline_covers(conn) >= 1
+    response = client.get(f"/api/v1/books/{book['id']}",
+                          headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["cover_id"] == cover_id
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from conftest import signup_and_login
+from sqlalchemy.orm import Session
+from test_covers import inline_cover
+
+from app.application import jobs as job_service
+from app.config import settings
+from app.domain.covers import THUMBNAIL_JOB
+from app.domain.db import shard_engines
+from app.domain.jobs import enqueue_job
+from app.models.job import Job
+
+
+@pytest.fixture
+def failed_job(monkeypatch):
+    # A job whose handler fails with text that must not reach other users
+    kind = "test-secret"
+    monkeypatch.setitem(job_service.job_handlers, kind, lambda payloads: 1 / 0)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 1)
+    with Session(shard_engines[0]) as db:
+        enqueue_job(db, kind, {"title": "Someone Else's Diary"})
+        db.commit()
+        job = db.query(Job).filter(Job.kind == kind).order_by(Job.id.desc()).first()
+        job_id, payload = job.id, job.payload
+    asyncio.run(job_service._run_jobs(shard_engines[0], kind, [(job_id, payload, 1)]))
+    return kind
+
+
+def test_job_status_only_shows_the_callers_jobs(client, auth_headers):
+    uri, _ = inline_cover()
+    response = client.post("/api/v1/books", headers=auth_headers,
+                           json={"title": "T", "author": "A", "cover_image": uri})
+    assert response.status_code == 200, response.text
+
+    jobs = client.get("/api/v1/jobs", headers=auth_headers).json()["jobs"]
+    assert [(job["kind"], job["status"]) for job in jobs] == [
+        (THUMBNAIL_JOB, "pending")]
+    job_id = jobs[0]["id"]
+    assert client.get(f"/api/v1/jobs/{job_id}", headers=auth_headers).json() == jobs[0]
+
+    # Another user sees none of the caller's jobs
+    other = signup_and_login(client)
+    assert client.get("/api/v1/jobs", headers=other).json() == {"jobs": []}
+    assert client.get(f"/api/v1/jobs/{job_id}", headers=other).status_code == 404
+
+
+def test_job_failures_only_surface_as_counts(client, failed_job):
+    metrics = client.get("/metrics").text
+    assert f'jobs_queued{{kind="{failed_job}",status="failed"}} 1.0' in metrics
+    assert "division by zero" not in metrics
+
+    jobs = client.get("/health").json()["jobs"]
+    assert "last_error" not in jobs
+    assert "division by zero" not in str(jobs)
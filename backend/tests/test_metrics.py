@@ -0,0 +1,38 @@
+import os
+
+import pytest
+from prometheus_client import Counter, Gauge, multiprocess, values
+
+
+@pytest.fixture
+def multiprocess_dir(tmp_path, monkeypatch):
+    # What gunicorn.conf.py sets up for its workers
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    return tmp_path
+
+
+def worker_metrics(monkeypatch, pid: int):
+    # Metrics as the worker with this pid writes them in multiprocess mode
+    monkeypatch.setattr(values, "ValueClass", values.MultiProcessValue(lambda: pid))
+    requests = Counter("test_worker_requests", "Requests", registry=None)
+    in_flight = Gauge("test_worker_in_flight", "In flight", registry=None,
+                      multiprocess_mode="livesum")
+    return requests, in_flight
+
+
+def test_metrics_cover_every_worker(client, multiprocess_dir, monkeypatch):
+    for pid in (101, 102):
+        requests, in_flight = worker_metrics(monkeypatch, pid)
+        requests.inc()
+        in_flight.inc()
+    # Gunicorn's child_exit hook, once worker 102 died
+    multiprocess.mark_process_dead(102)
+
+    metrics = client.get("/metrics").text
+    assert "test_worker_requests_total 2.0" in metrics
+    assert "test_worker_in_flight 1.0" in metrics
+    # The answering worker's own counters say whose they are; the outbox counts
+    # are the same from every worker
+    assert f'token_cache_entries{{pid="{os.getpid()}"}}' in metrics
+    assert all('pid="' not in line for line in metrics.splitlines()
+               if line.startswith("jobs_queued{"))
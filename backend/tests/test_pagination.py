@@ -0,0 +1,87 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from app.domain.book import decode_cursor, encode_cursor
+
+
+def create_books(client, headers, count):
+    for number in range(count):
+        response = client.post("/api/v1/books", headers=headers,
+                               json={"title": f"Book {number}", "author": "Author"})
+        assert response.status_code == 200, response.text
+
+
+def list_page(client, headers, **params):
+    response = client.get("/api/v1/books", headers=headers, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def walk(client, headers, limit):
+    # Every page from the first through next_cursor: (ids, pages seen)
+    page = list_page(client, headers, limit=limit)
+    ids, pages = [book["id"] for book in page["books"]], [page]
+    while page["pagination"]["next_cursor"]:
+        page = list_page(client, headers, limit=limit,
+                         cursor=page["pagination"]["next_cursor"])
+        ids += [book["id"] for book in page["books"]]
+        pages.append(page)
+    return ids, pages
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, "b-1")) == (created_at, "b-1")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b'{"created_at": 1}').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", "b-1"]').decode(),
+])
+def test_invalid_cursor_is_a_bad_request(client, auth_headers, cursor):
+    response = client.get("/api/v1/books", headers=auth_headers,
+                          params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"
+
+
+def test_cursor_walk_returns_every_book_once_in_listing_order(client, auth_headers):
+    # Books added in quick succession share timestamps: the id breaks the ties
+    create_books(client, auth_headers, 7)
+    ids, pages = walk(client, auth_headers, limit=3)
+    assert [len(page["books"]) for page in pages] == [3, 3, 1]
+    assert len(set(ids)) == 7
+
+    by_offset = [book["id"] for page in (1, 2, 3)
+                 for book in list_page(client, auth_headers, page=page,
+                                       limit=3)["books"]]
+    assert ids == by_offset
+
+
+def test_cursor_pages_skip_the_count_unless_asked(client, auth_headers):
+    create_books(client, auth_headers, 3)
+    first = list_page(client, auth_headers, limit=2)["pagination"]
+    assert first["total"] == 3 and first["page"] == 1
+
+    cursor = first["next_cursor"]
+    later = list_page(client, auth_headers, limit=2, cursor=cursor)["pagination"]
+    assert later["total"] is None and later["page"] is None
+    assert later["next_cursor"] is None
+    counted = list_page(client, auth_headers, limit=2, cursor=cursor,
+                        include_total=True)["pagination"]
+    assert counted["total"] == 3 and counted["total_pages"] == 2
+
+
+def test_cursor_is_stable_across_inserts(client, auth_headers):
+    # Unlike an offset, a newer book doesn't push the last row of page 1 onto page 2
+    create_books(client, auth_headers, 4)
+    first = list_page(client, auth_headers, limit=2)
+    create_books(client, auth_headers, 1)
+    second = list_page(client, auth_headers, limit=2,
+                       cursor=first["pagination"]["next_cursor"])
+    first_ids = {book["id"] for book in first["books"]}
+    assert len(second["books"]) == 2
+    assert not first_ids & {book["id"] for book in second["books"]}
@@ -0,0 +1,159 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.domain.auth import DatabaseService
+from app.domain.book import BookService, decode_cursor, decode_search_cursor
+from app.domain.db import Base, create_database_engine
+from app.domain.duplicates import create_duplicate_index
+from app.domain.jobs import (
+    claim_jobs,
+    complete_jobs,
+    fail_jobs,
+    job_counts,
+    purge_finished_jobs,
+)
+from app.domain.library_stats import create_library_stats
+from app.domain.migrations import run_migrations
+from app.domain.search import create_search_index
+from app.schemas.book import BookCreate
+
+# Every BookService / DatabaseService / job queue statement must be served by an
+# index: each one issued by the calls in exercise() is checked with EXPLAIN QUERY PLAN
+# and fails when SQLite has to scan a table or build a temporary B-tree to sort.
+# Full-text lookups are exempt from the sort check: ranking has to sort the matches.
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)\w+(?! VIRTUAL TABLE)\b")
+VIRTUAL_TABLE = re.compile(r"^SCAN \w+ VIRTUAL TABLE")
+TEMP_SORT = re.compile(r"USE TEMP B-TREE")
+
+
+def plan_problems(plan: list) -> list:
+    problems = [step for step in plan if FULL_SCAN.search(step)]
+    if not any(VIRTUAL_TABLE.search(step) for step in plan):
+        problems += [step for step in plan if TEMP_SORT.search(step)]
+    return problems
+
+
+def exercise(Session, engine):
+    users = DatabaseService(Session())
+    try:
+        user = users.create_user("plans", "plans@example.com", "not-a-real-hash")
+        users.get_user_by_username("plans")
+        users.get_user_by_email("plans@example.com")
+        users.update_password("plans", "another-hash")
+    finally:
+        users.close()
+
+    books = BookService(Session())
+    try:
+        created = [
+            books.add_book(user.id, f"Dune {i}", f"Herbert {i % 3}", "1965-08-01",
+                           isbn=f"isbn-{i}")["data"]
+            for i in range(30)
+        ]
+        books.add_books(user.id, [(i, BookCreate(title=f"Bulk {i}", author="Bulk",
+                                                 isbn=f"bulk-{i}"))
+                                  for i in range(10)])
+        first = books.get_books(user.id, 1, 10)
+        books.get_books(user.id, 2, 10, include_total=False)
+        after = decode_cursor(first["pagination"]["next_cursor"])
+        books.get_books(user.id, 1, 10, after=after)
+        list(books.iter_books_for_export(user.id))
+        books.get_book_by_id(created[0].id, user.id)
+        books.update_book(created[0].id, user.id, title="Dune Messiah",
+                          isbn="isbn-updated")
+        books.update_book(created[2].id, user.id, title="Children of Dune",
+                          expected_updated_at=created[2].updated_at)
+        books.delete_book(created[1].id, user.id)
+        books.set_cover(created[9].id, user.id, "c" * 64)
+        books.set_cover(created[10].id, user.id, "e" * 64)
+        books.referenced_cover_ids(["c" * 64, "d" * 64])
+        batch = [book.id for book in created[3:8]]
+        books.get_books_by_ids(user.id, batch)
+        books.update_books(user.id, batch, author="Frank Herbert")
+        books.delete_books(user.id, batch[:2])
+        books.restore_book(batch[0], user.id, datetime.now() - timedelta(days=30))
+        books.purge_deleted_books(datetime.now(), 100)
+        hits = books.search_books(user.id, "dune", limit=5)
+        books.search_books(user.id, "dune", limit=5,
+                           after=decode_search_cursor(hits["next_cursor"]))
+        books.get_library_summary(user.id)
+        books.get_library_version(user.id)
+        books.find_duplicates(user.id)
+        # With DUPLICATE_WARN_ON_INSERT (set by the fixture), inserts look up candidates
+        books.add_book(user.id, "Dune 1", "Herbert 1")
+    finally:
+        books.close()
+
+    # Thumbnail jobs were queued by the cover writes above
+    claimed = claim_jobs(engine, 10)
+    complete_jobs(engine, [job[0] for job in claimed[:1]])
+    fail_jobs(engine, [(job[0], job[3]) for job in claimed[1:]], "plans")
+    job_counts(engine)
+    purge_finished_jobs(engine, datetime.now() + timedelta(days=1), 100)
+
+
+@pytest.fixture(scope="module")
+def plans(tmp_path_factory):
+    # {statement: EXPLAIN QUERY PLAN steps} for every SELECT, UPDATE and DELETE issued
+    from app.config import settings
+
+    path = tmp_path_factory.mktemp("plans") / "plans.db"
+    engine = create_database_engine(f"sqlite:///{path}", name="plans")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    create_search_index(engine)
+    create_duplicate_index(engine)
+    create_library_stats(engine)
+
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.setdefault(statement,
+                                  parameters[0] if executemany else parameters)
+
+    warn_on_insert = settings.DUPLICATE_WARN_ON_INSERT
+    settings.DUPLICATE_WARN_ON_INSERT = True
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        exercise(sessionmaker(autocommit=False, autoflush=False, bind=engine), engine)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        settings.DUPLICATE_WARN_ON_INSERT = warn_on_insert
+
+    with engine.connect() as conn:
+        result = {
+            statement: [row[3] for row in conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            for statement, parameters in statements.items()
+        }
+    engine.dispose()
+    return result
+
+
+def test_plan_problems_flags_scans_and_sorts():
+    assert plan_problems(["SCAN books"]) == ["SCAN books"]
+    sort = "USE TEMP B-TREE FOR ORDER BY"
+    assert plan_problems(["SEARCH books USING INDEX ix_books_cover_id (cover_id=?)",
+                          sort]) == [sort]
+    assert plan_problems(["SCAN books_fts VIRTUAL TABLE INDEX 0:M1", sort]) == []
+    assert plan_problems(["SCAN CONSTANT ROW"]) == []
+
+
+def test_service_queries_are_recorded(plans):
+    # Guards the check itself: a broken recorder would let the plan test pass vacuously
+    assert len(plans) >= 40
+
+
+def test_every_query_is_served_by_an_index(plans):
+    failures = {
+        " ".join(statement.split()): problems
+        for statement, plan in plans.items()
+        if (problems := plan_problems(plan))
+    }
+    assert not failures, "\n".join(f"{statement}\n    {problems}"
+                                   for statement, problems in failures.items())
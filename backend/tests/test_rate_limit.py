@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+from conftest import signup_and_login
+
+from app.api import auth as auth_routes
+from app.config import settings
+from app.domain import rate_limit
+from app.domain.rate_limit import (
+    MemoryBucketStore,
+    RateLimiter,
+    RateLimitRule,
+    parse_rate,
+    parse_rules,
+)
+
+
+def test_parse_rate():
+    assert parse_rate("10/minute") == (10 / 60, 10)
+    assert parse_rate("20/minute burst 5") == (20 / 60, 5)
+    assert parse_rate("0.5/s") == (0.5, 1)
+    for spec in ("10/fortnight", "0/minute", "ten/minute", "10 per minute"):
+        with pytest.raises(ValueError):
+            parse_rate(spec)
+
+
+def test_parse_rules():
+    login, api = parse_rules("login: POST /api/v1/login 20/minute burst 10 by ip; "
+                             "api: * /api/v1/* 1200/minute by user")
+    assert (login.method, login.burst, login.key) == ("POST", 10, "ip")
+    assert login.matches("POST", "/api/v1/login")
+    assert not login.matches("GET", "/api/v1/login")
+    assert api.matches("DELETE", "/api/v1/books/1")
+    assert not api.matches("GET", "/health")
+    with pytest.raises(ValueError):
+        parse_rules("login: POST /api/v1/login 20/minute by cookie")
+
+
+def test_bucket_refills_at_the_configured_rate(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    store = MemoryBucketStore(max_keys=10)
+    take = lambda: asyncio.run(store.take("key", rate=1.0, burst=2))  # noqa: E731
+
+    assert take() == 0 and take() == 0
+    assert take() == pytest.approx(1.0)
+    now[0] += 0.5
+    # Rejected requests take nothing: half a token has refilled since
+    assert take() == pytest.approx(0.5)
+    now[0] += 10
+    assert take() == 0
+
+
+def test_least_recently_used_buckets_are_dropped():
+    store = MemoryBucketStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        asyncio.run(store.take(key, rate=1.0, burst=1))
+    assert len(store) == 2
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    # Fresh buckets and tight rules, where the middleware and the login route look
+    def install(spec: str, login_per_username: str = None):
+        limiter = RateLimiter(MemoryBucketStore(max_keys=1000), parse_rules(spec))
+        monkeypatch.setattr(rate_limit.rate_limiter, "store", limiter.store)
+        monkeypatch.setattr(rate_limit.rate_limiter, "rules", limiter.rules)
+        rule = None
+        if login_per_username:
+            rule = RateLimitRule("login-username", "POST", "/api/v1/login",
+                                 *parse_rate(login_per_username), "username")
+        monkeypatch.setattr(auth_routes, "login_username_rule", rule)
+    return install
+
+
+def test_rule_by_user_limits_each_user_separately(client, limiter):
+    first, second = signup_and_login(client), signup_and_login(client)
+    limiter("api: GET /api/v1/books* 2/minute by user")
+
+    statuses = [client.get("/api/v1/books", headers=first).status_code
+                for _ in range(3)]
+    assert statuses[:2] != [429, 429] and statuses[2] == 429
+    rejected = client.get("/api/v1/books", headers=first)
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert client.get("/api/v1/books", headers=second).status_code != 429
+
+
+def login_from(client, address: str, username: str, password: str):
+    return client.post("/api/v1/login", headers={"X-Forwarded-For": address},
+                       json={"username": username, "password": password})
+
+
+def test_bad_logins_elsewhere_do_not_lock_the_owner_out(client, limiter, monkeypatch):
+    monkeypatch.setattr(settings, "FORWARDED_PROXY_HOPS", 1)
+    username = "victim" + str(id(client))[-6:]
+    signup_and_login(client, username)
+    limiter("", login_per_username="3/hour")
+
+    attacker = [login_from(client, "203.0.113.9", username, "wrong").status_code
+                for _ in range(4)]
+    assert attacker == [401, 401, 401, 429]
+    assert login_from(client, "198.51.100.7", username, "secret1").status_code == 200
+
+
+def test_excluded_paths_are_left_to_their_own_rules():
+    rules = parse_rules(
+        "login: POST /api/v1/login 20/minute by ip; "
+        "signup: POST /api/v1/signup 5/hour by ip; "
+        "refresh: POST /api/v1/refresh-token 30/minute by ip; "
+        "api: * /api/v1/*,!/api/v1/login,!/api/v1/signup,!/api/v1/refresh-token "
+        "1200/minute by user")
+    for path in ("/api/v1/login", "/api/v1/signup", "/api/v1/refresh-token"):
+        assert len([rule for rule in rules if rule.matches("POST", path)]) == 1
+    assert [rule.name for rule in rules if rule.matches("GET", "/api/v1/books")] == \
+        ["api"]
+
+
+def test_rejected_request_spends_no_token_from_the_other_buckets():
+    store = MemoryBucketStore(max_keys=10)
+    roomy, tight = ("roomy", 1.0, 5), ("tight", 1.0, 1)
+    assert asyncio.run(store.take_all([roomy, tight])) == [0, 0]
+    # tight is empty, so roomy keeps its 4 tokens however often the pair is rejected
+    for _ in range(10):
+        waits = asyncio.run(store.take_all([roomy, tight]))
+        assert waits[0] == 0 and waits[1] > 0
+    assert [asyncio.run(store.take(*roomy)) for _ in range(5)][-2:] == \
+        [0, pytest.approx(1.0, abs=0.01)]
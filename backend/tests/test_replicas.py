@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from conftest import signup_and_login
+from sqlalchemy import false, update
+
+import app.application.replicas as replica_service
+import app.domain.db as db_module
+from app.config import settings
+from app.domain import replicas
+from app.domain.db import (
+    SHARD_URLS,
+    SessionLocal,
+    ShardSession,
+    create_database_engine,
+    shard_engines,
+    use_shard,
+)
+from app.domain.replicas import (
+    ReplicaSet,
+    check_replica,
+    note_write,
+    sync_sqlite_replicas,
+    wrote_recently,
+)
+from app.models.book import Book
+
+
+@pytest.fixture
+def recent_writes(monkeypatch):
+    monkeypatch.setattr(replicas, "_recent_writes", OrderedDict())
+    return replicas._recent_writes
+
+
+@pytest.fixture
+def replica(client, monkeypatch, tmp_path, recent_writes):
+    # Two SQLite replicas of the test database (created at app startup), standing in
+    # for DATABASE_REPLICA_URLS; they hold what the primary held when sync() last ran
+    urls = [f"sqlite:///{tmp_path}/replica{index}.db" for index in range(2)]
+    engines = [create_database_engine(url, name=f"test-replica-{index}")
+               for index, url in enumerate(urls)]
+    replica_set = ReplicaSet(urls)
+    for module in (db_module, replica_service):
+        monkeypatch.setattr(module, "replica_sets", [replica_set])
+        monkeypatch.setattr(module, "replica_engines", [engines])
+    monkeypatch.setattr(db_module, "REPLICA_URLS", [urls])
+    monkeypatch.setattr(ShardSession, "replica_engines", [engines])
+    yield SimpleNamespace(set=replica_set, engines=engines,
+                          sync=lambda: sync_sqlite_replicas(SHARD_URLS[:1], [urls]))
+    for replica_engine in engines:
+        replica_engine.dispose()
+
+
+def titles(client, headers) -> set:
+    response = client.get("/api/v1/books", headers=headers)
+    assert response.status_code == 200, response.text
+    return {book["title"] for book in response.json()["books"]}
+
+
+def add_book(client, headers, title):
+    response = client.post("/api/v1/books", headers=headers,
+                           json={"title": title, "author": "Frank Herbert"})
+    assert response.status_code == 200, response.text
+
+
+def test_pick_rotates_over_healthy_replicas():
+    replica_set = ReplicaSet([f"sqlite:///replica{index}.db" for index in range(3)])
+    assert [replica_set.pick() for _ in range(4)] == [0, 1, 2, 0]
+    replica_set.mark(1, False)
+    assert {replica_set.pick() for _ in range(4)} == {0, 2}
+    replica_set.mark(0, False)
+    replica_set.mark(2, False)
+    assert replica_set.pick() is None
+    replica_set.mark(1, True)
+    assert replica_set.pick() == 1
+    assert replica_set.status()[0]["failed_checks"] == 1
+
+
+def test_read_your_writes_window(monkeypatch, recent_writes):
+    now = [100.0]
+    monkeypatch.setattr(replicas.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(settings, "REPLICA_READ_YOUR_WRITES_SECONDS", 10)
+    note_write("alice")
+    now[0] += 10
+    assert wrote_recently("alice") and not wrote_recently("bob")
+    now[0] += 1
+    assert not wrote_recently("alice")
+    # Writes past the window are dropped by the next one
+    note_write("bob")
+    assert list(recent_writes) == ["bob"]
+
+
+def test_last_write_marker_counts_for_its_user_only(monkeypatch, recent_writes):
+    monkeypatch.setattr(settings, "REPLICA_READ_YOUR_WRITES_SECONDS", 10)
+    now = replicas.time.time()
+    marker = replicas.read_last_write_token(replicas.last_write_token("alice", now))
+    token = replicas.request_last_write.set({"seen": marker, "written": None})
+    try:
+        assert wrote_recently("alice") and not wrote_recently("bob")
+    finally:
+        replicas.request_last_write.reset(token)
+    stale = replicas.read_last_write_token(replicas.last_write_token("alice", now - 11))
+    token = replicas.request_last_write.set({"seen": stale, "written": None})
+    try:
+        assert not wrote_recently("alice")
+    finally:
+        replicas.request_last_write.reset(token)
+
+
+def test_session_reads_from_a_replica_until_it_writes(replica):
+    db = SessionLocal()
+    try:
+        use_shard(db, 0, "someone")
+        assert db.get_bind() is shard_engines[0]
+        db.info["replica"] = True
+        chosen = db.get_bind()
+        assert chosen in replica.engines
+        # The replica is chosen once per session
+        assert db.get_bind() is chosen
+        db.execute(update(Book).where(false()).values(title="never"))
+        assert db.get_bind() is shard_engines[0]
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_session_falls_back_to_the_primary_when_its_replica_goes_down(replica):
+    db = SessionLocal()
+    try:
+        db.info["replica"] = True
+        chosen = replica.engines.index(db.get_bind())
+        replica.set.mark(chosen, False)
+        assert db.get_bind() is shard_engines[0]
+    finally:
+        db.close()
+
+
+def test_library_reads_follow_replicas_and_own_writes(client, replica, recent_writes):
+    headers = signup_and_login(client)
+    add_book(client, headers, "Dune")
+    replica.sync()
+    add_book(client, headers, "Dune Messiah")
+
+    # Just wrote: read from the primary, which has both books
+    assert titles(client, headers) == {"Dune", "Dune Messiah"}
+    # Once the write is out of the window (and its last-write cookie expired), reads go
+    # to a replica synced before it
+    recent_writes.clear()
+    client.cookies.clear()
+    assert titles(client, headers) == {"Dune"}
+    assert sum(replica.set.reads) >= 1
+    # No healthy replica left: back to the primary
+    replica.set.mark(0, False)
+    replica.set.mark(1, False)
+    assert titles(client, headers) == {"Dune", "Dune Messiah"}
+
+
+def test_read_your_writes_holds_on_other_workers(client, replica, monkeypatch):
+    headers = signup_and_login(client)
+    add_book(client, headers, "Dune")
+    replica.sync()
+    client.cookies.clear()
+    response = client.post("/api/v1/books", headers=headers,
+                           json={"title": "Dune Messiah", "author": "Frank Herbert"})
+    token = response.headers["X-Last-Write"]
+
+    # The next request lands on another worker, which has its own record of
+    # recent writes; the last-write cookie still sends it to the primary
+    monkeypatch.setattr(replicas, "_recent_writes", OrderedDict())
+    assert titles(client, headers) == {"Dune", "Dune Messiah"}
+    # So does the header, for clients that keep no cookies
+    client.cookies.clear()
+    assert titles(client, headers) == {"Dune"}
+    assert titles(client, {**headers, "X-Last-Write": token}) == {
+        "Dune", "Dune Messiah"}
+    # Only markers this app signed count
+    forged = token.rsplit(".", 1)[0] + ".0"
+    assert titles(client, {**headers, "X-Last-Write": forged}) == {"Dune"}
+
+
+def test_health_check_takes_unsynced_replicas_out(replica):
+    # Empty files, as before the first sync: no schema, so the check fails
+    assert check_replica(replica.engines[0]) == (False, None)
+    replica_service.check_replicas()
+    assert replica.set.healthy == [False, False]
+
+    replica.sync()
+    replica_service.check_replicas()
+    assert replica.set.healthy == [True, True]
+    statuses = replica_service.replica_status()
+    assert [status["failed_checks"] for status in statuses] == [1, 1]
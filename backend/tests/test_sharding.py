@@ -0,0 +1,172 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import app.domain.db as db_module
+from app.domain import sharding
+from app.domain.book import BookService
+from app.domain.db import create_database_engine, init_shard
+from app.domain.sharding import rebalance, shard_for_key
+from app.models.book import Book
+from app.models.user import User
+
+
+@pytest.fixture
+def shards(tmp_path):
+    # Three empty shard databases: name -> (url, engine)
+    created = {}
+    for name in "abc":
+        url = f"sqlite:///{tmp_path / name}.db"
+        created[name] = (url, create_database_engine(url, name=f"test-{name}"))
+        init_shard(created[name][1])
+    yield created
+    for _, engine in created.values():
+        engine.dispose()
+
+
+def user_id_on(*homes):
+    # An id whose shard is homes[0] with one shard, homes[1] with two and so on: (0, 1)
+    # moves to the second shard when growing from one to two
+    while True:
+        user_id = str(uuid.uuid4())
+        if all(shard_for_key(user_id, n) == home for n, home in enumerate(homes, 1)):
+            return user_id
+
+
+def add_user(engine, user_id, isbns=()):
+    now = datetime.now()
+    with Session(engine) as db:
+        db.add(User(id=user_id, username=f"user{uuid.uuid4().hex[:12]}",
+                    email=f"{uuid.uuid4().hex}@example.com", hashed_password="x",
+                    created_at=now, updated_at=now))
+        db.commit()
+    books = BookService(Session(engine))
+    try:
+        for number, isbn in enumerate(isbns):
+            added = books.add_book(user_id, f"Book {number}", "Author", isbn=isbn)
+            assert added["success"], added
+    finally:
+        books.db.close()
+
+
+def user_ids(engine) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(select(User.id)).scalars())
+
+
+def book_count(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Book)).scalar()
+
+
+def test_rebalance_moves_only_users_of_the_new_shard(shards):
+    (a_url, a), (b_url, b) = shards["a"], shards["b"]
+    staying = [user_id_on(0, 0) for _ in range(3)]
+    moving = [user_id_on(0, 1) for _ in range(3)]
+    for user_id in staying + moving:
+        add_user(a, user_id, [f"isbn-{user_id}"])
+
+    engines = {a_url: a, b_url: b}
+    moved = rebalance([a_url], [a_url, b_url], engines)
+    assert (moved["users"], moved["books"], moved["failed"]) == (3, 3, 0)
+    assert moved["collisions"] == []
+    assert user_ids(a) == set(staying) and user_ids(b) == set(moving)
+    assert book_count(a) == 3 and book_count(b) == 3
+
+    again = rebalance([a_url], [a_url, b_url], engines)
+    assert again["users"] == 0
+
+
+def test_incoming_users_with_the_same_isbn_abort_the_whole_run(shards):
+    # Growing from two shards to three: one user of each old shard moves to the new one,
+    # both holding the same ISBN
+    (a_url, a), (b_url, b), (c_url, c) = shards["a"], shards["b"], shards["c"]
+    from_a, from_b = user_id_on(0, 0, 2), user_id_on(0, 1, 2)
+    innocent = user_id_on(0, 0, 2)
+    add_user(a, from_a, ["shared"])
+    add_user(b, from_b, ["shared"])
+    add_user(a, innocent, ["unique"])
+    engines = {a_url: a, b_url: b, c_url: c}
+
+    dry = rebalance([a_url, b_url], [a_url, b_url, c_url], engines, dry_run=True)
+    assert dry["users"] == 3
+    assert [(x["isbn"], x["target"]) for x in dry["collisions"]] == [("shared", c_url)]
+
+    moved = rebalance([a_url, b_url], [a_url, b_url, c_url], engines)
+    assert moved["users"] == 0 and len(moved["collisions"]) == 1
+    # Not even the user without a collision was copied
+    assert user_ids(c) == set() and book_count(c) == 0
+    assert user_ids(a) == {from_a, innocent} and user_ids(b) == {from_b}
+
+
+def test_collision_with_a_book_already_in_the_target(shards):
+    (a_url, a), (b_url, b) = shards["a"], shards["b"]
+    moving = user_id_on(0, 1)
+    add_user(a, moving, ["held"])
+    add_user(b, user_id_on(0, 1), ["held"])
+
+    moved = rebalance([a_url], [a_url, b_url], {a_url: a, b_url: b})
+    assert moved["users"] == 0
+    assert [x["target"] for x in moved["collisions"]] == [b_url]
+    assert user_ids(a) == {moving}
+
+
+def test_leftovers_of_an_interrupted_move_are_not_collisions(shards):
+    (a_url, a), (b_url, b) = shards["a"], shards["b"]
+    moving = user_id_on(0, 1)
+    add_user(a, moving, ["mine"])
+    # A copy committed on the target, but the run died before the source was cleared
+    add_user(b, moving, ["mine"])
+
+    moved = rebalance([a_url], [a_url, b_url], {a_url: a, b_url: b})
+    assert moved["collisions"] == [] and moved["users"] == 1
+    assert user_ids(a) == set() and user_ids(b) == {moving} and book_count(b) == 1
+
+
+def run_main(monkeypatch, shards, sources, targets):
+    monkeypatch.setattr(db_module, "SHARD_URLS", [shards[name][0] for name in sources])
+    monkeypatch.setattr(db_module, "shard_engines",
+                        [shards[name][1] for name in sources])
+    to = ",".join(shards[name][0] for name in targets)
+    sharding.main(["rebalance", "--to", to])
+
+
+def test_main_exits_non_zero_on_a_collision(monkeypatch, shards):
+    add_user(shards["a"][1], user_id_on(0, 1), ["held"])
+    add_user(shards["b"][1], user_id_on(0, 1), ["held"])
+    with pytest.raises(SystemExit) as exited:
+        run_main(monkeypatch, shards, "a", "ab")
+    assert exited.value.code not in (0, None)
+
+
+def test_main_exits_non_zero_when_a_user_fails_to_move(monkeypatch, shards):
+    add_user(shards["a"][1], user_id_on(0, 1), ["isbn"])
+
+    def fail(*args):
+        raise IntegrityError("INSERT", {}, Exception("constraint failed"))
+
+    monkeypatch.setattr(sharding, "_copy_user", fail)
+    with pytest.raises(SystemExit) as exited:
+        run_main(monkeypatch, shards, "a", "ab")
+    assert exited.value.code == 1
+
+
+def test_isbns_are_unique_per_database(shards):
+    # Not across every user: users on different shards may each hold the same ISBN
+    (_, a), (_, b) = shards["a"], shards["b"]
+    first, second, neighbour = user_id_on(0), user_id_on(0), user_id_on(0)
+    add_user(a, first, ["978-0441172719"])
+    add_user(b, second, ["978-0441172719"])
+    add_user(a, neighbour)
+
+    books = BookService(Session(a))
+    try:
+        taken = books.add_book(neighbour, "Dune", "Frank Herbert",
+                               isbn="978-0441172719")
+    finally:
+        books.db.close()
+    assert taken == {"success": False, "message": "Book with ISBN already exists"}
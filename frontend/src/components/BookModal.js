@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Modal, Form, Input, Button, DatePicker, Upload, message } from 'antd';
-import { useCreateBookMutation, useUpdateBookMutation } from '../redux/slices/apiSlice';
+import { coverUrl, useCreateBookMutation, useUpdateBookMutation } from '../redux/slices/apiSlice';
 import { PlusOutlined } from '@ant-design/icons';
 import * as moment from 'moment';
 
@@ -9,6 +9,8 @@ const CreateBookModal = ({ visible, onClose, mode, bookData }) => {
   const [updateBook] = useUpdateBookMutation();
   const [form] = Form.useForm();
   const [imageBase64, setImageBase64] = useState(null);
+  // Cover the book already has; only a newly picked image is sent on save
+  const [currentCover, setCurrentCover] = useState(null);
 
   useEffect(() => {
     if (visible && mode === 'edit' && bookData) {
@@ -19,10 +21,12 @@ const CreateBookModal = ({ visible, onClose, mode, bookData }) => {
         publication_date: bookData.publication_date ? moment(bookData.publication_date) : null,
         isbn: bookData.isbn,
       });
-      setImageBase64(bookData.cover_image || null);
+      setImageBase64(null);
+      setCurrentCover(bookData.cover_id ? coverUrl(bookData.cover_id, 'medium') : bookData.cover_image || null);
     } else if (mode === 'create') {
       form.resetFields();
       setImageBase64(null);
+      setCurrentCover(null);
     }
   }, [visible, mode, bookData, form]);
 
@@ -123,8 +127,8 @@ const CreateBookModal = ({ visible, onClose, mode, bookData }) => {
             showUploadList={false}
             beforeUpload={handleImageUpload}
           >
-            {imageBase64 ? (
-              <img src={imageBase64} alt="Cover" style={{ width: '100%' }} />
+            {imageBase64 || currentCover ? (
+              <img src={imageBase64 || currentCover} alt="Cover" style={{ width: '100%' }} />
             ) : (
               <div>
                 <PlusOutlined />
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Table, Pagination, Button, Space, Popconfirm, message } from 'antd';
-import { useGetBooksQuery, useDeleteBookMutation, useUpdateBookMutation, useCreateBookMutation } from '../redux/slices/apiSlice';
+import { coverUrl, useGetBooksQuery, useDeleteBookMutation, useUpdateBookMutation, useCreateBookMutation } from '../redux/slices/apiSlice';
 import { useSelector } from 'react-redux';
 import { useNavigate } from 'react-router-dom';
 import CreateBookModal from '../components/BookModal';
@@ -90,9 +90,9 @@ const Dashboard = () => {
       title: 'Cover Image',
       key: 'cover_image',
       render: (text, record) => (
-        record.cover_image ? (
+        record.cover_id || record.cover_image ? (
           <img
-            src={record.cover_image}
+            src={record.cover_id ? coverUrl(record.cover_id, 'small') : record.cover_image}
             alt="Cover"
             style={{ width: 50, height: 50, objectFit: 'cover' }}
           />
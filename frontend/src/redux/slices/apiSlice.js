@@ -2,6 +2,9 @@ import { createApi, fetchBaseQuery } from '@reduxjs/toolkit/query/react';
 
 const baseUrl = process.env.REACT_APP_BASE_URL;
 
+// Stored covers are public, immutable URLs; size is 'small', 'medium' or 'original'
+export const coverUrl = (coverId, size = 'small') => `${baseUrl}/covers/${coverId}?size=${size}`;
+
 export const api = createApi({
   reducerPath: 'api',
   baseQuery: fetchBaseQuery({